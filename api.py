@@ -1,28 +1,161 @@
-from flask import Flask, request, jsonify
+from functools import wraps
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import bcrypt
-from pymongo import MongoClient
 from bson import ObjectId
-from dotenv import load_dotenv
+from bson.errors import InvalidId
+from pymongo import UpdateOne
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime,timedelta
-# Load env vars
-load_dotenv()
+from database import LazyDatabase, connect_to_db, for_route, pool_metrics, read_metrics
+import projections
+from attendance_dates import parse_day, start_of_day
+from db_indexes import EXPORT_TTL_SECONDS, ensure_indexes, explain_queries, print_report
+from rfid_checkin import record_rfid_checkin, record_rfid_checkins
+from student_cache import cache_from_env
+from attendance_reconcile import reconcile_attendance
+from face_index import CampusFaceIndex
+from face_matcher import FaceMatcher
+from frame_votes import FrameVotes, embedding_frames
+from image_store import ImageStore, ImageTooLarge, TooManyImages, is_digest
+from marked_dates import MarkedDates
+from attendance_rollups import batch_days, rebuild as rebuild_rollups, shortage_list
+from student_ledger import backfill as backfill_ledger, history_page, history_query, history_summary, student_batch
+from session_results import WriteInProgress, replay_loop, save_session_results
+from rfid_records import VIEWS as RFID_RECORD_VIEWS, decode_cursor, ndjson_lines, read_page
+from export_engine import (
+    HEADER_PROJECTION, XLSX_MIMETYPE, bulk_rows_pipeline, export_attendance_record,
+    stream_file, write_bulk_workbook, write_bulk_zip
+)
+from jobs import JobQueue, QueueFull
+from json_encoding import BSONJSONProvider, dumps as json_dumps
+from password_auth import AuthOverloaded, AuthTimeout, verifier_from_env
+from read_cache import read_cache_from_env
+from recognition_jobs import recognition_queue_from_env
+from tokens import InvalidToken, RevocationList, TokenSigner, bearer_token, signing_keys_from_env
 
 app = Flask(__name__)
+# ObjectId, datetime and Binary are encoded centrally (orjson when installed)
+app.json = BSONJSONProvider(app)
 CORS(app)
 
-# Simple secret key - you can change this to any random string you want
-SECRET_KEY = "attendance-system-secret-key-2024"
+# Signs session tokens; set SECRET_KEY (or TOKEN_SIGNING_KEYS to rotate) in production
+DEFAULT_SECRET_KEY = "attendance-system-secret-key-2024"
+SECRET_KEY = os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY)
 
-def connect_to_db():
-    client = MongoClient(os.getenv("MONGODB_URI"))
-    return client["attendance_system"]
+# Connects lazily, once per worker process (MongoClient is not fork-safe)
+db = LazyDatabase(connect_to_db)
 
-db = connect_to_db()
+# RFID tag -> student lookups are served from memory on the tap path
+student_cache = cache_from_env(db)
+
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def init_worker():
+    """Per-process startup: indexes and caches.
+
+    Runs after fork in each server worker (see gunicorn.conf.py) and, as a
+    fallback, before the first request a process handles.
+    """
+    global _worker_pid
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+    
+    ensure_indexes(db)
+    
+    # Optionally report any route query that would scan a whole collection
+    if os.getenv("EXPLAIN_QUERIES_ON_STARTUP") == "1":
+        print_report(explain_queries(db))
+    
+    student_cache.start()
+    
+    # Memory-map the campus face index; it syncs with the database on first use
+    campus_faces.load()
+    
+    # Finish session-results saves that failed or whose worker crashed
+    threading.Thread(
+        target=replay_loop,
+        args=(db, float(os.getenv("SESSION_RESULTS_REPLAY_SECONDS", "60"))),
+        name="session-results-replay",
+        daemon=True
+    ).start()
+
+@app.before_request
+def ensure_worker_initialised():
+    if _worker_pid != os.getpid():
+        init_worker()
+    # Attribute MongoDB reads on this thread to the route being served
+    read_metrics.set_route(f"{request.method} {request.url_rule.rule}" if request.url_rule else None)
+
+# bcrypt checks run on a bounded pool; repeat requests use signed tokens
+password_verifier = verifier_from_env()
+signing_keys = signing_keys_from_env(SECRET_KEY)
+token_signer = TokenSigner(
+    signing_keys,
+    ttl_seconds=int(os.getenv("TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+)
+revoked_tokens = RevocationList(db, refresh_interval=float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "10")))
+
+# When off, tokens are still read if sent but missing ones are not rejected,
+# so clients that do not send Authorization headers keep working
+AUTH_ENFORCE = os.getenv("AUTH_ENFORCE", "0") == "1"
+
+# The built-in key is public, so anyone could sign an admin token with it
+if any(secret == DEFAULT_SECRET_KEY for _, secret in signing_keys):
+    if AUTH_ENFORCE:
+        raise RuntimeError("AUTH_ENFORCE=1 requires SECRET_KEY or TOKEN_SIGNING_KEYS; refusing to sign tokens with the built-in key")
+    print("⚠️ Signing tokens with the built-in SECRET_KEY; set SECRET_KEY or TOKEN_SIGNING_KEYS before enabling AUTH_ENFORCE")
+
+def current_claims():
+    """Claims of the request's bearer token, or None if absent/invalid"""
+    token = bearer_token(request.headers)
+    if not token:
+        return None
+    try:
+        claims = token_signer.decode(token)
+    except InvalidToken:
+        return None
+    if revoked_tokens.is_revoked(claims["jti"]):
+        return None
+    return claims
+
+def require_auth(*roles):
+    """Authorise a route from the signed token alone, without reading db.users"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            claims = current_claims()
+            g.auth = claims
+            if AUTH_ENFORCE:
+                if claims is None:
+                    return jsonify({"message": "Authentication required"}), 401
+                if roles and claims.get("role") not in roles:
+                    return jsonify({"message": "Not allowed for this role"}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def batch_allowed(batch_id):
+    """Whether the caller's token grants access to ``batch_id``"""
+    claims = g.get("auth")
+    if claims is None:
+        return not AUTH_ENFORCE
+    return claims.get("role") == "admin" or batch_id in claims.get("batches", [])
+
+def user_allowed(username):
+    """Whether the caller's token belongs to ``username`` (or an admin)"""
+    claims = g.get("auth")
+    if claims is None:
+        return not AUTH_ENFORCE
+    return claims.get("role") == "admin" or claims.get("sub") == username
 
 def authenticate_user(db, username, password):
-    user = db.users.find_one({"username": username})
+    user = db.users.find_one({"username": username}, projections.AUTH_USER)
     if not user:
         print("❌ User not found.")
         return False, None
@@ -39,19 +172,25 @@ def authenticate_user(db, username, password):
     else:
         hashed_pw = bytes(stored_hash)  # handles Binary type
     
-    if bcrypt.checkpw(password.encode('utf-8'), hashed_pw):
+    # Raises AuthOverloaded / AuthTimeout under load
+    if password_verifier.verify(password, hashed_pw):
         print("✅ Authentication successful.")
+        if password_verifier.needs_rehash(hashed_pw):
+            # Upgrade the hash to the configured cost without delaying the login
+            password_verifier.rehash_later(
+                password,
+                lambda new_hash: db.users.update_one(
+                    {"_id": user["_id"], "password": user["password"]},
+                    {"$set": {"password": new_hash}}
+                )
+            )
         return True, user
     else:
         print("❌ Incorrect password.")
         return False, None
     
-# Add these imports at the top of api.py
-import pandas as pd
-import io
-from flask import send_file
-
 @app.route("/attendance/export", methods=["GET"])
+@require_auth()
 def export_attendance():
     """Export attendance record as Excel file"""
     date_str = request.args.get("date")
@@ -60,10 +199,12 @@ def export_attendance():
     
     if not date_str or not batch_id:
         return jsonify({"error": "Missing required parameters"}), 400
+    if not batch_allowed(batch_id):
+        return jsonify({"error": "Not allowed for this batch"}), 403
         
     try:
         # Parse the date string
-        target_date = datetime.strptime(date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0)
+        target_date = parse_day(date_str)
         
         # Find the attendance record
         query = {
@@ -73,135 +214,28 @@ def export_attendance():
         
         if course_id:
             query["courseId"] = course_id
-            
-        attendance = db.attendance.find_one(query)
+        
+        # Only the summary fields; student rows are streamed separately
+        attendance_collection = for_route(db, "export").attendance
+        attendance = attendance_collection.find_one(query, HEADER_PROJECTION)
         
         if not attendance:
             return jsonify({"error": "No attendance record found for the specified date and batch"}), 404
-            
-        # Create dataframes for present and absent students
-        present_data = []
-        for student in attendance.get("presentStudents", []):
-            verification_data = student.get("verificationData", {})
-            face_data = verification_data.get("faceRecognition", {})
-            rfid_data = verification_data.get("rfidCheckIn", {})
-            
-            present_data.append({
-                "Roll Number": student.get("rollNo", ""),
-                "Name": student.get("name", ""),
-                "Status": "Present",
-                "Face Recognition": face_data.get("status", False),
-                "RFID Check-in": rfid_data.get("status", False),
-                "Possible Proxy": verification_data.get("possibleProxy", False),
-            })
-            
-        absent_data = []
-        for student in attendance.get("absentStudents", []):
-            verification_data = student.get("verificationData", {})
-            face_data = verification_data.get("faceRecognition", {})
-            rfid_data = verification_data.get("rfidCheckIn", {})
-            
-            absent_data.append({
-                "Roll Number": student.get("rollNo", ""),
-                "Name": student.get("name", ""),
-                "Status": "Absent",
-                "Face Recognition": face_data.get("status", False),
-                "RFID Check-in": rfid_data.get("status", False),
-                "Possible Proxy": verification_data.get("possibleProxy", False),
-            })
-            
-        # Combine data and create a DataFrame
-        all_data = present_data + absent_data
-        df = pd.DataFrame(all_data)
-        
-        # Create an Excel file in memory
-        output = io.BytesIO()
-        
-        # Use ExcelWriter to create a formatted Excel file
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Write the main attendance data
-            df.to_excel(writer, sheet_name='Attendance', index=False)
-            
-            # Access the workbook and the worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['Attendance']
-            
-            # Add a summary sheet with course information
-            summary_data = {
-                'Date': [date_str],
-                'Batch': [batch_id],
-                'Course Name': [attendance.get('courseName', 'N/A')],
-                'Course ID': [attendance.get('courseId', 'N/A')],
-                'Total Students': [len(all_data)],
-                'Present': [attendance.get('totalPresent', len(present_data))],
-                'Absent': [attendance.get('totalAbsent', len(absent_data))],
-                'Faculty Name': [attendance.get('facultyName', 'N/A')],
-                'Faculty ID': [attendance.get('facultyId', 'N/A')]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-            
-            # Access the summary worksheet
-            summary_worksheet = writer.sheets['Summary']
-            
-            # Format the headers in both worksheets
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'top',
-                'fg_color': '#D9D9D9',
-                'border': 1
-            })
-            
-            # Format the attendance data
-            present_format = workbook.add_format({
-                'bg_color': '#E2F0D9',  # Light green
-                'border': 1
-            })
-            
-            absent_format = workbook.add_format({
-                'bg_color': '#FBE5D6',  # Light red/orange
-                'border': 1
-            })
-            
-            # Write the column headers with the header format
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-                
-            # Format rows based on attendance status
-            for row_num, row in enumerate(df.values):
-                status = row[2]  # Status column (0-indexed)
-                row_format = present_format if status == "Present" else absent_format
-                
-                for col_num, value in enumerate(row):
-                    worksheet.write(row_num + 1, col_num, value, row_format)
-                
-            # Format the summary sheet headers
-            for col_num, value in enumerate(summary_df.columns.values):
-                summary_worksheet.write(0, col_num, value, header_format)
-                
-            # Auto-adjust columns' width in both worksheets
-            for i, col in enumerate(df.columns):
-                column_len = max(df[col].astype(str).map(len).max(), len(col) + 2)
-                worksheet.set_column(i, i, column_len)
-                
-            for i, col in enumerate(summary_df.columns):
-                column_len = max(summary_df[col].astype(str).map(len).max(), len(col) + 2)
-                summary_worksheet.set_column(i, i, column_len)
         
-        # Rewind the buffer
-        output.seek(0)
+        path = export_attendance_record(attendance_collection, attendance, date_str, batch_id)
         
         # Generate filename that includes course name
         course_name = attendance.get('courseName', 'Unknown').replace(' ', '_')
         filename = f"attendance_{batch_id}_{course_name}_{date_str}.xlsx"
         
-        # Send the file
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        # Stream the file in chunks; it is deleted once sent
+        return Response(
+            stream_file(path),
+            mimetype=XLSX_MIMETYPE,
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(os.path.getsize(path))
+            }
         )
         
     except Exception as e:
@@ -210,6 +244,167 @@ def export_attendance():
         print(traceback.format_exc())
         return jsonify({"error": f"Error generating Excel report: {str(e)}"}), 500
 
+# Bulk exports run in the background; finished files are kept here
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "aura_exports"))
+EXPORT_MAX_DAYS = int(os.getenv("EXPORT_MAX_DAYS", "366"))
+
+export_jobs = JobQueue(
+    db, "exportJobs",
+    max_workers=int(os.getenv("EXPORT_WORKERS", "2")),
+    max_pending=int(os.getenv("EXPORT_MAX_PENDING", "20")),
+    name="export"
+)
+
+def cleanup_export_files():
+    """Remove finished export files older than EXPORT_TTL_SECONDS"""
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    try:
+        for entry in os.scandir(EXPORT_DIR):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+    except FileNotFoundError:
+        pass
+
+def run_bulk_export(job_id, params, progress):
+    """Export every matching record with one aggregation pipeline"""
+    match = {
+        "date": {"$gte": parse_day(params["startDate"]), "$lte": parse_day(params["endDate"])},
+        "batchId": {"$in": params["batches"]}
+    }
+    if params.get("courseIds"):
+        match["courseId"] = {"$in": params["courseIds"]}
+    if params.get("facultyId"):
+        match["facultyId"] = params["facultyId"]
+    
+    cursor = for_route(db, "export").attendance.aggregate(bulk_rows_pipeline(match), allowDiskUse=True)
+    
+    def report(records):
+        # Throttled so progress updates do not dominate the job
+        if records % 25 == 0:
+            progress(records)
+    
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    base_name = f"attendance_{params['startDate']}_{params['endDate']}"
+    if params["format"] == "zip":
+        path = os.path.join(EXPORT_DIR, f"{job_id}.zip")
+        records = write_bulk_zip(path, cursor, report)
+        filename, mimetype = f"{base_name}.zip", "application/zip"
+    else:
+        path = os.path.join(EXPORT_DIR, f"{job_id}.xlsx")
+        records = write_bulk_workbook(path, cursor, report)
+        filename, mimetype = f"{base_name}.xlsx", XLSX_MIMETYPE
+    
+    progress(records, records)
+    return {"path": path, "filename": filename, "mimetype": mimetype, "records": records}
+
+def export_allowed(job):
+    """Whether the caller may see an export job: its requester, still
+    assigned to every exported batch (or an admin)"""
+    params = job.get("params") or {}
+    return user_allowed(params.get("requestedBy")) and all(batch_allowed(batch) for batch in params.get("batches", []))
+
+def job_status(job):
+    result = job.get("result") or {}
+    status = {
+        "jobId": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "createdAt": job["createdAt"],
+    }
+    if job["status"] == "completed":
+        status["records"] = result.get("records")
+        status["downloadUrl"] = f"/attendance/export/jobs/{job['_id']}/download"
+    if job["status"] == "failed":
+        status["error"] = job.get("error")
+    return status
+
+@app.route("/attendance/export/bulk", methods=["POST"])
+@require_auth()
+def start_bulk_export():
+    """Start a background export over a date range and several batches/courses"""
+    data = request.json or {}
+    start_date = data.get("startDate")
+    end_date = data.get("endDate")
+    batches = data.get("batches") or []
+    course_ids = data.get("courseIds") or []
+    export_format = data.get("format", "workbook")
+    
+    if not start_date or not end_date or not batches:
+        return jsonify({"error": "startDate, endDate and batches are required"}), 400
+    if not all(batch_allowed(batch) for batch in batches):
+        return jsonify({"error": "Not allowed for one or more batches"}), 403
+    if export_format not in ("workbook", "zip"):
+        return jsonify({"error": "format must be 'workbook' or 'zip'"}), 400
+    try:
+        start_day, end_day = parse_day(start_date), parse_day(end_date)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    if end_day < start_day or (end_day - start_day).days >= EXPORT_MAX_DAYS:
+        return jsonify({"error": f"Date range must be between 1 and {EXPORT_MAX_DAYS} days"}), 400
+    
+    params = {
+        "startDate": start_date,
+        "endDate": end_date,
+        "batches": batches,
+        "courseIds": course_ids,
+        "facultyId": data.get("facultyId"),
+        "format": export_format,
+        # Only the requester (or an admin) may read the job and its file
+        "requestedBy": (g.get("auth") or {}).get("sub")
+    }
+    
+    try:
+        cleanup_export_files()
+        job_id = export_jobs.submit("bulk_export", params, run_bulk_export)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    except Exception as e:
+        print(f"Error starting bulk export: {e}")
+        return jsonify({"error": f"Error starting export: {str(e)}"}), 500
+    
+    return jsonify({
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/attendance/export/jobs/{job_id}"
+    }), 202
+
+@app.route("/attendance/export/jobs/<job_id>", methods=["GET"])
+@require_auth()
+def get_bulk_export_status(job_id):
+    """Status and progress of a bulk export job"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Export job not found"}), 404
+    if not export_allowed(job):
+        return jsonify({"error": "Not allowed for this export"}), 403
+    return jsonify(job_status(job)), 200
+
+@app.route("/attendance/export/jobs/<job_id>/download", methods=["GET"])
+@require_auth()
+def download_bulk_export(job_id):
+    """Stream the file produced by a completed bulk export job"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Export job not found"}), 404
+    if not export_allowed(job):
+        return jsonify({"error": "Not allowed for this export"}), 403
+    if job["status"] != "completed":
+        return jsonify(job_status(job)), 409
+    
+    result = job["result"]
+    path = result["path"]
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file has expired"}), 410
+    
+    return Response(
+        stream_file(path, remove=False),
+        mimetype=result["mimetype"],
+        headers={
+            "Content-Disposition": f'attachment; filename="{result["filename"]}"',
+            "Content-Length": str(os.path.getsize(path))
+        }
+    )
+
 @app.route("/auth", methods=["POST"])
 def authenticate():
     data = request.json
@@ -219,206 +414,251 @@ def authenticate():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
     
-    is_authenticated, user = authenticate_user(db, username, password)
+    try:
+        is_authenticated, user = authenticate_user(db, username, password)
+    except AuthOverloaded:
+        return jsonify({"message": "Too many login attempts in progress, please retry"}), 429, {"Retry-After": "2"}
+    except AuthTimeout:
+        return jsonify({"message": "Authentication is temporarily unavailable"}), 503, {"Retry-After": "5"}
     
     if is_authenticated and user:
-        # Return user info without JWT
+        token, claims = token_signer.issue(user)
         return jsonify({
             "username": username,
             "name": user.get("name", username),
             "role": user.get("role", "user"),
-            # A simple token is just the username and timestamp
-            "token": f"{username}_{os.urandom(8).hex()}"
+            # Signed token; present it as "Authorization: Bearer <token>"
+            "token": token,
+            "expiresAt": datetime.fromtimestamp(claims["exp"])
         }), 200
     else:
         return jsonify({"message": "Invalid credentials"}), 401
 
+@app.route("/auth/session", methods=["GET"])
+def get_auth_session():
+    """Validate a token statelessly (signature, expiry, revocation list)"""
+    claims = current_claims()
+    if not claims:
+        return jsonify({"message": "Invalid or expired session"}), 401
+    
+    return jsonify({
+        "username": claims["sub"],
+        "name": claims.get("name"),
+        "role": claims.get("role"),
+        "batches": claims.get("batches", []),
+        "expiresAt": datetime.fromtimestamp(claims["exp"])
+    }), 200
+
+@app.route("/auth/logout", methods=["POST"])
+def logout():
+    """Revoke the presented token on every worker"""
+    claims = current_claims()
+    if not claims:
+        return jsonify({"message": "Valid session token is required"}), 400
+    revoked_tokens.revoke(claims)
+    return jsonify({"message": "Logged out"}), 200
+
+@app.route("/metrics/auth", methods=["GET"])
+@require_auth()
+def get_auth_metrics():
+    """Password verification pool load and rejections"""
+    return jsonify(password_verifier.stats()), 200
+
+# Profiles, schedules and course lists change about once a term
+lookup_cache = read_cache_from_env()
+
+def get_user_profile(username):
+    """Cached user profile (never includes the password hash), or None"""
+    def load():
+        user = db.users.find_one({"username": username}, projections.USER_PROFILE)
+        if user and user.get("assignedCourses"):
+            user["assignedCourses"] = [str(course_id) for course_id in user["assignedCourses"]]
+        return user
+    profile, _ = lookup_cache.get(f"user:{username}", load)
+    return profile
+
+def invalidate_user_cache(username):
+    lookup_cache.invalidate(f"user:{username}", f"schedule:{username}", f"assignedCourses:{username}")
+
+def cached_json(payload, etag):
+    """JSON response carrying an ETag; answers 304 when If-None-Match matches"""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
 @app.route("/schedule/<username>", methods=["GET"])
+@require_auth()
 def get_schedule(username):
-    user = db.users.find_one({"username": username})
-    if not user:
-        return jsonify({"message": "User not found"}), 404
+    if not user_allowed(username):
+        return jsonify({"message": "Not allowed"}), 403
     
-    # Check if schedule exists in user document
-    if "schedule" not in user:
-        return jsonify({"message": "No schedule found for this user", "schedule": {}}), 200
+    def load():
+        user = get_user_profile(username)
+        if not user:
+            return None
+        
+        # Check if schedule exists in user document
+        if "schedule" not in user:
+            return {"message": "No schedule found for this user", "schedule": {}}
+        
+        # Return the schedule with batch information
+        return {"schedule": user.get("schedule", {})}
     
-    # Return the schedule with batch information
-    return jsonify({
-        "schedule": user.get("schedule", {})
-    }), 200
+    payload, etag = lookup_cache.get(f"schedule:{username}", load)
+    if payload is None:
+        return jsonify({"message": "User not found"}), 404
+    return cached_json(payload, etag)
 
 @app.route("/assignedCourses/<username>", methods=["GET"])
+@require_auth()
 def get_assigned_courses(username):
-    user = db.users.find_one({"username": username})
-    if not user:
-        return jsonify({"message": "User not found"}), 404
-    
-    # Get list of assigned course IDs
-    assigned_course_ids = user.get("assignedCourses", [])
-    if not assigned_course_ids:
-        return jsonify({"courses": []}), 200
+    if not user_allowed(username):
+        return jsonify({"message": "Not allowed"}), 403
     
-    # Convert string IDs to ObjectId
-    object_ids = []
-    for course_id in assigned_course_ids:
-        try:
-            if isinstance(course_id, str):
+    def load():
+        user = get_user_profile(username)
+        if not user:
+            return None
+        
+        # Get list of assigned course IDs
+        assigned_course_ids = user.get("assignedCourses", [])
+        if not assigned_course_ids:
+            return {"courses": []}
+        
+        # Convert string IDs to ObjectId
+        object_ids = []
+        for course_id in assigned_course_ids:
+            try:
                 object_ids.append(ObjectId(course_id))
-            else:
-                object_ids.append(course_id)
-        except Exception as e:
-            print(f"Error converting ID {course_id}: {e}")
-    
-    # Fetch course details from the courses collection
-    courses = list(db.courses.find({"_id": {"$in": object_ids}}))
-    
-    # Convert ObjectId to string for JSON serialization
-    courses_data = []
-    for course in courses:
-        course_data = {
-            "id": str(course["_id"]),
-            "courseName": course.get("courseName", ""),
-            "courseCode": course.get("courseCode", "")
-        }
-        courses_data.append(course_data)
+            except Exception as e:
+                print(f"Error converting ID {course_id}: {e}")
+        
+        # Fetch course details from the courses collection
+        courses = db.courses.find({"_id": {"$in": object_ids}}, projections.COURSE_SUMMARY)
+        
+        # Plain string ids keep the cached payload the same in every backend
+        courses_data = []
+        for course in courses:
+            course_data = {
+                "id": str(course["_id"]),
+                "courseName": course.get("courseName", ""),
+                "courseCode": course.get("courseCode", "")
+            }
+            courses_data.append(course_data)
+        
+        return {"courses": courses_data}
     
-    return jsonify({"courses": courses_data}), 200
+    payload, etag = lookup_cache.get(f"assignedCourses:{username}", load)
+    if payload is None:
+        return jsonify({"message": "User not found"}), 404
+    return cached_json(payload, etag)
+
+@app.route("/cache/invalidate", methods=["POST"])
+@require_auth("admin")
+def invalidate_lookup_cache():
+    """Drop cached profiles/schedules/courses after an admin edit"""
+    data = request.json or {}
+    if data.get("all"):
+        lookup_cache.clear()
+    for username in data.get("usernames", []):
+        invalidate_user_cache(username)
+    return jsonify({"message": "Cache invalidated"}), 200
+
+@app.route("/metrics/cache", methods=["GET"])
+@require_auth()
+def get_lookup_cache_metrics():
+    """Hit/miss counters for the profile/schedule/course cache"""
+    return jsonify(lookup_cache.stats()), 200
 
 
 #---------------------------------------------------------------------------------------
 @app.route("/attendance/sessions/<session_id>/results", methods=["POST"])
+@require_auth()
 def update_attendance_session_results(session_id):
-    """Update an attendance session with results"""
+    """Update an attendance session with results.
+
+    Send an ``Idempotency-Key`` header to make retries safe: a repeated
+    key returns the first response without writing again.
+    """
     data = request.json
+    idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotencyKey")
     
-    # Extract the data
-    present_students = data.get("presentStudents", [])
-    absent_students = data.get("absentStudents", [])
-    verification_data = data.get("verificationData", {})
+    # Authorise against the stored session, not the batch in the body
+    try:
+        session = db.attendanceSessions.find_one({"_id": ObjectId(session_id)}, projections.SESSION_BATCH)
+    except InvalidId:
+        return jsonify({"error": "Invalid session id"}), 400
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+    if not batch_allowed(session.get("batchId")):
+        return jsonify({"error": "Not allowed for this batch"}), 403
+    if data.get("batchId") is None:
+        data = dict(data, batchId=session.get("batchId"))
+    elif data["batchId"] != session.get("batchId"):
+        return jsonify({"error": "batchId does not match the session"}), 400
     
     try:
-        # Update the session document with the results
-        db.attendanceSessions.update_one(
-            {"_id": ObjectId(session_id)},
-            {
-                "$set": {
-                    "status": "completed",
-                    "presentStudents": present_students,
-                    "absentStudents": absent_students,
-                    "totalPresent": len(present_students),
-                    "totalAbsent": len(absent_students),
-                    "verificationData": verification_data,  # Save verification data
-                    "completedAt": datetime.now()
-                }
-            }
-        )
-        
-        # Create or update attendance record for this date, batch and course
-        attendance_record = {
-            "date": datetime.strptime(data.get("date"), "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0),
-            "batchId": data.get("batchId"),
-            "courseId": data.get("courseId"),
-            "courseName": data.get("courseName"),
-            "facultyId": data.get("facultyId"),
-            "facultyName": data.get("facultyName"),
-            "presentStudents": present_students,
-            "absentStudents": absent_students,
-            "totalPresent": len(present_students),
-            "totalAbsent": len(absent_students),
-            "verificationData": verification_data,  # Save verification data
-            "updatedAt": datetime.now()
-        }
-        
-        # Check if record exists for this date, batch and course
-        existing_record = db.attendance.find_one({
-            "date": attendance_record["date"],
-            "batchId": attendance_record["batchId"],
-            "courseId": attendance_record["courseId"]
-        })
-        
-        if existing_record:
-            # Update existing record
-            db.attendance.update_one(
-                {"_id": existing_record["_id"]},
-                {"$set": attendance_record}
-            )
-        else:
-            # Insert new record
-            attendance_record["createdAt"] = datetime.now()
-            db.attendance.insert_one(attendance_record)
-            
-        return jsonify({
-            "message": "Attendance updated successfully",
-            "sessionId": session_id
-        }), 200
-        
+        response, replayed = save_session_results(db, session_id, data, idempotency_key)
+    except WriteInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    except InvalidId:
+        return jsonify({"error": "Invalid session id"}), 400
     except Exception as e:
         print(f"Error updating attendance session: {e}")
         return jsonify({"error": f"Failed to update attendance: {str(e)}"}), 500
+    
+    if not replayed:
+        marked_dates.invalidate(
+            data.get("batchId"), parse_day(data.get("date")),
+            data.get("courseId"), data.get("facultyId")
+        )
+    
+    result = jsonify(response)
+    if replayed:
+        result.headers["Idempotent-Replayed"] = "true"
+    return result, 200
+
+# Distinct marked days per (batch, course, faculty, month), memoised per worker
+marked_dates = MarkedDates(db, ttl=float(os.getenv("MARKED_DATES_TTL_SECONDS", "60")))
 
 @app.route("/attendance/marked-dates", methods=["GET"])
+@require_auth()
 def get_marked_attendance_dates():
-    """Get dates where attendance records exist for a specific batch, course, and faculty"""
+    """Get dates where attendance records exist for a specific batch, course, and faculty.
+
+    ``month=YYYY-MM`` limits the result to the month the calendar shows.
+    """
     batch = request.args.get("batch", "A")
     course_id = request.args.get("courseId")  # Parameter for filtering by course
     faculty_id = request.args.get("facultyId")  # New parameter for filtering by faculty
+    month = request.args.get("month")
+    if not batch_allowed(batch):
+        return jsonify({"message": "Not allowed for this batch"}), 403
     
     try:
-        # Build the query based on provided parameters
-        query = {"batchId": batch}  # Using batchId based on your DB schema shown earlier
-        
-        # Add course filter if provided
-        if course_id:
-            query["courseId"] = course_id
-            
-        # Add faculty filter if provided
-        if faculty_id:
-            query["facultyId"] = faculty_id
-        
-        # Find all attendance records for this batch, course, and faculty
-        attendance_records = db.attendance.find(query, {"date": 1})
-        
-        # RFID query should also include faculty if available
-        rfid_query = {"batch": batch}
-        if faculty_id:
-            rfid_query["facultyId"] = faculty_id
-            
-        # For RFID records, we might not have courseId
-        rfid_records = db.rfid_attendance.find(rfid_query, {"date": 1})
-        
-        marked_dates = set()  # Use a set to avoid duplicates
-        
-        # Process regular attendance records
-        for record in attendance_records:
-            if "date" in record and record["date"]:
-                date_str = record["date"].strftime("%Y-%m-%d")
-                marked_dates.add(date_str)
-        
-        # Process RFID attendance records (only if courseId not specified)
-        if not course_id:
-            for record in rfid_records:
-                if "date" in record and record["date"]:
-                    date_str = record["date"].strftime("%Y-%m-%d")
-                    marked_dates.add(date_str)
-        
-        return jsonify({
-            "batch": batch,
-            "courseId": course_id,
-            "facultyId": faculty_id,  # Include faculty ID in response for debugging
-            "markedDates": list(marked_dates)
-        }), 200
-        
+        dates, etag = marked_dates.get(batch, course_id, faculty_id, month)
+    except ValueError:
+        return jsonify({"message": "Invalid month format. Use YYYY-MM"}), 400
     except Exception as e:
         print(f"Error retrieving marked attendance dates: {e}")
         return jsonify({"message": f"Error retrieving marked dates: {str(e)}"}), 500
     
+    return cached_json({
+        "batch": batch,
+        "courseId": course_id,
+        "facultyId": faculty_id,  # Include faculty ID in response for debugging
+        "month": month,
+        "markedDates": dates
+    }, etag)
+    
 @app.route("/attendance/sessions", methods=["POST"])
+@require_auth()
 def create_attendance_session():
     """Create a new attendance session"""
     try:
         # Get the first professor from the database
-        professor = db.users.find_one({"role": "professor"})
+        professor = db.users.find_one({"role": "professor"}, projections.SESSION_FACULTY)
         if not professor:
             return jsonify({"message": "No professor found in database"}), 404
             
@@ -427,13 +667,15 @@ def create_attendance_session():
             return jsonify({"message": "Professor has no assigned batches"}), 400
             
         batch_id = professor["assignedBatches"][0]
+        if not batch_allowed(batch_id):
+            return jsonify({"message": "Not allowed for this batch"}), 403
         
         # Get course from assignedCourses or find one
         if professor.get("assignedCourses") and len(professor["assignedCourses"]) > 0:
             course_id = professor["assignedCourses"][0]
         else:
             # Find a course that has this batch assigned
-            course = db.courses.find_one({"assignedBatches": batch_id})
+            course = db.courses.find_one({"assignedBatches": batch_id}, projections.ID_ONLY)
             if not course:
                 return jsonify({"message": "No course found for this batch"}), 404
             course_id = course["_id"]
@@ -456,13 +698,135 @@ def create_attendance_session():
         
         return jsonify({
             "message": "Attendance session created",
-            "sessionId": str(result.inserted_id)
+            "sessionId": result.inserted_id
         }), 201
         
     except Exception as e:
         print(f"Error creating attendance session: {e}")
         return jsonify({"message": f"Error creating session: {str(e)}"}), 500
 
+# Captured frames, stored once per content hash
+image_store = ImageStore(thumbnail_workers=int(os.getenv("THUMBNAIL_WORKERS", "1")))
+
+def image_reference(entry):
+    """A capturedImages entry with the URLs it is served from"""
+    url = f"/images/{entry['sha256']}"
+    return dict(entry, url=url, thumbnailUrl=f"{url}?thumbnail=1")
+
+@app.route("/attendance/sessions/<session_id>/images", methods=["POST"])
+@require_auth()
+def upload_session_images(session_id):
+    """Store classroom frames for a session (multipart ``images`` parts or a raw image body).
+
+    Frames are streamed to disk as they arrive and stored once per content
+    hash; a frame already attached to the session is not added again.
+    """
+    try:
+        session = db.attendanceSessions.find_one({"_id": ObjectId(session_id)}, projections.SESSION_BATCH)
+    except InvalidId:
+        return jsonify({"message": "Invalid session id"}), 400
+    if not session:
+        return jsonify({"message": "Session not found"}), 404
+    if not batch_allowed(session.get("batchId")):
+        return jsonify({"message": "Not allowed for this batch"}), 403
+    
+    try:
+        if request.mimetype == "multipart/form-data":
+            references = image_store.receive_multipart(
+                request.stream, request.mimetype, request.content_length, request.mimetype_params,
+                max_form_parts=request.max_form_parts,
+                max_form_memory_size=request.max_form_memory_size
+            )
+        elif request.mimetype.startswith("image/"):
+            references = [image_store.save_stream(request.stream, request.mimetype)]
+        else:
+            return jsonify({"message": "Send images as multipart/form-data or an image/* body"}), 415
+    except (ImageTooLarge, TooManyImages) as e:
+        return jsonify({"message": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"message": f"Malformed upload: {e}"}), 400
+    if not references:
+        return jsonify({"message": "No images in the upload"}), 400
+    
+    now = datetime.now()
+    operations = []
+    for reference in references:
+        entry = {
+            "sha256": reference["sha256"],
+            "size": reference["size"],
+            "contentType": reference["contentType"],
+            "uploadedAt": now
+        }
+        # The filter skips frames the session already references
+        operations.append(UpdateOne(
+            {"_id": session["_id"], "capturedImages.sha256": {"$ne": entry["sha256"]}},
+            {"$push": {"capturedImages": entry}, "$set": {"updatedAt": now}}
+        ))
+    result = db.attendanceSessions.bulk_write(operations, ordered=True)
+    
+    return jsonify({
+        "sessionId": session_id,
+        "images": [image_reference(reference) for reference in references],
+        "added": result.modified_count
+    }), 201
+
+@app.route("/attendance/sessions/<session_id>/images", methods=["GET"])
+@require_auth()
+def list_session_images(session_id):
+    """Frames stored for a session, oldest first"""
+    try:
+        session = db.attendanceSessions.find_one({"_id": ObjectId(session_id)}, projections.SESSION_IMAGES)
+    except InvalidId:
+        return jsonify({"message": "Invalid session id"}), 400
+    if not session:
+        return jsonify({"message": "Session not found"}), 404
+    if not batch_allowed(session.get("batchId")):
+        return jsonify({"message": "Not allowed for this batch"}), 403
+    images = [image_reference(entry) for entry in session.get("capturedImages") or []]
+    return jsonify({"sessionId": session_id, "images": images}), 200
+
+def image_allowed(digest):
+    """Whether a session of one of the caller's batches references the frame"""
+    claims = g.get("auth")
+    if claims is None:
+        return not AUTH_ENFORCE
+    if claims.get("role") == "admin":
+        return True
+    return db.attendanceSessions.find_one(
+        {"capturedImages.sha256": digest, "batchId": {"$in": claims.get("batches", [])}},
+        projections.ID_ONLY
+    ) is not None
+
+@app.route("/images/<digest>", methods=["GET"])
+@require_auth()
+def get_image(digest):
+    """A stored frame (or its thumbnail with ``?thumbnail=1``); content never changes.
+
+    Served only to callers assigned to the batch of a session that
+    captured it (admins see every frame).
+    """
+    if not is_digest(digest):
+        return jsonify({"message": "Not found"}), 404
+    if not image_allowed(digest):
+        return jsonify({"message": "Not found"}), 404
+    if request.args.get("thumbnail") == "1":
+        path, mimetype = image_store.thumbnail_path(digest), "image/jpeg"
+    else:
+        path, mimetype = image_store.path(digest), None
+    if not os.path.exists(path):
+        return jsonify({"message": "Not found"}), 404
+    mimetype = mimetype or image_store.content_type(digest)
+    response = send_file(os.path.abspath(path), mimetype=mimetype, etag=digest, conditional=True, max_age=31536000)
+    response.cache_control.immutable = True
+    response.cache_control.private = True
+    return response
+
+@app.route("/metrics/images", methods=["GET"])
+@require_auth()
+def get_image_store_stats():
+    """Frames stored, duplicates skipped and thumbnails made by this worker"""
+    return jsonify(image_store.stats()), 200
+
 # @app.route("/rfid/attendance", methods=["POST"])
 # def process_rfid_attendance():
 #     """Process RFID scan for attendance"""
@@ -676,15 +1040,14 @@ def process_rfid_attendance():
     if date_str:
         try:
             # Parse provided date
-            manual_date = datetime.strptime(date_str, "%Y-%m-%d")
-            today_date = manual_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            today_date = parse_day(date_str)
             today_str = date_str
         except ValueError:
             return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
     else:
         # Use current date if none provided
         today_str = datetime.now().strftime("%Y-%m-%d")
-        today_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_date = start_of_day(datetime.now())
     
     current_time = datetime.now()
     
@@ -693,122 +1056,13 @@ def process_rfid_attendance():
     
     try:
         # Find the student by RFID tag
-        student = db.students.find_one({"rfidTag": rfid_tag})
+        student = student_cache.lookup(rfid_tag)
         if not student:
             return jsonify({"message": "No student found with this RFID tag"}), 404
         
-        student_id_str = str(student["_id"])
-        
-        # Student data to record
-        student_record = {
-            "studentId": student_id_str,
-            "rfidTag": rfid_tag,
-            "name": student.get("name", ""),
-            "rollNo": student.get("rollNo", ""),
-            "timestamp": current_time,
-            "attendance_status": "present"
-        }
-        
-        # Find or create a document for this date and batch
-        rfid_day_record = db.rfid_attendance.find_one({
-            "date": today_date,
-            "batch": batch
-        })
-        
-        if not rfid_day_record:
-            # Create a new document for this date and batch
-            rfid_day_record = {
-                "date": today_date,
-                "batch": batch,
-                "students": [student_record],
-                "createdAt": current_time,
-                "updatedAt": current_time
-            }
-            db.rfid_attendance.insert_one(rfid_day_record)
-        else:
-            # Check if student already marked for today
-            student_exists = False
-            for existing_student in rfid_day_record.get("students", []):
-                if existing_student.get("studentId") == student_id_str:
-                    student_exists = True
-                    break
-            
-            if not student_exists:
-                # Add this student to the existing document
-                db.rfid_attendance.update_one(
-                    {"_id": rfid_day_record["_id"]},
-                    {
-                        "$push": {"students": student_record},
-                        "$set": {"updatedAt": current_time}
-                    }
-                )
-            else:
-                # Update the existing student record
-                db.rfid_attendance.update_one(
-                    {
-                        "_id": rfid_day_record["_id"],
-                        "students.studentId": student_id_str
-                    },
-                    {
-                        "$set": {
-                            "students.$.timestamp": current_time,
-                            "updatedAt": current_time
-                        }
-                    }
-                )
-        
-        # Also update the regular attendance record for compatibility
-        daily_record = db.attendance.find_one({
-            "date": today_date,
-            "type": "daily",
-            "batch": batch
-        })
-        
-        if not daily_record:
-            # Create a new daily attendance record with this student
-            daily_record = {
-                "date": today_date,
-                "type": "daily",
-                "batch": batch,
-                "students": {
-                    student_id_str: {
-                        "id": student_id_str,
-                        "name": student.get("name", ""),
-                        "rollNo": student.get("rollNo", ""),
-                        "rfidCheckIn": {
-                            "timestamp": current_time,
-                            "status": True
-                        },
-                        "isPresent": True
-                    }
-                },
-                "createdAt": current_time,
-                "updatedAt": current_time
-            }
-            db.attendance.insert_one(daily_record)
-        else:
-            # Update existing record
-            students_data = daily_record.get("students", {})
-            students_data[student_id_str] = {
-                "id": student_id_str,
-                "name": student.get("name", ""),
-                "rollNo": student.get("rollNo", ""),
-                "rfidCheckIn": {
-                    "timestamp": current_time,
-                    "status": True
-                },
-                "isPresent": True
-            }
-            
-            db.attendance.update_one(
-                {"_id": daily_record["_id"]},
-                {
-                    "$set": {
-                        "students": students_data,
-                        "updatedAt": current_time
-                    }
-                }
-            )
+        # Both writes are single atomic upserts; no read-modify-write
+        student_id_str = record_rfid_checkin(db, student, rfid_tag, batch, today_date, current_time)
+        marked_dates.invalidate(batch, today_date)
         
         return jsonify({
             "message": "Attendance recorded successfully",
@@ -820,7 +1074,7 @@ def process_rfid_attendance():
             "batch": batch,
             "date": today_str,
             "manual_entry": date_str is not None,
-            "timestamp": current_time.isoformat()
+            "timestamp": current_time
         }), 200
         
     except Exception as e:
@@ -828,11 +1082,148 @@ def process_rfid_attendance():
         return jsonify({"message": f"Error processing attendance: {str(e)}"}), 500
     
 
+# Upper bound on events per gateway batch, to keep a single request bounded
+RFID_BATCH_MAX_EVENTS = int(os.getenv("RFID_BATCH_MAX_EVENTS", "2000"))
+
+def parse_tap_timestamp(value):
+    """Parse a gateway timestamp (ISO-8601 string or epoch seconds) to local naive time"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+@app.route("/rfid/attendance/batch", methods=["POST"])
+def process_rfid_attendance_batch():
+    """Process a buffered batch of RFID taps from a reader gateway.
+
+    Safe to resend: each event is applied idempotently, so replaying a
+    batch after a network drop leaves the records unchanged.
+    """
+    data = request.json or {}
+    events = data.get("events")
+    
+    if not isinstance(events, list) or not events:
+        return jsonify({"message": "A non-empty list of events is required"}), 400
+    if len(events) > RFID_BATCH_MAX_EVENTS:
+        return jsonify({"message": f"At most {RFID_BATCH_MAX_EVENTS} events per batch"}), 413
+    
+    current_time = datetime.now()
+    results = [None] * len(events)
+    parsed_events = []
+    
+    # Validate every event up front; bad events are reported, not fatal
+    for index, event in enumerate(events):
+        if not isinstance(event, dict) or not event.get("rfid_tag"):
+            results[index] = {"index": index, "status": "invalid", "message": "RFID tag is required"}
+            continue
+        try:
+            timestamp = parse_tap_timestamp(event.get("timestamp")) or current_time
+            day = parse_day(event["date"]) if event.get("date") else start_of_day(timestamp)
+        except (TypeError, ValueError, OverflowError, OSError):
+            results[index] = {"index": index, "status": "invalid",
+                              "message": "Invalid date or timestamp. Use YYYY-MM-DD and ISO-8601"}
+            continue
+        parsed_events.append((index, event["rfid_tag"], event.get("batch", "A"), day, timestamp))
+    
+    try:
+        # Resolve every tag at once: cache hits plus a single $in for the rest
+        students = student_cache.lookup_many([tag for _, tag, _, _, _ in parsed_events])
+        
+        groups = {}
+        for index, rfid_tag, batch, day, timestamp in parsed_events:
+            student = students.get(rfid_tag)
+            if not student:
+                results[index] = {"index": index, "status": "unknown_tag",
+                                  "message": "No student found with this RFID tag"}
+                continue
+            groups.setdefault((day, batch), []).append((index, student, rfid_tag, timestamp))
+    except Exception as e:
+        print(f"Error resolving RFID batch: {e}")
+        return jsonify({"message": f"Error processing attendance: {str(e)}"}), 500
+    
+    for (day, batch), group in groups.items():
+        try:
+            record_rfid_checkins(
+                db, batch, day,
+                [(student, rfid_tag, timestamp) for _, student, rfid_tag, timestamp in group],
+                current_time
+            )
+            marked_dates.invalidate(batch, day)
+            status, message = "recorded", None
+        except Exception as e:
+            print(f"Error processing RFID batch group {day:%Y-%m-%d}/{batch}: {e}")
+            status, message = "error", str(e)
+        
+        for index, student, rfid_tag, timestamp in group:
+            result = {
+                "index": index,
+                "status": status,
+                "student": {
+                    "id": student["_id"],
+                    "name": student.get("name", ""),
+                    "rollNo": student.get("rollNo", "")
+                },
+                "batch": batch,
+                "date": day.strftime("%Y-%m-%d"),
+                "timestamp": timestamp
+            }
+            if message:
+                result["message"] = message
+            results[index] = result
+    
+    return jsonify({
+        "received": len(events),
+        "recorded": sum(1 for r in results if r["status"] == "recorded"),
+        "results": results
+    }), 200
+
+@app.route("/rfid/cache/stats", methods=["GET"])
+@require_auth()
+def get_rfid_cache_stats():
+    """Hit/miss counters for the RFID tag lookup cache"""
+    return jsonify(student_cache.stats()), 200
+
+@app.route("/metrics/db-pool", methods=["GET"])
+@require_auth()
+def get_db_pool_metrics():
+    """Connection pool checkout wait times, for sizing MONGO_MAX_POOL_SIZE"""
+    return jsonify(pool_metrics.snapshot()), 200
+
+@app.route("/metrics/db-reads", methods=["GET"])
+@require_auth()
+def get_db_read_metrics():
+    """Bytes and documents read from MongoDB per route (MONGO_READ_METRICS=1)"""
+    return jsonify(read_metrics.snapshot()), 200
+
+# Page sizes for /rfid/records (rows per JSON page)
+RFID_RECORDS_DEFAULT_LIMIT = int(os.getenv("RFID_RECORDS_DEFAULT_LIMIT", "100"))
+RFID_RECORDS_MAX_LIMIT = int(os.getenv("RFID_RECORDS_MAX_LIMIT", "1000"))
+
 @app.route("/rfid/records", methods=["GET"])
+@require_auth()
 def get_rfid_records():
-    """Get RFID attendance records with optional date filtering"""
+    """Get RFID attendance records with optional date filtering.
+
+    Newest first, paged with ``after=<nextCursor>`` and ``limit``.
+    ``view=flat`` returns one row per student tap instead of one record
+    per day; ``format=ndjson`` streams rows as they are read (without a
+    limit it streams everything that matches).
+    """
     date_str = request.args.get("date")
     batch = request.args.get("batch")
+    view = request.args.get("view", "daily")
+    output_format = request.args.get("format", "json")
+    
+    if view not in RFID_RECORD_VIEWS:
+        return jsonify({"message": f"view must be one of {', '.join(RFID_RECORD_VIEWS)}"}), 400
+    # Records of every batch (no batch) are for admins only
+    if not batch_allowed(batch):
+        message = "Not allowed for this batch" if batch else "batch is required for non-admin users"
+        return jsonify({"message": message}), 403
     
     query = {}
     
@@ -855,55 +1246,42 @@ def get_rfid_records():
         query["batch"] = batch
     
     try:
-        records = list(db.rfid_attendance.find(query))
-        
-        # Process records for JSON serialization
-        result = []
-        for record in records:
-            # Convert ObjectId to string
-            record["_id"] = str(record["_id"])
-            
-            # Convert datetime objects to strings
-            if "date" in record:
-                record["date"] = record["date"].strftime("%Y-%m-%d")
-            if "createdAt" in record:
-                record["createdAt"] = record["createdAt"].isoformat()
-            if "updatedAt" in record:
-                record["updatedAt"] = record["updatedAt"].isoformat()
-                
-            # Format timestamps for each student
-            students = record.get("students", [])
-            for student in students:
-                if "timestamp" in student:
-                    student["timestamp"] = student["timestamp"].isoformat()
-            
-            result.append(record)
-        
-        # Get a flattened list of all students for compatibility with previous format
-        flat_students = []
-        for record in result:
-            date = record.get("date")
-            batch = record.get("batch")
-            for student in record.get("students", []):
-                student_copy = student.copy()
-                student_copy["date"] = date
-                student_copy["batch"] = batch
-                flat_students.append(student_copy)
-        
-        return jsonify({
-            "count": len(flat_students),
-            "records": flat_students,
-            "daily_records": result
-        }), 200
+        after = decode_cursor(request.args["after"]) if request.args.get("after") else None
+        limit = request.args.get("limit", type=int)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    
+    collection = for_route(db, "rfid_records").rfid_attendance
+    
+    if output_format == "ndjson":
+        return Response(
+            ndjson_lines(collection, query, view, after, limit),
+            mimetype="application/x-ndjson"
+        )
+    
+    limit = min(limit or RFID_RECORDS_DEFAULT_LIMIT, RFID_RECORDS_MAX_LIMIT)
+    try:
+        rows, next_cursor = read_page(collection, query, view, after, limit)
     except Exception as e:
         return jsonify({"message": f"Error retrieving RFID records: {str(e)}"}), 500
+    
+    return jsonify({
+        "count": len(rows),
+        "records" if view == "flat" else "daily_records": rows,
+        "nextCursor": next_cursor
+    }), 200
 
 #--------------------------------------------------------------------------------
 @app.route("/attendance/daily", methods=["GET"])
+@require_auth()
 def get_daily_attendance():
     """Get attendance record for a specific date and batch"""
     date_str = request.args.get("date", datetime.now().strftime("%Y-%m-%d"))
     batch = request.args.get("batch", "A")
+    if not batch_allowed(batch):
+        return jsonify({"message": "Not allowed for this batch"}), 403
     
     try:
         # Convert string date to datetime object for query
@@ -923,9 +1301,7 @@ def get_daily_attendance():
                 "students": {}
             }), 404
         
-        # Convert ObjectId to string for JSON serialization
-        daily_record["_id"] = str(daily_record["_id"])
-        daily_record["date"] = date_str  # Convert datetime to string for response
+        daily_record["date"] = date_str  # Day string rather than midnight timestamp
         
         return jsonify(daily_record), 200
         
@@ -933,17 +1309,42 @@ def get_daily_attendance():
         print(f"Error retrieving daily attendance: {e}")
         return jsonify({"message": f"Error retrieving attendance: {str(e)}"}), 500
 
+# One-off data jobs (backfills, rebuilds) run one at a time in the background
+maintenance_jobs = JobQueue(db, "maintenanceJobs", max_workers=1, max_pending=4, name="maintenance")
+
+# Page sizes for /attendance/student/<id> (rows per page)
+STUDENT_HISTORY_DEFAULT_LIMIT = int(os.getenv("STUDENT_HISTORY_DEFAULT_LIMIT", "100"))
+STUDENT_HISTORY_MAX_LIMIT = int(os.getenv("STUDENT_HISTORY_MAX_LIMIT", "1000"))
+
 @app.route("/attendance/student/<student_id>", methods=["GET"])
+@require_auth()
 def get_student_attendance(student_id):
-    """Get attendance records for a specific student across dates"""
+    """Get attendance records for a specific student across dates.
+
+    Reads the per-student ledger: daily RFID attendance by default, or one
+    course's sessions with ``courseId``. ``from``/``to`` (YYYY-MM-DD) bound
+    the range, ``limit`` and ``before=<nextCursor>`` page through it, and
+    ``summary`` covers the whole range.
+    """
+    course_id = request.args.get("courseId")
+    if not batch_allowed(student_batch(db, student_id)):
+        return jsonify({"message": "Not allowed for this student's batch"}), 403
     try:
-        # Find all attendance records that include this student
-        attendance_records = list(db.attendance.find({
-            "type": "daily",
-            f"students.{student_id}": {"$exists": True}
-        }).sort("date", -1))
+        start = parse_day(request.args["from"]) if request.args.get("from") else None
+        end = parse_day(request.args["to"]) if request.args.get("to") else None
+        before = parse_day(request.args["before"]) if request.args.get("before") else None
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    limit = request.args.get("limit", STUDENT_HISTORY_DEFAULT_LIMIT, type=int)
+    if limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    limit = min(limit, STUDENT_HISTORY_MAX_LIMIT)
+    
+    try:
+        query = history_query(student_id, course_id, start, end)
+        rows, next_cursor = history_page(db, query, before, limit)
         
-        if not attendance_records:
+        if not rows and before is None:
             return jsonify({
                 "message": f"No attendance records found for student {student_id}",
                 "studentId": student_id,
@@ -952,26 +1353,279 @@ def get_student_attendance(student_id):
         
         # Format the records for response
         formatted_records = []
-        for record in attendance_records:
-            formatted_records.append({
-                "date": record["date"].strftime("%Y-%m-%d"),
-                "batch": record["batch"],
-                "status": record["students"][student_id]["isPresent"],
-                "checkInTime": record["students"][student_id].get("rfidCheckIn", {}).get("timestamp")
-            })
+        for row in rows:
+            record = {
+                "date": row["date"].strftime("%Y-%m-%d"),
+                "batch": row.get("batch"),
+                "status": row.get("present", False),
+                "checkInTime": row.get("checkInTime")
+            }
+            if row.get("courseId"):
+                record["courseId"] = row["courseId"]
+                record["courseName"] = row.get("courseName")
+            formatted_records.append(record)
         
         return jsonify({
             "studentId": student_id,
-            "records": formatted_records
+            "courseId": course_id,
+            "records": formatted_records,
+            "nextCursor": next_cursor,
+            "summary": history_summary(db, student_id, course_id, start, end)
         }), 200
         
     except Exception as e:
         print(f"Error retrieving student attendance: {e}")
         return jsonify({"message": f"Error retrieving attendance: {str(e)}"}), 500
 
+@app.route("/attendance/student-ledger/backfill", methods=["POST"])
+@require_auth("admin")
+def start_ledger_backfill():
+    """Copy existing attendance history into the per-student ledger"""
+    try:
+        job_id = maintenance_jobs.submit(
+            "ledger_backfill", {},
+            lambda job_id, params, progress: {"rows": backfill_ledger(db, progress=progress)}
+        )
+    except QueueFull as e:
+        return jsonify({"message": str(e)}), 429
+    return jsonify({"jobId": job_id, "statusUrl": f"/maintenance/jobs/{job_id}"}), 202
+
+@app.route("/reports/summary", methods=["GET"])
+@require_auth()
+def get_report_summary():
+    """Attendance shortages and per-day totals, served from the rollups.
+
+    ``threshold`` (percent, default 75) and ``minSessions`` filter the
+    shortage list; ``batch`` with ``from``/``to`` adds the daily series.
+    Without ``batch`` the list covers the whole campus, for admins only.
+    """
+    batch = request.args.get("batch")
+    course_id = request.args.get("courseId")
+    threshold = request.args.get("threshold", 75.0, type=float)
+    min_sessions = request.args.get("minSessions", 1, type=int)
+    # The campus-wide list (no batch) is for admins only
+    if not batch_allowed(batch):
+        message = "Not allowed for this batch" if batch else "batch is required for non-admin users"
+        return jsonify({"message": message}), 403
+    try:
+        start = parse_day(request.args["from"]) if request.args.get("from") else None
+        end = parse_day(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    try:
+        shortages = shortage_list(db, batch, course_id, threshold, min_sessions)
+        days = batch_days(db, batch, start, end) if batch else []
+    except Exception as e:
+        print(f"Error building report summary: {e}")
+        return jsonify({"message": f"Error building report: {str(e)}"}), 500
+    
+    for day in days:
+        day["date"] = day["date"].strftime("%Y-%m-%d")
+    
+    return jsonify({
+        "batch": batch,
+        "courseId": course_id,
+        "threshold": threshold,
+        "shortages": shortages,
+        "days": days
+    }), 200
+
+@app.route("/reports/rebuild", methods=["POST"])
+@require_auth("admin")
+def start_rollup_rebuild():
+    """Recompute the report rollups from the raw attendance records"""
+    refresh_ledger = (request.get_json(silent=True) or {}).get("refreshLedger", True)
+    try:
+        job_id = maintenance_jobs.submit(
+            "rollup_rebuild", {"refreshLedger": refresh_ledger},
+            lambda job_id, params, progress: rebuild_rollups(db, params["refreshLedger"], progress)
+        )
+    except QueueFull as e:
+        return jsonify({"message": str(e)}), 429
+    return jsonify({"jobId": job_id, "statusUrl": f"/maintenance/jobs/{job_id}"}), 202
+
+@app.route("/maintenance/jobs/<job_id>", methods=["GET"])
+@require_auth("admin")
+def get_maintenance_job(job_id):
+    job = maintenance_jobs.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify({
+        "jobId": job["_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "createdAt": job["createdAt"]
+    }), 200
+
+# Enrolled face embeddings, one float32 matrix per batch
+face_matcher = FaceMatcher(db, ttl=float(os.getenv("FACE_GALLERY_TTL_SECONDS", "300")))
+# Every enrolled face on campus, for faces the batch gallery does not know
+campus_faces = CampusFaceIndex(db, sync_interval=float(os.getenv("FACE_INDEX_SYNC_SECONDS", "60")))
+
+@app.route("/faces/enroll", methods=["POST"])
+@require_auth("admin")
+def enroll_face():
+    """Store FaceNet embeddings for a student (replacing earlier ones by default)"""
+    data = request.json or {}
+    roll_no = data.get("rollNo")
+    batch = data.get("batch")
+    embeddings = data.get("embeddings")
+    if not roll_no or not batch or not embeddings:
+        return jsonify({"message": "rollNo, batch and embeddings are required"}), 400
+    
+    student = db.students.find_one({"batch": batch, "rollNo": roll_no}, projections.ENROLL_STUDENT)
+    if not student:
+        return jsonify({"message": "No student found with this roll number in the batch"}), 404
+    
+    try:
+        count = face_matcher.enroll(student, embeddings, data.get("threshold"), data.get("replace", True))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    campus_faces.sync()
+    return jsonify({"message": "Embeddings enrolled", "studentId": student["_id"], "embeddings": count}), 201
+
+@app.route("/metrics/faces", methods=["GET"])
+@require_auth()
+def get_face_gallery_stats():
+    """Loaded galleries per batch and the campus-wide index"""
+    return jsonify({"batches": face_matcher.stats(), "campus": campus_faces.stats()}), 200
+
+# Detection and embedding of stored frames, on a process pool
+recognition_queue = recognition_queue_from_env(db, image_store, face_matcher)
+
+# Server-sent event streams poll the job document this often, for at most this long.
+# Each open stream holds a server thread, so only a few are allowed per worker;
+# polling statusUrl is the main way to follow a job
+RECOGNITION_EVENTS_POLL_SECONDS = 1.0
+RECOGNITION_EVENTS_TIMEOUT_SECONDS = float(os.getenv("RECOGNITION_EVENTS_TIMEOUT_SECONDS", "60"))
+recognition_event_streams = threading.BoundedSemaphore(int(os.getenv("RECOGNITION_EVENTS_MAX_STREAMS", "1")))
+
+def recognition_job_status(job):
+    return {
+        "jobId": job["_id"],
+        "sessionId": job["params"]["sessionId"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "createdAt": job["createdAt"]
+    }
+
+@app.route("/attendance/sessions/<session_id>/recognize", methods=["POST"])
+@require_auth()
+def recognize_session_images(session_id):
+    """Queue face recognition of a session's stored frames; returns at once.
+
+    Recognises every captured frame, or only the ``images`` digests given.
+    Follow the job by polling ``statusUrl``; ``eventsUrl`` (server-sent
+    events) is available while a worker has a stream slot free. Results are
+    written to the session's ``recognition``.
+    """
+    try:
+        session = db.attendanceSessions.find_one({"_id": ObjectId(session_id)}, projections.SESSION_IMAGES)
+    except InvalidId:
+        return jsonify({"message": "Invalid session id"}), 400
+    if not session:
+        return jsonify({"message": "Session not found"}), 404
+    if not batch_allowed(session.get("batchId")):
+        return jsonify({"message": "Not allowed for this batch"}), 403
+    
+    stored = [entry["sha256"] for entry in session.get("capturedImages") or []]
+    requested = (request.get_json(silent=True) or {}).get("images")
+    if requested is not None and not (isinstance(requested, list) and all(isinstance(digest, str) for digest in requested)):
+        return jsonify({"message": "images must be a list of image digests"}), 400
+    frames = [digest for digest in requested if digest in stored] if requested else stored
+    if not frames:
+        return jsonify({"message": "No captured images to recognise; upload them first"}), 400
+    
+    try:
+        job_id = recognition_queue.submit(session, frames)
+    except QueueFull as e:
+        return jsonify({"message": str(e)}), 429, {"Retry-After": "10"}
+    return jsonify({
+        "jobId": job_id,
+        "frames": len(frames),
+        "statusUrl": f"/recognition/jobs/{job_id}",
+        "eventsUrl": f"/recognition/jobs/{job_id}/events"
+    }), 202
+
+@app.route("/recognition/jobs/<job_id>", methods=["GET"])
+@require_auth()
+def get_recognition_job(job_id):
+    job = recognition_queue.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    if not batch_allowed(job["params"].get("batch")):
+        return jsonify({"message": "Not allowed for this batch"}), 403
+    return jsonify(recognition_job_status(job)), 200
+
+@app.route("/recognition/jobs/<job_id>/events", methods=["GET"])
+@require_auth()
+def stream_recognition_job(job_id):
+    """Server-sent events: one ``status`` event per change until the job ends.
+
+    Answers 429 when this worker already serves its maximum number of
+    streams; poll ``/recognition/jobs/<id>`` instead.
+    """
+    job = recognition_queue.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    if not batch_allowed(job["params"].get("batch")):
+        return jsonify({"message": "Not allowed for this batch"}), 403
+    if not recognition_event_streams.acquire(blocking=False):
+        return jsonify({
+            "message": "Too many event streams; poll statusUrl instead",
+            "statusUrl": f"/recognition/jobs/{job_id}"
+        }), 429, {"Retry-After": "2"}
+    
+    def events():
+        last = None
+        deadline = time.monotonic() + RECOGNITION_EVENTS_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            status = recognition_job_status(recognition_queue.get(job_id))
+            if status != last:
+                yield f"event: status\ndata: {json_dumps(status)}\n\n"
+                last = status
+            if status["status"] in ("completed", "failed"):
+                return
+            time.sleep(RECOGNITION_EVENTS_POLL_SECONDS)
+        yield "event: timeout\ndata: {}\n\n"
+    
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Released when the server closes the response, even if the client left early
+    response.call_on_close(recognition_event_streams.release)
+    return response
+
+@app.route("/metrics/recognition", methods=["GET"])
+@require_auth()
+def get_recognition_metrics():
+    """Queue depth, per-stage latency and pool utilisation for this worker"""
+    return jsonify(recognition_queue.stats()), 200
+
 @app.route("/attendance/verify", methods=["POST"])
+@require_auth()
 def verify_attendance():
-    """Verify attendance by cross-checking facial recognition with RFID records"""
+    """Verify attendance by cross-checking facial recognition with RFID records.
+
+    Recognised faces come either as ``recognizedStudents`` labels from the
+    model server, as raw ``faceEmbeddings`` matched against the batch's
+    enrolled gallery (which also reports per-student confidences), or from
+    the finished recognition job of ``sessionId``. Several shots can be
+    sent at once as ``frameEmbeddings`` or ``recognizedFrames`` (one list
+    per frame); students are then recognised by a k-of-n vote across
+    frames (see ``frame_votes``). Faces
+    that match nobody in the batch are searched across the campus and
+    reported as ``otherBatchFaces`` when they belong to another batch, or
+    ``unknownFaces`` otherwise.
+    """
     try:
         data = request.json
         date_str = data.get("date")
@@ -979,188 +1633,122 @@ def verify_attendance():
         course_id = data.get("courseId")  # Add courseId parameter
 
         recognized_students = data.get("recognizedStudents", [])
+        recognized_frames = data.get("recognizedFrames")
+        session_id = data.get("sessionId")
         
         if not date_str or not batch_id:
             return jsonify({"error": "Missing required parameters"}), 400
+        # Several shots of the class: embeddings or labels per frame
+        try:
+            frame_embeddings = embedding_frames(data.get("faceEmbeddings"), data.get("frameEmbeddings"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if recognized_frames is not None and not (
+            isinstance(recognized_frames, list) and all(isinstance(frame, list) for frame in recognized_frames)
+        ):
+            return jsonify({"error": "recognizedFrames must be a list of label lists"}), 400
+        if not batch_allowed(batch_id):
+            return jsonify({"error": "Not allowed for this batch"}), 403
             
-        # Use the approach that works in your test script
         try:
             # Parse date string as YYYY-MM-DD
-            query_date = datetime.strptime(date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0)
+            query_date = parse_day(date_str)
             print(f"Searching for RFID records for date: {query_date}")
         except Exception as e:
             print(f"Date parsing error: {e}")
             return jsonify({"error": f"Invalid date format: {e}"}), 400
         
-        # First try the exact match approach (Approach 1 from your test)
-        rfid_record = db.rfid_attendance.find_one({
-            "date": query_date,
-            "batch": batch_id
-        })
-        
-        # If not found, try the date range approach (Approach 2 from your test)
-        if not rfid_record:
-            print("Exact match not found, trying date range query...")
-            rfid_record = db.rfid_attendance.find_one({
-                "date": {
-                    "$gte": query_date,
-                    "$lt": query_date + timedelta(days=1)
-                },
-                "batch": batch_id
-            })
-        
-        # If still not found, try the manual approach (Approach 3 from your test)
-        if not rfid_record:
-            print("Date range query failed, trying manual filtering...")
-            all_records = list(db.rfid_attendance.find({"batch": batch_id}))
-            print(f"Found {len(all_records)} total records for batch {batch_id}")
-            
-            for record in all_records:
-                record_date = record.get("date")
-                if record_date:
-                    if (record_date.year == query_date.year and 
-                        record_date.month == query_date.month and 
-                        record_date.day == query_date.day):
-                        print(f"Match found manually: {record_date}")
-                        rfid_record = record
-                        break
+        # Dates are stored as midnight (see migrate_dates.py), so a single
+        # indexed equality match finds the day's record
+        rfid_record = db.rfid_attendance.find_one(
+            {"date": query_date, "batch": batch_id},
+            projections.RFID_ROSTER
+        )
         
         print(f"RFID record found: {rfid_record is not None}")
         
+        rfid_students = rfid_record.get("students", []) if rfid_record else []
+        
         # Debug output of RFID data
         if rfid_record:
             print(f"Record date: {rfid_record.get('date')}")
-            rfid_students = rfid_record.get("students", [])
             print(f"Found {len(rfid_students)} students in RFID record")
-            if rfid_students:
-                print(f"First RFID student: {rfid_students[0].get('rollNo')}, {rfid_students[0].get('name')}")
-        
-        # Extract roll numbers from face recognition results
-        face_recognized_roll_numbers = []
-        face_name_map = {}
-        for student_str in recognized_students:
-            parts = student_str.split('_')
-            roll_no = parts[0]
-            name = parts[1] if len(parts) > 1 else ""
-            face_recognized_roll_numbers.append(roll_no)
-            face_name_map[roll_no] = name
-        
-        print(f"Face recognized rolls: {face_recognized_roll_numbers}")
-        
-        # Extract roll numbers from RFID records
-        rfid_roll_numbers = []
-        rfid_name_map = {}
-        if rfid_record and "students" in rfid_record:
-            for rfid_student in rfid_record.get("students", []):
-                roll_no = rfid_student.get("rollNo")
-                if roll_no:  # Only add if roll number exists
-                    rfid_roll_numbers.append(roll_no)
-                    rfid_name_map[roll_no] = rfid_student.get("name", "")
-        
-        print(f"RFID rolls: {rfid_roll_numbers}")
-        
-        # Initialize result dictionary
-        result = {
-            "date": date_str,
-            "batch": batch_id,
-            "students": {}
-        }
         
         # Get all students in the batch (to include absent students)
         try:
-            all_batch_students = list(db.students.find({"batch": batch_id}))
-            for student in all_batch_students:
-                roll_no = student.get("rollNo")
-                name = student.get("name", "")
-                
-                # Only add if not already processed
-                if roll_no and roll_no not in result["students"]:
-                    face_detected = roll_no in face_recognized_roll_numbers
-                    rfid_detected = roll_no in rfid_roll_numbers
-                    
-                    result["students"][roll_no] = {
-                        "rollNo": roll_no,
-                        "name": name,
-                        "faceRecognition": {"status": face_detected},
-                        "rfidCheckIn": {"status": rfid_detected},
-                        "isPresent": face_detected and rfid_detected,
-                        "possibleProxy": rfid_detected and not face_detected
-                    }
+            all_batch_students = list(db.students.find({"batch": batch_id}, projections.BATCH_ROSTER))
         except Exception as e:
             print(f"Error fetching batch students: {e}")
+            all_batch_students = []
+        
+        # Embeddings of the faces in the frame can be matched here instead
+        # of sending the image to the model server
+        face_confidences = None
+        face_votes = None
+        required_hits = None
+        unknown_faces = None
+        other_batch_faces = None
+        if session_id and not recognized_students and not frame_embeddings and not recognized_frames:
+            # Results of the session's recognition job, so nothing is uploaded again
+            try:
+                session = db.attendanceSessions.find_one({"_id": ObjectId(session_id)}, projections.SESSION_RECOGNITION)
+            except InvalidId:
+                return jsonify({"error": "Invalid session id"}), 400
+            if not session:
+                return jsonify({"error": "Session not found"}), 404
+            # The caller is only authorised for the requested batch
+            if session.get("batchId") != batch_id:
+                return jsonify({"error": "Session belongs to a different batch"}), 400
+            recognition = session.get("recognition") or {}
+            if recognition.get("status") != "completed":
+                return jsonify({"error": "Recognition has not finished for this session"}), 409
+            recognized_students = recognition.get("recognizedStudents", [])
+            face_confidences = recognition.get("confidences")
+            face_votes = recognition.get("votes")
+        elif frame_embeddings:
+            # Every face of every frame in one match, then a vote per frame
+            counts = [len(frame) for frame in frame_embeddings]
+            faces = [face for frame in frame_embeddings for face in frame]
+            try:
+                match = face_matcher.match(batch_id, faces)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            votes = FrameVotes.from_match(match, counts)
+            recognized_students = votes.labels()
+            face_confidences = match.confidences_by_roll()
+            if len(frame_embeddings) > 1:
+                face_votes = votes.by_roll()
+                required_hits = votes.required()
+            # Face indices run across all frames in order
+            unknown_faces = match.unknown_faces()
+            other_batch_faces = []
+            if unknown_faces:
+                hits = campus_faces.lookup([faces[i] for i in unknown_faces])
+                for face, hit in zip(list(unknown_faces), hits):
+                    if hit and hit.get("batch") != batch_id:
+                        other_batch_faces.append(dict(hit, face=face))
+                        unknown_faces.remove(face)
+        elif recognized_frames:
+            votes = FrameVotes.from_labels(recognized_frames)
+            recognized_students = votes.labels()
+            face_votes = votes.by_roll()
+            required_hits = votes.required()
+        
+        students, output = reconcile_attendance(
+            all_batch_students, recognized_students, rfid_students, face_confidences, face_votes
+        )
         
-        # Process face recognition results
-        for student_str in recognized_students:
-            parts = student_str.split('_')
-            roll_no = parts[0]
-            name = parts[1] if len(parts) > 1 else ""
-            
-            # Create or update student entry
-            if roll_no in result["students"]:
-                result["students"][roll_no].update({
-                    "faceRecognition": {"status": True},
-                    "isPresent": roll_no in rfid_roll_numbers,
-                    "possibleProxy": False
-                })
-            else:
-                result["students"][roll_no] = {
-                    "rollNo": roll_no,
-                    "name": name,
-                    "faceRecognition": {"status": True},
-                    "rfidCheckIn": {"status": roll_no in rfid_roll_numbers},
-                    "isPresent": roll_no in rfid_roll_numbers,  # Present only if both are true
-                    "possibleProxy": False
-                }
-        
-        # Process RFID records for students not captured by face recognition
-        if rfid_record and "students" in rfid_record:
-            for rfid_student in rfid_record.get("students", []):
-                roll_no = rfid_student.get("rollNo")
-                name = rfid_student.get("name", "")
-                
-                if not roll_no:
-                    continue  # Skip if roll number is missing
-                
-                if roll_no not in result["students"]:
-                    # Student has RFID record but not face recognition - possible proxy
-                    result["students"][roll_no] = {
-                        "rollNo": roll_no,
-                        "name": name,
-                        "faceRecognition": {"status": False},
-                        "rfidCheckIn": {"status": True},
-                        "isPresent": False,  # Not present due to no face recognition
-                        "possibleProxy": True  # This is a proxy case!
-                    }
-                elif roll_no in result["students"] and not result["students"][roll_no]["faceRecognition"]["status"]:
-                    # Update existing entry to mark as possible proxy
-                    result["students"][roll_no]["possibleProxy"] = True
-                    result["students"][roll_no]["rfidCheckIn"]["status"] = True
-                    
-        # Convert results to a format that supports both present and absent lists
-        face_recognized = sorted([s for s in recognized_students])
-        present_students = []
-        absent_students = []
-        possible_proxy_students = []
-        
-        # Create student output lists
-        for roll_no, student_data in result["students"].items():
-            student_str = f"{roll_no}_{student_data['name']}"
-            
-            if student_data["possibleProxy"]:
-                possible_proxy_students.append(student_str)
-                absent_students.append(student_str)  # Also counted as absent
-            elif student_data["isPresent"]:
-                present_students.append(student_str)
-            else:
-                absent_students.append(student_str)
-        
-        # Add the output lists to the result
-        result["output"] = {
-            "present": present_students,
-            "absent": absent_students,
-            "possibleProxy": possible_proxy_students,
-            "face_recognized": face_recognized
+        result = {
+            "date": date_str,
+            "batch": batch_id,
+            "students": students,
+            "output": output
         }
+        if unknown_faces is not None:
+            result["unknownFaces"] = unknown_faces
+            result["otherBatchFaces"] = other_batch_faces
+        if required_hits is not None:
+            result["requiredHits"] = required_hits
         
         result["courseId"] = course_id
         
@@ -1173,70 +1761,7 @@ def verify_attendance():
         return jsonify({"error": f"Error verifying attendance: {str(e)}"}), 500
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
-
-
-
-
- #---------------------------------------------------------------   
-# from flask import Flask, request, jsonify
-# from flask_cors import CORS
-# import bcrypt
-# from pymongo import MongoClient
-# import os
-# import jwt
-# from datetime import datetime, timedelta
-
-# app = Flask(__name__)
-# CORS(app)
-
-# # Configure MongoDB
-# client = MongoClient(os.getenv("MONGODB_URI"))
-# db = client["attendance_system"]
-
-# # Secret for JWT
-# JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
-
-# @app.route("/auth", methods=["POST"])
-# def authenticate():
-#     data = request.json
-#     username = data.get("username")
-#     password = data.get("password")
-    
-#     if not username or not password:
-#         return jsonify({"message": "Username and password are required"}), 400
-    
-#     user = db.users.find_one({"username": username})
-#     if not user:
-#         return jsonify({"message": "User not found"}), 404
-    
-#     if 'password' not in user:
-#         return jsonify({"message": "Password not set for this user"}), 400
-    
-#     # Get the stored password hash
-#     stored_hash = user['password']
-#     if isinstance(stored_hash, bytes):
-#         hashed_pw = stored_hash
-#     else:
-#         hashed_pw = bytes(stored_hash)
-    
-#     # Verify password
-#     if bcrypt.checkpw(password.encode('utf-8'), hashed_pw):
-#         # Generate JWT token
-#         token = jwt.encode({
-#             "username": username,
-#             "role": user.get("role", "user"),
-#             "exp": datetime.utcnow() + timedelta(days=7)  # Token expires in 7 days
-#         }, JWT_SECRET, algorithm="HS256")
-        
-#         return jsonify({
-#             "username": username,
-#             "name": user.get("name", username),
-#             "role": user.get("role", "user"),
-#             "token": token
-#         }), 200
-#     else:
-#         return jsonify({"message": "Invalid credentials"}), 401
+    # Development server only; in production run `gunicorn -c gunicorn.conf.py api:app`
+    init_worker()
+    app.run(debug=os.getenv("FLASK_DEBUG", "1") == "1", host='0.0.0.0', port=5000)
 
-# if __name__ == "__main__":
-#     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""Calendar-day handling for attendance documents.
+
+``rfid_attendance`` and ``attendance`` documents are keyed by day, and the
+``date`` field is always stored as midnight of that day. Every write path
+goes through ``start_of_day`` so that a single equality match on ``date``
+(served by the (date, batch) indexes) is enough to find a day's record.
+"""
+from datetime import datetime
+
+DATE_FORMAT = "%Y-%m-%d"
+MONTH_FORMAT = "%Y-%m"
+
+
+def start_of_day(value):
+    """Truncate a datetime to midnight of the same day"""
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def parse_day(date_str):
+    """Parse a ``YYYY-MM-DD`` string to a midnight datetime.
+
+    Raises ValueError on a malformed date.
+    """
+    return start_of_day(datetime.strptime(date_str, DATE_FORMAT))
+
+
+def parse_month(month_str):
+    """``(first day, first day of next month)`` for a ``YYYY-MM`` string.
+
+    Raises ValueError on a malformed month.
+    """
+    start = datetime.strptime(month_str, MONTH_FORMAT)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def coerce_day(value):
+    """Normalise a stored ``date`` (datetime or string) to midnight, or None"""
+    if isinstance(value, datetime):
+        return start_of_day(value)
+    if isinstance(value, str):
+        try:
+            return start_of_day(datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None))
+        except ValueError:
+            return None
+    return None
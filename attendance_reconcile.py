@@ -0,0 +1,116 @@
+"""Reconciliation of face recognition results against RFID check-ins.
+
+``reconcile_attendance`` is the engine behind ``/attendance/verify``. It
+takes plain Python data (no database access) so it can be exercised and
+benchmarked on its own. Face and RFID roll numbers are indexed in hashed
+containers and every student is visited once, so the cost is linear in
+the size of the batch.
+"""
+
+
+def parse_recognized_student(student_str):
+    """Split a ``"rollNo_name"`` recognition label into ``(roll_no, name)``"""
+    parts = student_str.split('_')
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+def _student_entry(roll_no, name, face_detected, rfid_detected, face_confidence=None, face_votes=None):
+    face_recognition = {"status": face_detected}
+    if face_confidence is not None:
+        face_recognition["confidence"] = face_confidence
+    if face_votes is not None:
+        face_recognition["votes"] = face_votes
+    return {
+        "rollNo": roll_no,
+        "name": name,
+        "faceRecognition": face_recognition,
+        "rfidCheckIn": {"status": rfid_detected},
+        "isPresent": face_detected and rfid_detected,
+        "possibleProxy": rfid_detected and not face_detected
+    }
+
+
+def reconcile_attendance(batch_students, recognized_students, rfid_students, face_confidences=None,
+                         face_votes=None):
+    """Cross-check recognised faces with RFID check-ins.
+
+    ``batch_students`` and ``rfid_students`` are iterables of dicts with
+    ``rollNo`` and ``name``; ``recognized_students`` is the list of
+    ``"rollNo_name"`` labels returned by the model server (or by
+    ``face_matcher``, which also supplies ``face_confidences``, a
+    rollNo -> similarity map added to each ``faceRecognition`` entry).
+
+    With several frames, ``face_votes`` maps the roll number of every
+    student seen in any frame to their ``frame_votes`` summary.
+    ``recognized_students`` then holds the students recognised by face
+    alone; a student seen in fewer frames still counts as face-detected
+    when the summary ``confirmsRfid`` and they checked in.
+
+    Returns ``(students, output)`` where ``students`` maps roll number to
+    its verification entry (batch roster first, then face-only, then
+    RFID-only students) and ``output`` holds the present/absent/
+    possibleProxy/face_recognized lists.
+    """
+    # Roll number -> name, keeping the first label seen for each roll: the
+    # original loop created each entry from the first label and only
+    # updated its status for repeats, so that is the name it reported
+    face_names = {}
+    for student_str in recognized_students:
+        roll_no, name = parse_recognized_student(student_str)
+        face_names.setdefault(roll_no, name)
+
+    rfid_names = {}
+    for rfid_student in rfid_students:
+        roll_no = rfid_student.get("rollNo")
+        if roll_no:  # Only add if roll number exists
+            rfid_names.setdefault(roll_no, rfid_student.get("name", ""))
+
+    students = {}
+    present = []
+    absent = []
+    possible_proxy = []
+
+    face_confidences = face_confidences or {}
+    face_votes = face_votes or {}
+
+    def add(roll_no, name, face_detected, rfid_detected):
+        if rfid_detected and face_votes.get(roll_no, {}).get("confirmsRfid"):
+            face_detected = True
+        entry = _student_entry(
+            roll_no, name, face_detected, rfid_detected,
+            face_confidences.get(roll_no), face_votes.get(roll_no)
+        )
+        students[roll_no] = entry
+
+        student_str = f"{roll_no}_{name}"
+        if entry["possibleProxy"]:
+            possible_proxy.append(student_str)
+            absent.append(student_str)  # Also counted as absent
+        elif entry["isPresent"]:
+            present.append(student_str)
+        else:
+            absent.append(student_str)
+
+    # Every student on the batch roster, so absentees are included
+    for student in batch_students:
+        roll_no = student.get("rollNo")
+        if roll_no and roll_no not in students:
+            add(roll_no, student.get("name", ""), roll_no in face_names, roll_no in rfid_names)
+
+    # Recognised faces that are not on the roster
+    for roll_no, name in face_names.items():
+        if roll_no not in students:
+            add(roll_no, name, True, roll_no in rfid_names)
+
+    # RFID check-ins without a matching face - possible proxy
+    for roll_no, name in rfid_names.items():
+        if roll_no not in students:
+            add(roll_no, name, False, True)
+
+    output = {
+        "present": present,
+        "absent": absent,
+        "possibleProxy": possible_proxy,
+        "face_recognized": sorted(recognized_students)
+    }
+    return students, output
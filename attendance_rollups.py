@@ -0,0 +1,256 @@
+"""Materialised attendance counts for reports.
+
+Two rollup collections are kept up to date on every attendance write, so
+shortage reports are indexed reads instead of a pass over every
+``attendance`` document:
+
+* ``attendanceRollups``: one document per (student, course) with
+  ``sessions``, ``present``, ``absent``, ``proxy`` and ``percentage``.
+* ``batchDayRollups``: one document per (batch, day) with the number of
+  RFID check-ins and the session present/absent/proxy totals.
+
+Writes only apply the change a write makes (see
+``student_ledger.record_session_results``), so re-saving a session does
+not count it twice. Each rollup document is updated with a single atomic
+update; ``percentage`` is recomputed inside the same pipeline update.
+
+Rollups can always be recomputed from the per-student ledger:
+
+    python attendance_rollups.py --rebuild [--skip-ledger]
+"""
+import argparse
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from attendance_dates import DATE_FORMAT, start_of_day
+from student_ledger import LEDGER_COLLECTION, SESSION, backfill as backfill_ledger
+
+STUDENT_ROLLUPS = "attendanceRollups"
+BATCH_DAY_ROLLUPS = "batchDayRollups"
+
+SHORTAGE_PROJECTION = {
+    "_id": 0, "studentId": 1, "rollNo": 1, "name": 1, "batch": 1, "courseId": 1,
+    "courseName": 1, "sessions": 1, "present": 1, "absent": 1, "proxy": 1, "percentage": 1
+}
+
+
+def _plus(field, delta):
+    return {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}
+
+
+def _percentage():
+    return {"$cond": [
+        {"$gt": ["$sessions", 0]},
+        {"$round": [{"$multiply": [100, {"$divide": ["$present", "$sessions"]}]}, 1]},
+        None
+    ]}
+
+
+def _session_delta(previous, current):
+    """``(sessions, present, absent, proxy)`` change for one student"""
+    present = int(current["present"])
+    proxy = int(current["proxy"])
+    if previous is None:
+        return 1, present, 1 - present, proxy
+    present_change = present - int(previous["present"])
+    return 0, present_change, -present_change, proxy - int(previous["proxy"])
+
+
+def student_rollup_update(student_id, record, current, delta, current_time):
+    """Pipeline upsert applying ``delta`` to a (student, course) rollup"""
+    sessions, present, absent, proxy = delta
+    return UpdateOne(
+        {"_id": f"{student_id}:{record.get('courseId')}"},
+        [
+            {"$set": {
+                "studentId": {"$literal": student_id},
+                "courseId": {"$literal": record.get("courseId")},
+                "courseName": {"$literal": record.get("courseName")},
+                "batch": {"$literal": record.get("batchId")},
+                "rollNo": {"$literal": current.get("rollNo")},
+                "name": {"$literal": current.get("name")},
+                "sessions": _plus("sessions", sessions),
+                "present": _plus("present", present),
+                "absent": _plus("absent", absent),
+                "proxy": _plus("proxy", proxy),
+                "createdAt": {"$ifNull": ["$createdAt", current_time]},
+                "updatedAt": current_time
+            }},
+            {"$set": {"percentage": _percentage()}}
+        ],
+        upsert=True
+    )
+
+
+def _batch_day_update(db, batch, day, increments, current_time, session=None):
+    day = start_of_day(day)
+    db[BATCH_DAY_ROLLUPS].update_one(
+        {"_id": f"{batch}:{day.strftime(DATE_FORMAT)}"},
+        {
+            "$inc": increments,
+            "$set": {"updatedAt": current_time},
+            "$setOnInsert": {"batch": batch, "date": day, "createdAt": current_time}
+        },
+        upsert=True,
+        session=session
+    )
+
+
+def apply_session_changes(db, record, changes, current_time, session=None):
+    """Fold the ledger changes of one saved session into the rollups.
+
+    ``changes`` is the list returned by ``record_session_results``.
+    """
+    if not changes:
+        return
+    operations = []
+    totals = [0, 0, 0, 0]
+    for student_id, previous, current in changes:
+        delta = _session_delta(previous, current)
+        if not any(delta):
+            continue
+        totals = [total + change for total, change in zip(totals, delta)]
+        operations.append(student_rollup_update(student_id, record, current, delta, current_time))
+
+    if not operations:
+        return
+    db[STUDENT_ROLLUPS].bulk_write(operations, ordered=False, session=session)
+
+    increments = {"sessionPresent": totals[1], "sessionAbsent": totals[2], "proxy": totals[3]}
+    # Only a first save adds a session to the day
+    if all(previous is None for _, previous, _ in changes):
+        increments["sessions"] = 1
+    _batch_day_update(db, record.get("batchId"), record["date"], increments, current_time, session)
+
+
+def apply_rfid_checkins(db, batch, day, new_checkins, current_time):
+    """Count students checking in for the first time on ``day``"""
+    if new_checkins:
+        _batch_day_update(db, batch, day, {"rfidCheckIns": new_checkins}, current_time)
+
+
+# ----------------------------------------------------------------------
+# Reports
+# ----------------------------------------------------------------------
+def shortage_list(db, batch=None, course_id=None, threshold=75.0, min_sessions=1, limit=500):
+    """Students below ``threshold`` percent in a course, worst first"""
+    query = {"percentage": {"$lt": threshold}, "sessions": {"$gte": min_sessions}}
+    if batch:
+        query["batch"] = batch
+    if course_id:
+        query["courseId"] = course_id
+    cursor = db[STUDENT_ROLLUPS].find(query, SHORTAGE_PROJECTION).sort("percentage", 1).limit(limit)
+    return list(cursor)
+
+
+def batch_days(db, batch, start=None, end=None):
+    """Per-day rollups for ``batch``, oldest first"""
+    query = {"batch": batch}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    projection = {"_id": 0, "createdAt": 0, "updatedAt": 0}
+    return list(db[BATCH_DAY_ROLLUPS].find(query, projection).sort("date", 1))
+
+
+# ----------------------------------------------------------------------
+# Rebuild from the ledger
+# ----------------------------------------------------------------------
+def _count_if(condition):
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+def student_rollups_pipeline(current_time):
+    return [
+        {"$match": {"kind": SESSION}},
+        {"$sort": {"date": 1}},
+        {"$group": {
+            "_id": {"studentId": "$studentId", "courseId": "$courseId"},
+            "courseName": {"$last": "$courseName"},
+            "batch": {"$last": "$batch"},
+            "rollNo": {"$last": "$rollNo"},
+            "name": {"$last": "$name"},
+            "sessions": {"$sum": 1},
+            "present": _count_if("$present"),
+            "proxy": _count_if("$proxy")
+        }},
+        {"$project": {
+            # Same key as the incremental writes (a missing course reads "None")
+            "_id": {"$concat": ["$_id.studentId", ":", {"$ifNull": [{"$toString": "$_id.courseId"}, "None"]}]},
+            "studentId": "$_id.studentId",
+            "courseId": "$_id.courseId",
+            "courseName": 1, "batch": 1, "rollNo": 1, "name": 1,
+            "sessions": 1, "present": 1, "proxy": 1,
+            "absent": {"$subtract": ["$sessions", "$present"]},
+            "createdAt": {"$literal": current_time},
+            "updatedAt": {"$literal": current_time}
+        }},
+        {"$set": {"percentage": _percentage()}},
+        {"$out": STUDENT_ROLLUPS}
+    ]
+
+
+def batch_day_rollups_pipeline(current_time):
+    is_session = {"$eq": ["$kind", SESSION]}
+    return [
+        {"$group": {
+            "_id": {"batch": "$batch", "date": "$date"},
+            "rfidCheckIns": _count_if({"$ne": ["$kind", SESSION]}),
+            "sessionPresent": _count_if({"$and": [is_session, "$present"]}),
+            "sessionAbsent": _count_if({"$and": [is_session, {"$not": ["$present"]}]}),
+            "proxy": _count_if({"$and": [is_session, "$proxy"]}),
+            "courses": {"$addToSet": {"$cond": [is_session, "$courseId", "$$REMOVE"]}}
+        }},
+        {"$project": {
+            # Same key as the incremental writes (a missing batch reads "None")
+            "_id": {"$concat": [
+                {"$ifNull": [{"$toString": "$_id.batch"}, "None"]}, ":",
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.date"}}
+            ]},
+            "batch": "$_id.batch",
+            "date": "$_id.date",
+            "rfidCheckIns": 1, "sessionPresent": 1, "sessionAbsent": 1, "proxy": 1,
+            "sessions": {"$size": "$courses"},
+            "createdAt": {"$literal": current_time},
+            "updatedAt": {"$literal": current_time}
+        }},
+        {"$out": BATCH_DAY_ROLLUPS}
+    ]
+
+
+def rebuild(db, refresh_ledger=True, progress=None):
+    """Recompute both rollup collections from the raw records.
+
+    The ledger is refreshed from ``attendance`` first (unless
+    ``refresh_ledger`` is False), then each rollup collection is replaced
+    in one ``$out`` aggregation, so readers never see a partial rebuild.
+    """
+    current_time = datetime.now()
+    rows = backfill_ledger(db, progress=progress) if refresh_ledger else None
+    ledger = db[LEDGER_COLLECTION]
+    ledger.aggregate(student_rollups_pipeline(current_time), allowDiskUse=True)
+    ledger.aggregate(batch_day_rollups_pipeline(current_time), allowDiskUse=True)
+    return {
+        "ledgerRows": rows,
+        "studentRollups": db[STUDENT_ROLLUPS].estimated_document_count(),
+        "batchDayRollups": db[BATCH_DAY_ROLLUPS].estimated_document_count()
+    }
+
+
+if __name__ == "__main__":
+    from database import connect_to_db
+    from db_indexes import ensure_indexes
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="recompute every rollup from the raw records")
+    parser.add_argument("--skip-ledger", action="store_true", help="rebuild from the ledger as it is")
+    args = parser.parse_args()
+
+    db = connect_to_db()
+    ensure_indexes(db)
+    if args.rebuild:
+        print(f"✅ Rebuilt rollups: {rebuild(db, refresh_ledger=not args.skip_ledger)}")
@@ -0,0 +1,102 @@
+"""Benchmark the campus-wide IVF face index.
+
+Builds synthetic campuses (random identity vectors, a few noisy photos per
+student), then searches a classroom frame of re-captured faces against the
+whole campus (the few faces a batch gallery leaves unmatched). Reports build time, and for each ``nprobe`` the search
+latency for one frame and recall@1 over many faces (same student as an
+exhaustive search), next to the
+exhaustive matmul over every embedding. Also checks incremental add and
+remove. Run from the repository root:
+
+    python benchmarks/bench_face_index.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_index import IVFIndex  # noqa: E402
+from face_matcher import normalize  # noqa: E402
+
+SIZES = [5000, 20000, 50000]
+DIMENSION = 512
+PHOTOS_PER_STUDENT = 2
+# Only faces the batch gallery could not match reach the campus index
+FACES_PER_FRAME = 8
+# Faces used to estimate recall
+RECALL_FACES = 500
+NOISE = 0.6
+NPROBES = [1, 2, 4, 8, 16, 32]
+
+
+def make_campus(size, rng):
+    identities = normalize(rng.standard_normal((size, DIMENSION)))
+    rows = []
+    for index in range(size):
+        student = {"studentId": f"S{index:06d}", "rollNo": f"R{index:06d}", "name": "", "batch": f"B{index % 50}"}
+        photos = identities[index] + rng.standard_normal((PHOTOS_PER_STUDENT, DIMENSION)) * NOISE / np.sqrt(DIMENSION)
+        for photo, vector in enumerate(photos):
+            rows.append((f"{index}:{photo}", student, vector))
+    return identities, rows
+
+
+def exhaustive(matrix, owners, probes):
+    scores = normalize(probes) @ matrix.T
+    return owners[scores.argmax(axis=1)]
+
+
+def timed(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rng = np.random.default_rng(7)
+    for size in SIZES:
+        identities, rows = make_campus(size, rng)
+        start = time.perf_counter()
+        index = IVFIndex.build(rows)
+        build_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            index, _ = IVFIndex.load(directory)
+
+            present = rng.choice(size, size=RECALL_FACES, replace=False)
+            faces = identities[present] + rng.standard_normal((RECALL_FACES, DIMENSION)) * NOISE / np.sqrt(DIMENSION)
+            probes = faces[:FACES_PER_FRAME]
+
+            matrix = normalize(np.asarray(index.vectors))
+            expected = exhaustive(matrix, index.row_students, faces)
+            exact_seconds, _ = timed(exhaustive, matrix, index.row_students, probes)
+            print(f"\n{size} students, {len(index)} embeddings, {len(index.centroids)} lists, "
+                  f"built in {build_seconds:.1f} s; exhaustive search {exact_seconds * 1000:.2f} ms")
+            print(f"{'nprobe':>7} {'ms':>8} {'speedup':>8} {'recall@1':>9}")
+            for nprobe in NPROBES:
+                seconds, _ = timed(index.search, probes, nprobe)
+                recall = float(np.mean(index.search(faces, nprobe)[1] == expected))
+                print(f"{nprobe:>7} {seconds * 1000:>8.2f} {exact_seconds / seconds:>7.1f}x {recall:>9.1%}")
+
+            # Incremental changes: re-enrol one student, drop another
+            moved, dropped = present[0], present[1]
+            for photo in range(PHOTOS_PER_STUDENT):
+                index.remove(f"{moved}:{photo}")
+                index.remove(f"{dropped}:{photo}")
+            student = {"studentId": f"S{moved:06d}", "rollNo": f"R{moved:06d}", "name": "", "batch": "moved"}
+            index.add("new", student, identities[moved])
+            _, found = index.search(probes[:2])
+            assert index.students[found[0]]["batch"] == "moved"
+            assert found[1] < 0 or index.students[found[1]]["studentId"] != f"S{dropped:06d}"
+            print("incremental add/remove ok")
+
+
+if __name__ == "__main__":
+    main()
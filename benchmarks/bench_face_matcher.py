@@ -0,0 +1,93 @@
+"""Benchmark the in-backend face matcher.
+
+Builds synthetic galleries of 100 to 10,000 enrolled students (random
+unit embeddings, a few photos per student) and a classroom frame of
+noisy re-captures of enrolled students plus a few strangers. Compares
+one batched ``Gallery.match`` with matching the faces one at a time
+(the per-image pattern of the old model-server round trips), checks that
+both give the same answer, and reports recognition accuracy. Run from
+the repository root:
+
+    python benchmarks/bench_face_matcher.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_matcher import Gallery, normalize  # noqa: E402
+
+SIZES = [100, 300, 1000, 3000, 10000]
+DIMENSION = 512
+PHOTOS_PER_STUDENT = 3
+FACES_PER_FRAME = 60
+STRANGERS_PER_FRAME = 5
+NOISE = 0.6  # relative to the unit-length embedding; yields cosine ~0.85
+
+
+def make_gallery(size, rng):
+    """Each student's photos are noisy views of a per-student identity vector"""
+    identities = normalize(rng.standard_normal((size, DIMENSION)))
+    enrolled = []
+    for index in range(size):
+        photos = identities[index] + rng.standard_normal((PHOTOS_PER_STUDENT, DIMENSION)) * NOISE / np.sqrt(DIMENSION)
+        student = {"studentId": f"S{index:05d}", "rollNo": f"R{index:05d}", "name": f"Student{index}"}
+        enrolled.append((student, photos, None))
+    return identities, Gallery.from_students(enrolled)
+
+
+def make_frame(identities, rng):
+    """Faces of enrolled students (recaptured with noise) plus strangers"""
+    present = rng.choice(len(identities), size=min(FACES_PER_FRAME, len(identities)), replace=False)
+    faces = identities[present] + rng.standard_normal((len(present), DIMENSION)) * NOISE / np.sqrt(DIMENSION)
+    strangers = rng.standard_normal((STRANGERS_PER_FRAME, DIMENSION))
+    return np.vstack([faces, strangers]).astype(np.float32), present
+
+
+def match_one_at_a_time(gallery, faces):
+    """Per-face matching, one call per face"""
+    recognized = set()
+    for face in faces:
+        result = gallery.match(face)
+        recognized.update(student["rollNo"] for student in result.recognized_students())
+    return recognized
+
+
+def best_of(fn, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"{'students':>8} {'gallery MB':>10} {'per-face ms':>11} {'batched ms':>10} {'speedup':>8} "
+          f"{'recall':>7} {'strangers rejected':>18}")
+    for size in SIZES:
+        identities, gallery = make_gallery(size, rng)
+        faces, present = make_frame(identities, rng)
+
+        result = gallery.match(faces)
+        batched = {student["rollNo"] for student in result.recognized_students()}
+        assert batched == match_one_at_a_time(gallery, faces), f"result mismatch at {size}"
+
+        expected = {f"R{index:05d}" for index in present}
+        recall = len(batched & expected) / len(expected)
+        rejected = sum(1 for i in result.unknown_faces() if i >= len(present))
+
+        repeat = 5 if size <= 1000 else 2
+        one_at_a_time = best_of(match_one_at_a_time, (gallery, faces), repeat)
+        vectorised = best_of(gallery.match, (faces,), repeat)
+        print(f"{size:>8} {gallery.matrix.nbytes / 2**20:>10.1f} {one_at_a_time * 1000:>11.2f} "
+              f"{vectorised * 1000:>10.2f} {one_at_a_time / vectorised:>7.1f}x "
+              f"{recall:>7.1%} {rejected:>11}/{STRANGERS_PER_FRAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark multi-frame vote aggregation.
+
+Simulates a class where every present student is recognised in each frame
+with probability DETECTION_RATE (heads turn, people hide behind each
+other), each frame also contains LOOKALIKES_PER_FRAME spurious matches of
+absent students, and a few absent students have a proxy tap their RFID
+card. For 1 to 60 frames it reports:
+
+* false proxy flags: present, checked-in students flagged ``possibleProxy``
+  (in a single shot, anyone who looked away);
+* caught proxies: absent students with a proxy check-in that are flagged;
+* lookalikes: absent students recognised by face alone;
+
+and the time to aggregate the frames with ``FrameVotes`` compared with
+a per-face Python dict. Run from the repository root:
+
+    python benchmarks/bench_frame_votes.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_reconcile import reconcile_attendance  # noqa: E402
+from frame_votes import FrameVotes  # noqa: E402
+
+CLASS_SIZE = 120
+ATTENDANCE = 0.85
+DETECTION_RATE = 0.7
+LOOKALIKES_PER_FRAME = 1
+PROXIES = 4
+FRAMES = [1, 3, 5, 10, 30, 60]
+TRIALS = 20
+
+
+def simulate(frames, rng):
+    """Per-face student indices, scores and per-frame face counts"""
+    present = rng.random(CLASS_SIZE) < ATTENDANCE
+    absent = np.flatnonzero(~present)
+    proxies = rng.choice(absent, size=min(PROXIES, len(absent)), replace=False)
+    face_students, counts = [], []
+    for _ in range(frames):
+        seen = np.flatnonzero(present & (rng.random(CLASS_SIZE) < DETECTION_RATE))
+        lookalikes = rng.choice(absent, size=LOOKALIKES_PER_FRAME)
+        frame = np.concatenate([seen, lookalikes])
+        face_students.append(frame)
+        counts.append(len(frame))
+    face_students = np.concatenate(face_students)
+    scores = rng.uniform(0.7, 0.95, size=len(face_students)).astype(np.float32)
+    return present, proxies, face_students, scores, counts
+
+
+def aggregate_with_dicts(face_students, scores, counts):
+    """Per-face Python aggregation, for comparison"""
+    hits, best, total = {}, {}, {}
+    start = 0
+    for count in counts:
+        frame_best = {}
+        for i in range(start, start + count):
+            student = int(face_students[i])
+            frame_best[student] = max(frame_best.get(student, 0.0), float(scores[i]))
+        for student, score in frame_best.items():
+            hits[student] = hits.get(student, 0) + 1
+            best[student] = max(best.get(student, 0.0), score)
+            total[student] = total.get(student, 0.0) + score
+        start += count
+    return hits, best, total
+
+
+def main():
+    rng = np.random.default_rng(3)
+    students = [{"rollNo": f"R{i:03d}", "name": f"S{i}"} for i in range(CLASS_SIZE)]
+    print(f"{CLASS_SIZE} students, {DETECTION_RATE:.0%} detection per frame, "
+          f"{LOOKALIKES_PER_FRAME} lookalike per frame, {PROXIES} proxies; mean of {TRIALS} classes")
+    print(f"{'frames':>6} {'k':>3} {'false proxy':>11} {'caught':>7} {'lookalikes':>10} "
+          f"{'votes ms':>9} {'dict ms':>8}")
+    for frames in FRAMES:
+        false_flags = caught = lookalikes = 0
+        votes_seconds = dict_seconds = 0.0
+        for _ in range(TRIALS):
+            present, proxies, face_students, scores, counts = simulate(frames, rng)
+
+            start = time.perf_counter()
+            votes = FrameVotes(students).add_frames(face_students, scores, counts)
+            labels, by_roll = votes.labels(), votes.by_roll()
+            votes_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            aggregate_with_dicts(face_students, scores, counts)
+            dict_seconds += time.perf_counter() - start
+
+            rfid = [students[i] for i in np.flatnonzero(present)] + [students[i] for i in proxies]
+            _, output = reconcile_attendance(students, labels, rfid, None, by_roll)
+            flagged = {label.split("_")[0] for label in output["possibleProxy"]}
+            recognized = {label.split("_")[0] for label in labels}
+            false_flags += sum(students[i]["rollNo"] in flagged for i in np.flatnonzero(present))
+            caught += sum(students[i]["rollNo"] in flagged for i in proxies)
+            lookalikes += sum(students[i]["rollNo"] in recognized for i in np.flatnonzero(~present))
+        print(f"{frames:>6} {votes.required():>3} {false_flags / TRIALS:>11.1f} "
+              f"{caught / TRIALS:>4.1f}/{PROXIES} {lookalikes / TRIALS:>10.1f} "
+              f"{votes_seconds / TRIALS * 1000:>9.3f} {dict_seconds / TRIALS * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Load-test the API under gunicorn at different worker counts.
+
+For each worker count a server is started from gunicorn.conf.py, warmed
+up, and hit by concurrent clients for a fixed duration. Throughput and
+latency percentiles are printed per configuration. Run from the
+repository root with MONGODB_URI pointing at a test database:
+
+    python benchmarks/load_test.py --workers 1,2,4,8 --path /attendance/daily?batch=A
+
+Pass --url to load-test an already running server instead.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def hammer(url, duration, concurrency):
+    """Issue GET requests from ``concurrency`` threads for ``duration`` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                # 4xx is a valid answer for placeholder parameters
+                if e.code >= 500:
+                    local_errors += 1
+            except Exception:
+                local_errors += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return latencies, errors[0], elapsed
+
+
+def summarise(label, latencies, errors, elapsed):
+    if not latencies:
+        print(f"{label:>10} no requests completed")
+        return
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    print(f"{label:>10} {len(latencies) / elapsed:>9.1f} {statistics.mean(latencies) * 1000:>8.1f} "
+          f"{pct(0.5):>8.1f} {pct(0.95):>8.1f} {pct(0.99):>8.1f} {errors:>7}")
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return True
+        except urllib.error.HTTPError:
+            return True
+        except Exception:
+            time.sleep(0.3)
+    return False
+
+
+def run_server(workers, threads, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_ACCESS_LOG="/dev/null")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "api:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput at different worker counts")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--path", default="/", help="route to request")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per configuration")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--url", help="test this running server instead of starting gunicorn")
+    args = parser.parse_args()
+
+    print(f"{'workers':>10} {'req/s':>9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    if args.url:
+        summarise("external", *hammer(args.url, args.duration, args.concurrency))
+        return
+
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    for workers in [int(w) for w in args.workers.split(",")]:
+        server = run_server(workers, args.threads, args.port)
+        try:
+            if not wait_until_up(url):
+                print(f"{workers:>10} server did not start")
+                continue
+            hammer(url, 2, args.concurrency)  # warm-up: connections, caches
+            summarise(str(workers), *hammer(url, args.duration, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
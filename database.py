@@ -0,0 +1,298 @@
+"""MongoDB connection for the API and the maintenance scripts.
+
+The client is configured from the environment:
+
+    MONGO_MAX_POOL_SIZE                  connections per server (default 100)
+    MONGO_MIN_POOL_SIZE                  idle connections kept open (default 0)
+    MONGO_MAX_IDLE_TIME_MS               close idle connections after this long
+    MONGO_WAIT_QUEUE_TIMEOUT_MS          max wait for a pooled connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS    max wait for a suitable server (default 30000)
+    MONGO_COMPRESSORS                    e.g. "zstd,snappy" (needs zstandard / python-snappy)
+    MONGO_READ_PREFERENCE                default read preference (default "primary")
+    MONGO_ROUTE_READ_PREFERENCES         per-route overrides, "route=mode,route=mode"
+    MONGO_READ_METRICS                   "1" to record bytes read per route
+
+Read-only routes listed in ``ROUTE_READ_PREFERENCES`` may be served from
+secondaries; use ``for_route(db, name)`` to get a handle with the right
+read preference. Pool checkout wait times are collected by ``pool_metrics``;
+with MONGO_READ_METRICS=1, ``read_metrics`` adds up the size of every read
+reply per route.
+"""
+import os
+import threading
+import time
+
+import bson
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReadPreference, monitoring
+
+# Load env vars
+load_dotenv()
+
+DB_NAME = "attendance_system"
+
+# Read-only routes that tolerate slightly stale data from a secondary
+ROUTE_READ_PREFERENCES = {
+    "rfid_records": "secondaryPreferred",
+    "marked_dates": "secondaryPreferred",
+    "export": "secondaryPreferred",
+}
+
+READ_PREFERENCE_MODES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Upper bounds (ms) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Collects connection pool checkout wait times.
+
+    Checkout events are published on the thread doing the checkout, so the
+    start time is kept in a thread-local and matched on completion.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.failed_checkouts = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+            self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.connections_created = 0
+            self.connections_closed = 0
+
+    def _finish(self, failed):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        if started is None:
+            return
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            if failed:
+                self.failed_checkouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.buckets[i] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._finish(failed=False)
+
+    def connection_check_out_failed(self, event):
+        self._finish(failed=True)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    # The remaining pool events are not needed for the metrics
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound}ms" for bound in WAIT_BUCKETS_MS] + ["gt_5000ms"]
+            return {
+                "checkouts": self.checkouts,
+                "failedCheckouts": self.failed_checkouts,
+                "avgWaitMs": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "maxWaitMs": round(self.max_wait_ms, 3),
+                "waitHistogram": dict(zip(labels, self.buckets)),
+                "connectionsCreated": self.connections_created,
+                "connectionsClosed": self.connections_closed,
+                "openConnections": self.connections_created - self.connections_closed,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+# Commands whose replies carry documents back to the application
+READ_COMMANDS = frozenset({"find", "getMore", "aggregate", "findAndModify", "count", "distinct"})
+
+
+class ReadMetrics(monitoring.CommandListener):
+    """Bytes and documents read from MongoDB, per route.
+
+    Commands run on the thread that issued them, so the route is taken from
+    a thread-local set with ``set_route`` (once per request). Reply sizes
+    are measured by re-encoding the reply, which is why the listener is
+    only installed when MONGO_READ_METRICS=1.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+
+    def set_route(self, route):
+        self._local.route = route
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in READ_COMMANDS:
+            return
+        reply = event.reply
+        cursor = reply.get("cursor", {})
+        documents = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        if event.command_name == "findAndModify" and reply.get("value") is not None:
+            documents = 1
+        size = len(bson.encode(reply))
+        route = getattr(self._local, "route", None) or "background"
+        with self._lock:
+            stats = self.routes.setdefault(route, {"commands": 0, "documents": 0, "bytes": 0})
+            stats["commands"] += 1
+            stats["documents"] += documents
+            stats["bytes"] += size
+
+    def failed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            report = {}
+            for route, stats in sorted(self.routes.items(), key=lambda item: -item[1]["bytes"]):
+                report[route] = dict(
+                    stats,
+                    bytesPerCommand=round(stats["bytes"] / stats["commands"]) if stats["commands"] else 0
+                )
+            return report
+
+
+read_metrics = ReadMetrics()
+
+
+def _int_env(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def client_options():
+    """MongoClient keyword arguments built from the environment"""
+    options = {
+        "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE", 0),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        "event_listeners": [pool_metrics],
+    }
+    wait_queue_timeout = _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    if wait_queue_timeout is not None:
+        options["waitQueueTimeoutMS"] = wait_queue_timeout
+    max_idle_time = _int_env("MONGO_MAX_IDLE_TIME_MS")
+    if max_idle_time is not None:
+        options["maxIdleTimeMS"] = max_idle_time
+    if os.getenv("MONGO_READ_METRICS") == "1":
+        options["event_listeners"].append(read_metrics)
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def route_read_preferences():
+    """Per-route read preference names, with env overrides applied"""
+    preferences = dict(ROUTE_READ_PREFERENCES)
+    for item in os.getenv("MONGO_ROUTE_READ_PREFERENCES", "").split(","):
+        if "=" in item:
+            route, mode = item.split("=", 1)
+            preferences[route.strip()] = mode.strip()
+    return preferences
+
+
+def connect_to_db():
+    client = MongoClient(os.getenv("MONGODB_URI"), **client_options())
+    return client[DB_NAME]
+
+
+class LazyDatabase:
+    """Database handle that connects on first use, once per process.
+
+    MongoClient is not fork-safe, so a client created at import time in a
+    pre-forking server's master would be shared by every worker. This
+    proxy defers the connection to the first attribute access and opens a
+    fresh client whenever it finds itself in a different process.
+    """
+
+    def __init__(self, factory=connect_to_db):
+        self._factory = factory
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        pid = os.getpid()
+        if self._db is None or self._pid != pid:
+            with self._lock:
+                if self._db is None or self._pid != pid:
+                    self._db = self._factory()
+                    self._pid = pid
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, name):
+        return self._get()[name]
+
+
+_route_handles = {}
+
+
+def for_route(db, route):
+    """Database handle using the read preference configured for ``route``"""
+    # Keyed by process too, so a forked worker never reuses its parent's client
+    key = (os.getpid(), id(db), route)
+    handle = _route_handles.get(key)
+    if handle is None:
+        mode = route_read_preferences().get(route)
+        if not mode:
+            return db
+        handle = db.with_options(read_preference=READ_PREFERENCE_MODES[mode])
+        _route_handles[key] = handle
+    return handle
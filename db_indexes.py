@@ -0,0 +1,298 @@
+"""Index declarations and query-plan checks for the attendance database.
+
+Every index the API relies on is declared in ``INDEXES`` and created
+idempotently by ``ensure_indexes`` (at API startup and from the CLI).
+``QUERY_SHAPES`` lists the filter/sort shape of each route's hot query;
+``explain_queries`` runs ``explain()`` on them and reports any that would
+fall back to a collection scan.
+
+    python db_indexes.py                # create indexes
+    python db_indexes.py --explain      # create, then report query plans
+    python db_indexes.py --explain --strict   # exit 1 on any COLLSCAN
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# How long bulk export jobs and their files are kept (the API sweeps the
+# files on the same setting)
+EXPORT_TTL_SECONDS = int(os.getenv("EXPORT_TTL_SECONDS", "86400"))
+
+# An index exists under the same name with other options
+_INDEX_OPTIONS_CONFLICT = 85
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "users": [
+        ([("username", ASCENDING)], {"name": "uniq_username", "unique": True}),
+        ([("role", ASCENDING)], {"name": "role"}),
+    ],
+    "students": [
+        ([("rfidTag", ASCENDING)], {
+            "name": "uniq_rfid_tag",
+            "unique": True,
+            "partialFilterExpression": {"rfidTag": {"$type": "string"}}
+        }),
+        ([("batch", ASCENDING), ("rollNo", ASCENDING)], {"name": "batch_roll"}),
+        ([("updatedAt", ASCENDING)], {"name": "updated_at"}),
+    ],
+    "courses": [
+        ([("assignedBatches", ASCENDING)], {"name": "assigned_batches"}),
+    ],
+    "rfid_attendance": [
+        # Upsert target of every tap; unique so concurrent upserts cannot
+        # create two documents for the same day
+        ([("date", ASCENDING), ("batch", ASCENDING)], {"name": "uniq_rfid_date_batch", "unique": True}),
+        # Keyset pagination of /rfid/records: newest first, _id breaks ties
+        ([("batch", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], {"name": "batch_date_id"}),
+        ([("date", DESCENDING), ("_id", DESCENDING)], {"name": "date_id"}),
+    ],
+    "attendance": [
+        ([("date", ASCENDING), ("type", ASCENDING), ("batch", ASCENDING)], {
+            "name": "uniq_daily_date_batch",
+            "unique": True,
+            "partialFilterExpression": {"type": "daily"}
+        }),
+        # Upsert target of session results; unique so concurrent saves
+        # cannot create two records for the same session
+        ([("date", ASCENDING), ("batchId", ASCENDING), ("courseId", ASCENDING)], {
+            "name": "uniq_date_batch_course",
+            "unique": True,
+            "partialFilterExpression": {"batchId": {"$exists": True}}
+        }),
+        ([("batchId", ASCENDING), ("courseId", ASCENDING), ("date", DESCENDING)], {"name": "batch_course_date"}),
+    ],
+    "studentAttendance": [
+        # Per-student history reads, optionally narrowed to one course
+        ([("studentId", ASCENDING), ("date", DESCENDING)], {"name": "student_date"}),
+        ([("studentId", ASCENDING), ("courseId", ASCENDING), ("date", DESCENDING)], {"name": "student_course_date"}),
+    ],
+    "attendanceRollups": [
+        # Shortage lists: students under a percentage, worst first
+        ([("batch", ASCENDING), ("courseId", ASCENDING), ("percentage", ASCENDING)], {"name": "batch_course_percentage"}),
+        ([("courseId", ASCENDING), ("percentage", ASCENDING)], {"name": "course_percentage"}),
+    ],
+    "batchDayRollups": [
+        ([("batch", ASCENDING), ("date", ASCENDING)], {"name": "batch_date"}),
+    ],
+    "attendanceSessions": [
+        # GET /images/<digest>: sessions of the caller's batches that hold a frame
+        ([("capturedImages.sha256", ASCENDING), ("batchId", ASCENDING)], {"name": "captured_image_batch"}),
+    ],
+    "faceEmbeddings": [
+        # Gallery load: a batch's embeddings grouped by student
+        ([("batch", ASCENDING), ("studentId", ASCENDING)], {"name": "batch_student"}),
+        ([("studentId", ASCENDING)], {"name": "student"}),
+    ],
+    "revokedTokens": [
+        # A revoked token only needs tracking until it would have expired
+        ([("expiresAt", ASCENDING)], {"name": "expire_at", "expireAfterSeconds": 0}),
+    ],
+    "exportJobs": [
+        # Job documents expire EXPORT_TTL_SECONDS after creation; their
+        # files are swept from EXPORT_DIR on the same schedule
+        ([("createdAt", ASCENDING)], {"name": "expire_created_at", "expireAfterSeconds": EXPORT_TTL_SECONDS}),
+    ],
+    "sessionResultWrites": [
+        # Applied and failed saves are kept for idempotent retries until
+        # expireAt; pending ones have no expireAt and stay until replayed
+        ([("expireAt", ASCENDING)], {"name": "expire_at", "expireAfterSeconds": 0}),
+        # Replay claims: unleased entries by status
+        ([("status", ASCENDING), ("leaseUntil", ASCENDING)], {"name": "status_lease_until"}),
+    ],
+    "sessionResultLocks": [
+        # Per course-record save leases; a crashed holder's lock is swept
+        ([("leaseUntil", ASCENDING)], {"name": "expire_lease", "expireAfterSeconds": 0}),
+    ],
+    "maintenanceJobs": [
+        ([("createdAt", ASCENDING)], {"name": "expire_created_at", "expireAfterSeconds": 7 * 86400}),
+    ],
+    "recognitionJobs": [
+        # Results live on the session; job documents are only for status
+        ([("createdAt", ASCENDING)], {"name": "expire_created_at", "expireAfterSeconds": 86400}),
+    ],
+}
+
+# Indexes superseded by a declaration above; dropped so the replacement
+# (e.g. a unique index over the same keys) can be built
+SUPERSEDED_INDEXES = {
+    "attendance": ["date_batch_course"],
+    "rfid_attendance": ["batch_date"],
+}
+
+_SAMPLE_DAY = datetime(2024, 1, 1)
+
+# route -> (collection, filter, sort). Values are placeholders; only the
+# shape matters to the planner.
+QUERY_SHAPES = {
+    "POST /auth": ("users", {"username": "sample"}, None),
+    "GET /schedule/<username>": ("users", {"username": "sample"}, None),
+    "GET /assignedCourses/<username>": ("users", {"username": "sample"}, None),
+    "POST /attendance/sessions (professor)": ("users", {"role": "professor"}, None),
+    "POST /attendance/sessions (course)": ("courses", {"assignedBatches": "A"}, None),
+    "POST /rfid/attendance (tag)": ("students", {"rfidTag": "sample"}, None),
+    "POST /rfid/attendance (rfid day)": ("rfid_attendance", {"date": _SAMPLE_DAY, "batch": "A"}, None),
+    "POST /rfid/attendance (daily)": ("attendance", {"date": _SAMPLE_DAY, "type": "daily", "batch": "A"}, None),
+    "GET /rfid/records (batch)": ("rfid_attendance", {"batch": "A"}, [("date", DESCENDING), ("_id", DESCENDING)]),
+    "GET /rfid/records (date)": (
+        "rfid_attendance",
+        {"date": {"$gte": _SAMPLE_DAY, "$lt": datetime(2024, 1, 2)}},
+        [("date", DESCENDING), ("_id", DESCENDING)]
+    ),
+    "GET /attendance/daily": ("attendance", {"date": _SAMPLE_DAY, "type": "daily", "batch": "A"}, None),
+    "GET /attendance/marked-dates": ("attendance", {"batchId": "A", "courseId": "sample"}, None),
+    "GET /attendance/marked-dates (rfid)": ("rfid_attendance", {"batch": "A"}, None),
+    "GET /attendance/export": ("attendance", {"date": _SAMPLE_DAY, "batchId": "A", "courseId": "sample"}, None),
+    "POST /attendance/export/bulk": (
+        "attendance",
+        {"date": {"$gte": _SAMPLE_DAY, "$lte": datetime(2024, 1, 31)}, "batchId": {"$in": ["A", "B"]}},
+        [("date", ASCENDING), ("batchId", ASCENDING), ("courseId", ASCENDING)]
+    ),
+    "POST /attendance/sessions/<id>/results": (
+        "attendance",
+        {"date": _SAMPLE_DAY, "batchId": "A", "courseId": "sample"},
+        None
+    ),
+    "POST /attendance/verify (rfid)": ("rfid_attendance", {"date": _SAMPLE_DAY, "batch": "A"}, None),
+    "POST /attendance/verify (roster)": ("students", {"batch": "A"}, None),
+    "POST /attendance/verify (faces)": ("faceEmbeddings", {"batch": "A"}, [("studentId", ASCENDING)]),
+    "GET /images/<digest>": (
+        "attendanceSessions",
+        {"capturedImages.sha256": "sample", "batchId": {"$in": ["A", "B"]}},
+        None
+    ),
+    "POST /faces/enroll": ("students", {"batch": "A", "rollNo": "sample"}, None),
+    "GET /attendance/student/<id>": (
+        "studentAttendance",
+        {"studentId": "sample", "kind": "daily"},
+        [("date", DESCENDING)]
+    ),
+    "GET /reports/summary (shortages)": (
+        "attendanceRollups",
+        {"batch": "A", "courseId": "sample", "percentage": {"$lt": 75}},
+        [("percentage", ASCENDING)]
+    ),
+    "GET /reports/summary (days)": ("batchDayRollups", {"batch": "A"}, [("date", ASCENDING)]),
+    "GET /attendance/student/<id> (course)": (
+        "studentAttendance",
+        {"studentId": "sample", "courseId": "sample"},
+        [("date", DESCENDING)]
+    ),
+}
+
+
+def ensure_indexes(db):
+    """Create every declared index; existing ones are left untouched
+    apart from those listed in ``SUPERSEDED_INDEXES``, which are dropped,
+    and TTL indexes whose ``expireAfterSeconds`` changed, which are updated.
+
+    Returns a list of ``(collection, index name, error)`` for indexes that
+    could not be built, e.g. a unique index over duplicate legacy data.
+    """
+    failures = []
+    for collection_name, names in SUPERSEDED_INDEXES.items():
+        collection = db[collection_name]
+        try:
+            existing = collection.index_information()
+            for name in names:
+                if name in existing:
+                    collection.drop_index(name)
+        except Exception as e:
+            print(f"⚠️ Could not drop superseded indexes on {collection_name}: {e}")
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except OperationFailure as e:
+                if e.code != _INDEX_OPTIONS_CONFLICT or "expireAfterSeconds" not in options:
+                    print(f"⚠️ Could not create index {collection_name}.{options['name']}: {e}")
+                    failures.append((collection_name, options["name"], str(e)))
+                    continue
+                # A TTL setting changed: update the index in place
+                try:
+                    db.command("collMod", collection_name, index={
+                        "name": options["name"],
+                        "expireAfterSeconds": options["expireAfterSeconds"]
+                    })
+                except Exception as e:
+                    print(f"⚠️ Could not update TTL of {collection_name}.{options['name']}: {e}")
+                    failures.append((collection_name, options["name"], str(e)))
+            except Exception as e:
+                print(f"⚠️ Could not create index {collection_name}.{options['name']}: {e}")
+                failures.append((collection_name, options["name"], str(e)))
+    return failures
+
+
+def _plan_stages(plan):
+    """Yield every stage name in a (possibly nested) winning plan"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def explain_query(db, collection_name, query, sort=None):
+    cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = cursor.explain()
+    winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    stages = list(_plan_stages(winning_plan))
+    return {
+        "collection": collection_name,
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages
+    }
+
+
+def explain_queries(db, shapes=None):
+    """Explain each route's query shape; returns route -> plan summary"""
+    report = {}
+    for route, (collection_name, query, sort) in (shapes or QUERY_SHAPES).items():
+        try:
+            report[route] = explain_query(db, collection_name, query, sort)
+        except Exception as e:
+            report[route] = {"collection": collection_name, "stages": [], "collscan": None, "error": str(e)}
+    return report
+
+
+def print_report(report):
+    for route, summary in report.items():
+        if summary.get("error"):
+            status = f"ERROR {summary['error']}"
+        elif summary["collscan"]:
+            status = "❌ COLLSCAN"
+        else:
+            status = "✅ " + " <- ".join(summary["stages"])
+        print(f"{route:<45} {summary['collection']:<17} {status}")
+
+
+if __name__ == "__main__":
+    from database import connect_to_db
+
+    parser = argparse.ArgumentParser(description="Create indexes and check query plans")
+    parser.add_argument("--explain", action="store_true", help="report the winning plan of each route's query")
+    parser.add_argument("--strict", action="store_true", help="exit non-zero on any collection scan")
+    args = parser.parse_args()
+
+    db = connect_to_db()
+    failures = ensure_indexes(db)
+    exit_code = 1 if failures else 0
+
+    if args.explain:
+        report = explain_queries(db)
+        print_report(report)
+        if args.strict and any(summary["collscan"] for summary in report.values()):
+            exit_code = 1
+
+    sys.exit(exit_code)
@@ -0,0 +1,320 @@
+"""Constant-memory Excel export of attendance records.
+
+Rows come straight from a MongoDB aggregation cursor (one row per
+student, produced server-side with ``$unwind``) and are written with
+xlsxwriter's ``constant_memory`` mode, which flushes each row to disk as
+soon as the next one starts. Column widths are tracked during the same
+pass, so memory use does not depend on the size of the class.
+
+xlsx files are zip archives that xlsxwriter can only finalise on
+``close()``, so the workbook is assembled in a temporary file and then
+streamed to the client in chunks rather than held in a ``BytesIO``.
+"""
+import os
+import tempfile
+import zipfile
+
+import xlsxwriter
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+ATTENDANCE_COLUMNS = ["Roll Number", "Name", "Status", "Face Recognition", "RFID Check-in", "Possible Proxy"]
+ROW_FIELDS = ["rollNo", "name", "status", "faceRecognition", "rfidCheckIn", "possibleProxy"]
+
+SUMMARY_COLUMNS = [
+    "Date", "Batch", "Course Name", "Course ID", "Total Students",
+    "Present", "Absent", "Faculty Name", "Faculty ID"
+]
+
+# Everything except the per-student arrays, for the summary sheet
+HEADER_PROJECTION = {"presentStudents": 0, "absentStudents": 0, "verificationData": 0}
+
+
+def _student_rows(array_field, status):
+    return {"$map": {
+        "input": {"$ifNull": [f"${array_field}", []]},
+        "as": "s",
+        "in": {
+            "rollNo": {"$ifNull": ["$$s.rollNo", ""]},
+            "name": {"$ifNull": ["$$s.name", ""]},
+            "status": status,
+            "faceRecognition": {"$ifNull": ["$$s.verificationData.faceRecognition.status", False]},
+            "rfidCheckIn": {"$ifNull": ["$$s.verificationData.rfidCheckIn.status", False]},
+            "possibleProxy": {"$ifNull": ["$$s.verificationData.possibleProxy", False]}
+        }
+    }}
+
+
+def attendance_rows_pipeline(match):
+    """Aggregation yielding one flat row per student, present students first"""
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0,
+            "row": {"$concatArrays": [
+                _student_rows("presentStudents", "Present"),
+                _student_rows("absentStudents", "Absent")
+            ]}
+        }},
+        {"$unwind": "$row"},
+        {"$replaceRoot": {"newRoot": "$row"}}
+    ]
+
+
+class _ColumnWidths:
+    """Running max of cell text length per column"""
+
+    def __init__(self, headers):
+        self.widths = [len(header) + 2 for header in headers]
+
+    def update(self, values):
+        for i, value in enumerate(values):
+            length = len(str(value))
+            if length > self.widths[i]:
+                self.widths[i] = length
+
+    def apply(self, worksheet):
+        for i, width in enumerate(self.widths):
+            worksheet.set_column(i, i, width)
+
+
+class AttendanceWorkbook:
+    """Workbook writer with the report's formats, rows written in one pass"""
+
+    def __init__(self, path):
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.header_format = self.workbook.add_format({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'top',
+            'fg_color': '#D9D9D9',
+            'border': 1
+        })
+        self.present_format = self.workbook.add_format({
+            'bg_color': '#E2F0D9',  # Light green
+            'border': 1
+        })
+        self.absent_format = self.workbook.add_format({
+            'bg_color': '#FBE5D6',  # Light red/orange
+            'border': 1
+        })
+
+    def write_sheet(self, name, headers, rows, row_format=None):
+        """Write ``rows`` (sequences of cell values) below a formatted header.
+
+        ``row_format`` picks a format per row; returns the number of rows.
+        """
+        worksheet = self.workbook.add_worksheet(name)
+        widths = _ColumnWidths(headers)
+        worksheet.write_row(0, 0, headers, self.header_format)
+
+        count = 0
+        for count, values in enumerate(rows, start=1):
+            worksheet.write_row(count, 0, values, row_format(values) if row_format else None)
+            widths.update(values)
+
+        widths.apply(worksheet)
+        return count
+
+    def write_attendance(self, name, rows):
+        """Write attendance rows (dicts from ``attendance_rows_pipeline``).
+
+        Returns ``(present, absent)`` counts.
+        """
+        counts = {"Present": 0, "Absent": 0}
+
+        def values():
+            for row in rows:
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+                yield [row.get(field, "") for field in ROW_FIELDS]
+
+        self.write_sheet(
+            name, ATTENDANCE_COLUMNS, values(),
+            lambda values: self.present_format if values[2] == "Present" else self.absent_format
+        )
+        return counts["Present"], counts["Absent"]
+
+    def close(self):
+        self.workbook.close()
+
+
+def summary_row(record, date_str, batch_id, present, absent):
+    return [
+        date_str,
+        batch_id,
+        record.get('courseName', 'N/A'),
+        record.get('courseId', 'N/A'),
+        present + absent,
+        record.get('totalPresent', present),
+        record.get('totalAbsent', absent),
+        record.get('facultyName', 'N/A'),
+        record.get('facultyId', 'N/A')
+    ]
+
+
+def export_attendance_record(collection, record, date_str, batch_id):
+    """Build the single-record report in a temporary file; returns its path"""
+    fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="attendance_")
+    os.close(fd)
+    try:
+        workbook = AttendanceWorkbook(path)
+        rows = collection.aggregate(attendance_rows_pipeline({"_id": record["_id"]}))
+        present, absent = workbook.write_attendance("Attendance", rows)
+        workbook.write_sheet("Summary", SUMMARY_COLUMNS, [summary_row(record, date_str, batch_id, present, absent)])
+        workbook.close()
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
+def stream_file(path, chunk_size=STREAM_CHUNK_SIZE, remove=True):
+    """Yield a file in chunks, deleting it once fully sent (or abandoned)"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+# ----------------------------------------------------------------------
+# Bulk export: many dates, batches and courses from a single aggregation
+# ----------------------------------------------------------------------
+BULK_COLUMNS = ["Date", "Batch", "Course"] + ATTENDANCE_COLUMNS
+
+RECORD_FIELDS = [
+    "date", "batchId", "courseId", "courseName", "facultyId",
+    "facultyName", "totalPresent", "totalAbsent"
+]
+
+
+def bulk_rows_pipeline(match):
+    """One row per student across every matching record, grouped by record.
+
+    Records with no students still yield one row (with no ``row`` field)
+    so they appear in the summary.
+    """
+    return [
+        {"$match": match},
+        {"$sort": {"date": 1, "batchId": 1, "courseId": 1}},
+        {"$project": {
+            **{field: 1 for field in RECORD_FIELDS},
+            "row": {"$concatArrays": [
+                _student_rows("presentStudents", "Present"),
+                _student_rows("absentStudents", "Absent")
+            ]}
+        }},
+        {"$unwind": {"path": "$row", "preserveNullAndEmptyArrays": True}}
+    ]
+
+
+def _group_by_record(cursor):
+    """Yield ``(record, rows)`` for consecutive cursor rows of the same record"""
+    current_id = None
+    record = None
+    rows = []
+    for doc in cursor:
+        if doc["_id"] != current_id:
+            if record is not None:
+                yield record, rows
+            current_id = doc["_id"]
+            record = {field: doc.get(field) for field in RECORD_FIELDS}
+            record["_id"] = doc["_id"]
+            rows = []
+        if doc.get("row"):
+            rows.append(doc["row"])
+    if record is not None:
+        yield record, rows
+
+
+def _record_date_str(record):
+    date = record.get("date")
+    return date.strftime("%Y-%m-%d") if date else ""
+
+
+def write_bulk_workbook(path, cursor, progress=None):
+    """Single workbook: every student row on one sheet, one summary row per record.
+
+    Rows of one record are buffered only while that record is written.
+    Returns the number of records exported.
+    """
+    workbook = AttendanceWorkbook(path)
+    attendance = workbook.workbook.add_worksheet("Attendance")
+    summary = workbook.workbook.add_worksheet("Summary")
+    attendance_widths = _ColumnWidths(BULK_COLUMNS)
+    summary_widths = _ColumnWidths(SUMMARY_COLUMNS)
+    attendance.write_row(0, 0, BULK_COLUMNS, workbook.header_format)
+    summary.write_row(0, 0, SUMMARY_COLUMNS, workbook.header_format)
+
+    row_num = 0
+    records = 0
+    for record, rows in _group_by_record(cursor):
+        date_str = _record_date_str(record)
+        course = record.get("courseName") or record.get("courseId") or ""
+        present = absent = 0
+        for row in rows:
+            values = [date_str, record.get("batchId", ""), course] + [row.get(field, "") for field in ROW_FIELDS]
+            row_num += 1
+            is_present = row["status"] == "Present"
+            attendance.write_row(row_num, 0, values, workbook.present_format if is_present else workbook.absent_format)
+            attendance_widths.update(values)
+            if is_present:
+                present += 1
+            else:
+                absent += 1
+
+        records += 1
+        values = summary_row(
+            {k: v for k, v in record.items() if v is not None},
+            date_str, record.get("batchId", ""), present, absent
+        )
+        summary.write_row(records, 0, values)
+        summary_widths.update(values)
+        if progress:
+            progress(records)
+
+    attendance_widths.apply(attendance)
+    summary_widths.apply(summary)
+    workbook.close()
+    return records
+
+
+def write_bulk_zip(path, cursor, progress=None):
+    """Zip of per-record workbooks, each in the single-record report layout.
+
+    Returns the number of records exported.
+    """
+    records = 0
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for record, rows in _group_by_record(cursor):
+            fd, part_path = tempfile.mkstemp(suffix=".xlsx", prefix="attendance_part_")
+            os.close(fd)
+            try:
+                date_str = _record_date_str(record)
+                batch_id = record.get("batchId", "")
+                workbook = AttendanceWorkbook(part_path)
+                present, absent = workbook.write_attendance("Attendance", rows)
+                workbook.write_sheet("Summary", SUMMARY_COLUMNS, [summary_row(
+                    {k: v for k, v in record.items() if v is not None},
+                    date_str, batch_id, present, absent
+                )])
+                workbook.close()
+
+                course_name = (record.get("courseName") or "Unknown").replace(" ", "_")
+                archive.write(part_path, f"attendance_{batch_id}_{course_name}_{date_str}.xlsx")
+            finally:
+                os.unlink(part_path)
+            records += 1
+            if progress:
+                progress(records)
+    return records
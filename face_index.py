@@ -0,0 +1,429 @@
+"""Campus-wide approximate nearest-neighbour search over enrolled faces.
+
+A batch's own gallery (``face_matcher``) is searched exhaustively; a face
+that matches nobody there is looked up across every enrolled student to
+tell "belongs to another batch" apart from "unknown". At campus scale an
+exhaustive search would touch every embedding for every such face, so
+this index is an IVF (inverted file) index in pure NumPy:
+
+* Embeddings are clustered around ``nlist`` spherical k-means centroids
+  and stored sorted by cluster, so each inverted list is one contiguous
+  slice of the vector matrix.
+* A search scores the centroids, then only the ``nprobe`` closest lists
+  (one small matmul per list for all faces that probe it). ``nprobe`` is
+  the recall/latency knob: ``nprobe == nlist`` is an exact search.
+
+The index is a snapshot on disk (``FACE_INDEX_DIR``), loaded memory-mapped
+so every worker shares the same pages. It is kept in step with
+``faceEmbeddings`` incrementally: embeddings enrolled since the snapshot
+are held in a small in-memory delta that is searched exhaustively, and
+removed ones are masked out. Once the delta grows past
+``COMPACT_MIN_ROWS`` (or a tenth of the snapshot) it is folded into a new
+snapshot, assigned to the existing centroids. Retrain the centroids with
+
+    python face_index.py --build [--lists N]
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from bson import ObjectId
+
+from face_matcher import DEFAULT_THRESHOLD, EMBEDDINGS_COLLECTION, decode_embedding, normalize
+
+INDEX_DIR = os.getenv("FACE_INDEX_DIR", "face_index")
+DEFAULT_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "16"))
+
+# Below this many embeddings an exhaustive search is as fast; the delta
+# is also compacted once it holds this many rows
+COMPACT_MIN_ROWS = 2000
+
+KMEANS_ITERATIONS = 10
+# Training sample per centroid
+KMEANS_SAMPLE_PER_LIST = 64
+
+ROW_FIELDS = {"studentId": 1, "rollNo": 1, "name": 1, "batch": 1, "embedding": 1, "threshold": 1}
+
+
+def default_lists(rows):
+    """``nlist`` for ``rows`` embeddings: about sqrt(rows)"""
+    return int(min(4096, max(1, round(np.sqrt(rows)))))
+
+
+def train_centroids(vectors, nlist, seed=0):
+    """Spherical k-means on (a sample of) unit ``vectors``"""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = (sample @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=nlist)
+        # Re-seed empty clusters with random sample points
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_size, size=len(empty))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over unit float32 embeddings.
+
+    Rows carry an id (the ``faceEmbeddings`` ``_id``) and the index of
+    their student in ``students`` (dicts with studentId, rollNo, name,
+    batch and threshold).
+    """
+
+    def __init__(self, centroids=None, vectors=None, offsets=None, row_ids=(), row_students=None,
+                 students=(), nprobe=DEFAULT_NPROBE):
+        self.nprobe = nprobe
+        self.centroids = centroids
+        self.vectors = vectors
+        self.offsets = offsets
+        self.row_ids = list(row_ids)
+        self.row_students = row_students if row_students is not None else np.zeros(0, dtype=np.int32)
+        self.alive = np.ones(len(self.row_ids), dtype=bool)
+        self.removed = 0
+        self.row_by_id = {row_id: row for row, row_id in enumerate(self.row_ids)}
+
+        self.students = [dict(student) for student in students]
+        self.student_by_id = {student["studentId"]: i for i, student in enumerate(self.students)}
+
+        # Embeddings added since the snapshot, searched exhaustively
+        self.delta_ids = []
+        self.delta_students = []
+        self.delta_vectors = []
+        self._delta_matrix = None
+
+    # ------------------------------------------------------------------
+    # Building and persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, rows, nlist=None, nprobe=DEFAULT_NPROBE):
+        """Train and fill an index from ``(row_id, student, vector)`` rows"""
+        index = cls(nprobe=nprobe)
+        for row_id, student, vector in rows:
+            index.add(row_id, student, vector)
+        return index.compacted(nlist or default_lists(len(index.delta_ids)), retrain=True)
+
+    def compacted(self, nlist=None, retrain=False):
+        """A new index holding every live row in sorted inverted lists"""
+        ids, owners, parts = [], [], []
+        if self.vectors is not None and len(self.row_ids):
+            live = np.flatnonzero(self.alive)
+            ids.extend(self.row_ids[i] for i in live)
+            owners.append(np.asarray(self.row_students)[live])
+            parts.append(np.asarray(self.vectors)[live])
+        if self.delta_ids:
+            ids.extend(self.delta_ids)
+            owners.append(np.asarray(self.delta_students, dtype=np.int32))
+            parts.append(self._delta())
+        if not ids:
+            return IVFIndex(students=self.students, nprobe=self.nprobe)
+
+        vectors = np.vstack(parts)
+        owners = np.concatenate(owners).astype(np.int32)
+        centroids = self.centroids
+        if retrain or centroids is None:
+            centroids = train_centroids(vectors, nlist or default_lists(len(vectors)))
+        lists = (vectors @ centroids.T).argmax(axis=1)
+        order = np.argsort(lists, kind="stable")
+        offsets = np.r_[0, np.cumsum(np.bincount(lists, minlength=len(centroids)))].astype(np.int64)
+        return IVFIndex(
+            centroids, np.ascontiguousarray(vectors[order]), offsets,
+            [ids[i] for i in order], owners[order], self.students, self.nprobe
+        )
+
+    def save(self, directory):
+        """Write a new snapshot version and point ``CURRENT`` at it"""
+        os.makedirs(directory, exist_ok=True)
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "row_students.npy"), self.row_students)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"rowIds": self.row_ids, "students": self.students}, f)
+
+        pointer = os.path.join(directory, f"CURRENT.{version}")
+        with open(pointer, "w") as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(directory, "CURRENT"))
+        _remove_old_versions(directory, keep=(version,))
+        return version
+
+    @classmethod
+    def load(cls, directory, nprobe=DEFAULT_NPROBE):
+        """Open the current snapshot, with the vectors memory-mapped.
+
+        Returns ``(index, version)``, or ``(None, None)`` without one.
+        """
+        version = current_version(directory)
+        if version is None:
+            return None, None
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(
+            np.load(os.path.join(path, "centroids.npy")),
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "offsets.npy")),
+            meta["rowIds"],
+            np.load(os.path.join(path, "row_students.npy")),
+            meta["students"],
+            nprobe
+        )
+        return index, version
+
+    # ------------------------------------------------------------------
+    # Incremental changes
+    # ------------------------------------------------------------------
+    def _student_index(self, student):
+        index = self.student_by_id.get(student["studentId"])
+        if index is None:
+            index = len(self.students)
+            self.students.append(dict(student))
+            self.student_by_id[student["studentId"]] = index
+        else:
+            # Roll number, name or batch may have changed since enrolment
+            self.students[index] = dict(student)
+        return index
+
+    def add(self, row_id, student, vector):
+        self.delta_ids.append(row_id)
+        self.delta_students.append(self._student_index(student))
+        self.delta_vectors.append(np.asarray(vector, dtype=np.float32))
+        self._delta_matrix = None
+
+    def remove(self, row_id):
+        row = self.row_by_id.pop(row_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.removed += 1
+            return True
+        if row_id in self.delta_ids:
+            position = self.delta_ids.index(row_id)
+            del self.delta_ids[position], self.delta_students[position], self.delta_vectors[position]
+            self._delta_matrix = None
+            return True
+        return False
+
+    def ids(self):
+        return set(self.row_by_id) | set(self.delta_ids)
+
+    def _delta(self):
+        if self._delta_matrix is None:
+            self._delta_matrix = normalize(self.delta_vectors) if self.delta_vectors else None
+        return self._delta_matrix
+
+    def needs_compaction(self):
+        pending = len(self.delta_ids) + self.removed
+        return pending >= max(COMPACT_MIN_ROWS, len(self.row_ids) // 10)
+
+    def __len__(self):
+        return len(self.row_by_id) + len(self.delta_ids)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(self, probes, nprobe=None):
+        """Nearest live embedding per probe: ``(scores, student indices)``.
+
+        Probes with nothing to compare against get score -inf and student
+        -1. Only the ``nprobe`` closest inverted lists are scanned.
+        """
+        probes = normalize(probes)
+        best_scores = np.full(len(probes), -np.inf, dtype=np.float32)
+        best_students = np.full(len(probes), -1, dtype=np.intp)
+
+        def keep_better(faces, scores, owners):
+            columns = scores.argmax(axis=1)
+            values = scores[np.arange(len(faces)), columns]
+            better = values > best_scores[faces]
+            best_scores[faces[better]] = values[better]
+            best_students[faces[better]] = owners[columns[better]]
+
+        if self.vectors is not None and len(self.row_ids) and len(probes):
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            coarse = probes @ self.centroids.T
+            probed = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+            for inverted_list in np.unique(probed):
+                start, end = self.offsets[inverted_list], self.offsets[inverted_list + 1]
+                if start == end:
+                    continue
+                faces = np.flatnonzero((probed == inverted_list).any(axis=1))
+                scores = probes[faces] @ self.vectors[start:end].T
+                if self.removed:
+                    dead = ~self.alive[start:end]
+                    if dead.all():
+                        continue
+                    scores[:, dead] = -np.inf
+                keep_better(faces, scores, self.row_students[start:end])
+
+        delta = self._delta()
+        if delta is not None and len(probes):
+            keep_better(np.arange(len(probes)), probes @ delta.T, np.asarray(self.delta_students))
+        return best_scores, best_students
+
+    def stats(self):
+        return {
+            "embeddings": len(self),
+            "students": len(self.student_by_id),
+            "lists": 0 if self.centroids is None else int(len(self.centroids)),
+            "nprobe": self.nprobe,
+            "snapshotRows": len(self.row_ids),
+            "deltaRows": len(self.delta_ids),
+            "removedRows": self.removed
+        }
+
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _remove_old_versions(directory, keep, previous=1):
+    """Drop superseded snapshots, keeping the newest ``previous`` others.
+
+    Versions sort by creation time. Workers still mapping a removed
+    snapshot keep their pages until they reload.
+    """
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if name not in keep and os.path.isdir(os.path.join(directory, name))
+    )
+    for name in versions[:-previous] if previous else versions:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _row(doc):
+    student = {
+        "studentId": doc["studentId"],
+        "rollNo": doc.get("rollNo", ""),
+        "name": doc.get("name", ""),
+        "batch": doc.get("batch"),
+        "threshold": doc.get("threshold")
+    }
+    return str(doc["_id"]), student, decode_embedding(doc["embedding"])
+
+
+class CampusFaceIndex:
+    """The IVF index kept in step with ``faceEmbeddings``.
+
+    Changes are picked up at most every ``sync_interval`` seconds (and
+    straight after ``sync()``) by comparing embedding ids, so enrolments
+    made through any worker reach every worker.
+    """
+
+    def __init__(self, db, directory=INDEX_DIR, nprobe=DEFAULT_NPROBE,
+                 default_threshold=DEFAULT_THRESHOLD, sync_interval=60):
+        self.db = db
+        self.directory = directory
+        self.nprobe = nprobe
+        self.default_threshold = default_threshold
+        self.sync_interval = sync_interval
+        self.index = None
+        self.version = None
+        self._synced_at = None
+        self._lock = threading.RLock()
+
+    @property
+    def collection(self):
+        return self.db[EMBEDDINGS_COLLECTION]
+
+    def load(self):
+        """Map the on-disk snapshot (no database access)"""
+        index, version = IVFIndex.load(self.directory, self.nprobe)
+        with self._lock:
+            self.index = index or IVFIndex(nprobe=self.nprobe)
+            self.version = version
+        return len(self.index)
+
+    def build(self, nlist=None):
+        """Retrain the index from every enrolled embedding and save it"""
+        rows = (_row(doc) for doc in self.collection.find({}, ROW_FIELDS))
+        index = IVFIndex.build(rows, nlist, self.nprobe)
+        version = index.save(self.directory) if len(index) else None
+        with self._lock:
+            self.index, self.version = index, version
+            self._synced_at = time.monotonic()
+        return index.stats()
+
+    def sync(self):
+        """Apply embeddings added or removed since the index was built"""
+        with self._lock:
+            if self.index is None or current_version(self.directory) != self.version:
+                self.load()
+            index = self.index
+            stored = {str(doc["_id"]) for doc in self.collection.find({}, {"_id": 1})}
+            known = index.ids()
+            for row_id in known - stored:
+                index.remove(row_id)
+            added = [ObjectId(row_id) for row_id in stored - known]
+            if added:
+                for doc in self.collection.find({"_id": {"$in": added}}, ROW_FIELDS):
+                    index.add(*_row(doc))
+            if index.needs_compaction():
+                self.index = index.compacted()
+                self.version = self.index.save(self.directory) if len(self.index) else None
+            self._synced_at = time.monotonic()
+            return {"added": len(added), "removed": len(known - stored)}
+
+    def _fresh(self):
+        if self._synced_at is None or time.monotonic() - self._synced_at > self.sync_interval:
+            self.sync()
+        return self.index
+
+    def lookup(self, probes, nprobe=None):
+        """Best enrolled student per probe, or None below their threshold.
+
+        Each hit is the student's dict plus ``confidence``.
+        """
+        with self._lock:
+            index = self._fresh()
+            scores, owners = index.search(probes, nprobe)
+            students = index.students
+        hits = []
+        for score, owner in zip(scores, owners):
+            if owner < 0:
+                hits.append(None)
+                continue
+            student = students[owner]
+            threshold = student.get("threshold")
+            if score < (self.default_threshold if threshold is None else threshold):
+                hits.append(None)
+                continue
+            hit = {key: value for key, value in student.items() if key != "threshold"}
+            hits.append(dict(hit, confidence=round(float(score), 4)))
+        return hits
+
+    def stats(self):
+        with self._lock:
+            if self.index is None:
+                return {"loaded": False}
+            return dict(self.index.stats(), loaded=True, version=self.version)
+
+
+if __name__ == "__main__":
+    from database import connect_to_db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--build", action="store_true", help="retrain and save the index from faceEmbeddings")
+    parser.add_argument("--lists", type=int, help="number of inverted lists (default about sqrt(embeddings))")
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"✅ Built face index: {CampusFaceIndex(connect_to_db()).build(args.lists)}")
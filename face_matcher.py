@@ -0,0 +1,258 @@
+"""Face matching against enrolled FaceNet embeddings, on the CPU.
+
+Each batch's enrolled embeddings are held as one contiguous, L2-normalised
+float32 matrix (one row per enrolment photo, rows grouped by student).
+Every face found in a classroom frame is matched in a single matrix
+multiply: cosine similarity is a dot product of unit vectors, and
+``np.maximum.reduceat`` folds a student's rows into their best score.
+
+A face counts for the one student it matches best, and only if that
+score reaches the student's threshold (per-student when enrolled with
+one, otherwise FACE_MATCH_THRESHOLD), so one face never confirms two
+students.
+
+``Gallery`` is pure NumPy, with no database access, so it can be
+benchmarked on its own (``benchmarks/bench_face_matcher.py``);
+``FaceMatcher`` loads galleries from ``faceEmbeddings`` and caches them
+per batch.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import Binary
+
+EMBEDDINGS_COLLECTION = "faceEmbeddings"
+
+DEFAULT_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", "0.7"))
+
+
+def normalize(vectors):
+    """Rows scaled to unit length, as a C-contiguous float32 matrix"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2, order="C")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    matrix /= norms
+    return matrix
+
+
+def encode_embedding(vector):
+    """Stored form of one embedding: raw little-endian float32 bytes"""
+    return Binary(np.asarray(vector, dtype="<f4").tobytes())
+
+
+def decode_embedding(data):
+    return np.frombuffer(data, dtype="<f4")
+
+
+class MatchResult:
+    """Outcome of matching one frame's faces against a gallery"""
+
+    def __init__(self, gallery, scores):
+        self.gallery = gallery
+        self.face_count = scores.shape[0]
+        if scores.size:
+            # Best student per face, accepted only above that student's threshold
+            self.face_students = scores.argmax(axis=1)
+            self.face_scores = scores[np.arange(self.face_count), self.face_students]
+            accepted = self.face_scores >= gallery.thresholds[self.face_students]
+            self.face_students = np.where(accepted, self.face_students, -1)
+            self.confidences = scores.max(axis=0)
+        else:
+            self.face_students = np.full(self.face_count, -1, dtype=np.intp)
+            self.face_scores = np.zeros(self.face_count, dtype=np.float32)
+            self.confidences = np.zeros(len(gallery.students), dtype=np.float32)
+        self.recognized = np.zeros(len(gallery.students), dtype=bool)
+        self.recognized[self.face_students[self.face_students >= 0]] = True
+
+    def recognized_students(self):
+        """Matched students with their best similarity, highest first"""
+        indices = np.flatnonzero(self.recognized)
+        indices = indices[np.argsort(-self.confidences[indices])]
+        return [
+            dict(self.gallery.students[i], confidence=round(float(self.confidences[i]), 4))
+            for i in indices
+        ]
+
+    def labels(self):
+        """``"rollNo_name"`` labels, the format the model server returns"""
+        return [f"{s['rollNo']}_{s['name']}" for s in self.recognized_students()]
+
+    def confidences_by_roll(self):
+        """rollNo -> best similarity, for every enrolled student"""
+        return {
+            student["rollNo"]: round(float(confidence), 4)
+            for student, confidence in zip(self.gallery.students, self.confidences)
+        }
+
+    def unknown_faces(self):
+        """Indices of faces that matched nobody in the gallery"""
+        return np.flatnonzero(self.face_students < 0).tolist()
+
+
+class Gallery:
+    """Enrolled embeddings of one batch as a single float32 matrix"""
+
+    def __init__(self, students, embeddings, owners, thresholds):
+        """``owners[i]`` is the index in ``students`` of row ``i``; rows of a
+        student must be adjacent"""
+        self.students = students
+        self.matrix = normalize(embeddings) if len(embeddings) else np.zeros((0, 0), dtype=np.float32)
+        self.owners = np.asarray(owners, dtype=np.intp)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        # First row of each student's block, for reduceat
+        self.starts = np.flatnonzero(np.r_[True, self.owners[1:] != self.owners[:-1]]) if len(self.owners) else self.owners
+        self.one_row_each = len(self.owners) == len(students)
+
+    @classmethod
+    def from_students(cls, enrolled, default_threshold=DEFAULT_THRESHOLD):
+        """Build from ``(student, vectors, threshold or None)`` tuples"""
+        students, rows, owners, thresholds = [], [], [], []
+        for index, (student, vectors, threshold) in enumerate(enrolled):
+            students.append(student)
+            thresholds.append(default_threshold if threshold is None else threshold)
+            for vector in vectors:
+                rows.append(vector)
+                owners.append(index)
+        if len({len(row) for row in rows}) > 1:
+            raise ValueError("Enrolled embeddings have different dimensions")
+        return cls(students, rows, owners, thresholds)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if self.matrix.size else None
+
+    def __len__(self):
+        return len(self.students)
+
+    def scores(self, probes):
+        """``(faces, students)`` best cosine similarity of each face to each student"""
+        if not len(self.students) or not len(probes):
+            return np.zeros((len(probes), len(self.students)), dtype=np.float32)
+        similarities = normalize(probes) @ self.matrix.T
+        if self.one_row_each:
+            return similarities
+        return np.maximum.reduceat(similarities, self.starts, axis=1)
+
+    def match(self, probes):
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.size == 0:
+            probes = np.zeros((0, self.dimension or 0), dtype=np.float32)
+        elif probes.ndim == 1:
+            probes = probes.reshape(1, -1)
+        if len(probes) and self.dimension and probes.shape[1] != self.dimension:
+            raise ValueError(f"Face embeddings must have {self.dimension} dimensions")
+        return MatchResult(self, self.scores(probes))
+
+
+class FaceMatcher:
+    """Per-batch galleries loaded from ``faceEmbeddings`` and kept in memory.
+
+    A gallery is reloaded after ``ttl`` seconds, or straight away after an
+    enrolment through this matcher.
+    """
+
+    def __init__(self, db, default_threshold=DEFAULT_THRESHOLD, ttl=300):
+        self.db = db
+        self.default_threshold = default_threshold
+        self.ttl = ttl
+        self._galleries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self.db[EMBEDDINGS_COLLECTION]
+
+    def load(self, batch):
+        """Read a batch's enrolments into a new Gallery"""
+        cursor = self.collection.find(
+            {"batch": batch},
+            {"studentId": 1, "rollNo": 1, "name": 1, "embedding": 1, "threshold": 1}
+        ).sort("studentId", 1)
+        enrolled = []
+        for doc in cursor:
+            if not enrolled or enrolled[-1][0]["studentId"] != doc["studentId"]:
+                student = {"studentId": doc["studentId"], "rollNo": doc.get("rollNo", ""), "name": doc.get("name", "")}
+                enrolled.append((student, [], doc.get("threshold")))
+            enrolled[-1][1].append(decode_embedding(doc["embedding"]))
+        return Gallery.from_students(enrolled, self.default_threshold)
+
+    def gallery(self, batch):
+        cached = self._galleries.get(batch)
+        if cached is None or time.monotonic() - cached[1] > self.ttl:
+            gallery = self.load(batch)
+            with self._lock:
+                self._galleries[batch] = (gallery, time.monotonic())
+            return gallery
+        return cached[0]
+
+    def invalidate(self, batch=None):
+        with self._lock:
+            if batch is None:
+                self._galleries.clear()
+            else:
+                self._galleries.pop(batch, None)
+
+    def match(self, batch, probes):
+        return self.gallery(batch).match(probes)
+
+    def enroll(self, student, vectors, threshold=None, replace=True):
+        """Store a student's embeddings (``replace`` drops earlier ones).
+
+        ``student`` needs ``_id``, ``rollNo``, ``name`` and ``batch``.
+        """
+        try:
+            vectors = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+        except (ValueError, TypeError):
+            raise ValueError("embeddings must be a non-empty list of equal-length vectors")
+        if not vectors or len({vector.shape for vector in vectors}) != 1 or vectors[0].ndim != 1 or not vectors[0].size:
+            raise ValueError("embeddings must be a non-empty list of equal-length vectors")
+        # One NaN row would win every argmax and fail every threshold,
+        # hiding the whole batch; a zero row has no direction
+        if not all(np.isfinite(vector).all() and vector.any() for vector in vectors):
+            raise ValueError("embeddings must be finite and not all zero")
+        if threshold is not None:
+            if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+                raise ValueError("threshold must be a number in (0, 1] or null")
+            threshold = float(threshold)
+
+        student_id = str(student["_id"])
+        # Galleries (and the campus index) hold one matrix, so every
+        # enrolment must match the dimension already stored
+        others = {"studentId": {"$ne": student_id}} if replace else {}
+        existing = self.collection.find_one(others, {"dim": 1})
+        if existing and existing.get("dim") and existing["dim"] != vectors[0].shape[0]:
+            raise ValueError(f"embeddings must have {existing['dim']} dimensions, like those already enrolled")
+        if replace:
+            self.collection.delete_many({"studentId": student_id})
+        now = datetime.now()
+        self.collection.insert_many([
+            {
+                "studentId": student_id,
+                "rollNo": student.get("rollNo", ""),
+                "name": student.get("name", ""),
+                "batch": student.get("batch"),
+                "embedding": encode_embedding(vector),
+                "dim": int(vector.shape[0]),
+                "threshold": threshold,
+                "createdAt": now
+            }
+            for vector in vectors
+        ])
+        self.invalidate(student.get("batch"))
+        return len(vectors)
+
+    def stats(self):
+        with self._lock:
+            galleries = {batch: gallery for batch, (gallery, _) in self._galleries.items()}
+        return {
+            batch: {
+                "students": len(gallery),
+                "embeddings": int(gallery.matrix.shape[0]),
+                "dimension": gallery.dimension,
+                "bytes": int(gallery.matrix.nbytes)
+            }
+            for batch, gallery in galleries.items()
+        }
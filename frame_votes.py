@@ -0,0 +1,210 @@
+"""Combining face recognition over several frames of one class.
+
+A single photo misses students who looked away or were hidden, and each
+miss of an RFID-checked-in student becomes a ``possibleProxy`` flag.
+With several frames per session, each frame casts one vote per student
+it recognises, and the votes are kept in arrays indexed like the batch
+gallery's students:
+
+* ``hits``: frames the student was recognised in,
+* ``best`` / ``total``: best and summed per-frame similarity (the mean
+  is ``total / hits``).
+
+``VoteRule`` turns the votes into decisions with two k-of-n thresholds
+that grow with the number of frames ``n``:
+
+* recognised by face alone: at least ``max(min_hits, min_fraction * n)``
+  hits, so a lookalike matched now and then is not marked present;
+* confirming an RFID check-in: at least ``rfid_fraction * n`` hits (at
+  least one). This is lower, since the card corroborates the face; a
+  student below it is flagged as a possible proxy (see
+  ``attendance_reconcile``), so one turned head no longer raises a flag.
+
+Neither threshold exceeds ``n``, so a single frame behaves as before.
+Defaults come from ``FACE_VOTE_MIN_HITS`` (2), ``FACE_VOTE_MIN_FRACTION``
+(0.3) and ``FACE_VOTE_RFID_FRACTION`` (0.15);
+``benchmarks/bench_frame_votes.py`` shows their effect.
+"""
+import math
+import os
+
+import numpy as np
+
+from attendance_reconcile import parse_recognized_student
+
+
+def embedding_frames(face_embeddings=None, frame_embeddings=None):
+    """Request embeddings as a list of ``faces x dim`` float32 arrays, one per frame.
+
+    ``face_embeddings`` is a single frame (one vector or a list of them);
+    ``frame_embeddings`` is a list of frames, each a list of vectors.
+    Returns None when neither is given; raises ValueError when the
+    vectors are not all of one length or hold NaN or infinity.
+    """
+    if frame_embeddings is None:
+        if not face_embeddings:
+            return None
+        frame_embeddings = [face_embeddings]
+        single = True
+    elif not isinstance(frame_embeddings, list):
+        raise ValueError("frameEmbeddings must be a list of frames")
+    else:
+        single = False
+
+    frames = []
+    for frame in frame_embeddings:
+        if not isinstance(frame, list):
+            raise ValueError("Each frame must be a list of face embeddings")
+        try:
+            faces = np.asarray(frame, dtype=np.float32)
+        except (ValueError, TypeError):
+            raise ValueError("Face embeddings must be equal-length lists of numbers")
+        if single and faces.ndim == 1 and faces.size:
+            faces = faces.reshape(1, -1)  # one face sent as a flat vector
+        elif faces.size == 0:
+            faces = faces.reshape(0, -1) if faces.ndim == 2 else np.zeros((0, 0), dtype=np.float32)
+        if faces.ndim != 2:
+            raise ValueError("Each frame must be a list of face embeddings")
+        if not np.isfinite(faces).all():
+            raise ValueError("Face embeddings must be finite numbers")
+        frames.append(faces)
+
+    dimensions = {faces.shape[1] for faces in frames if len(faces)}
+    if len(dimensions) > 1:
+        raise ValueError("Face embeddings have different dimensions")
+    dimension = dimensions.pop() if dimensions else 0
+    return [faces if len(faces) else np.zeros((0, dimension), dtype=np.float32) for faces in frames]
+
+
+class VoteRule:
+    """Hit thresholds for ``n`` frames"""
+
+    def __init__(self, min_hits=2, min_fraction=0.3, rfid_fraction=0.15):
+        self.min_hits = min_hits
+        self.min_fraction = min_fraction
+        self.rfid_fraction = rfid_fraction
+
+    def required(self, frames):
+        """k for recognition by face alone"""
+        return max(1, min(frames, max(self.min_hits, math.ceil(self.min_fraction * frames))))
+
+    def required_with_rfid(self, frames):
+        """k for confirming an RFID check-in"""
+        return max(1, min(frames, math.ceil(self.rfid_fraction * frames)))
+
+
+DEFAULT_RULE = VoteRule(
+    min_hits=int(os.getenv("FACE_VOTE_MIN_HITS", "2")),
+    min_fraction=float(os.getenv("FACE_VOTE_MIN_FRACTION", "0.3")),
+    rfid_fraction=float(os.getenv("FACE_VOTE_RFID_FRACTION", "0.15"))
+)
+
+
+class FrameVotes:
+    """Per-student votes over a session's frames"""
+
+    def __init__(self, students):
+        """``students`` are dicts with at least ``rollNo`` and ``name``"""
+        self.students = students
+        self.frames = 0
+        self.hits = np.zeros(len(students), dtype=np.int32)
+        self.best = np.zeros(len(students), dtype=np.float32)
+        self.total = np.zeros(len(students), dtype=np.float32)
+        self.scored = True
+
+    def add_frames(self, face_students, face_scores, counts):
+        """Add frames given as their faces' matches, concatenated.
+
+        ``face_students[i]`` is the student index matched by face ``i``
+        (-1 for none) and ``face_scores[i]`` its similarity; ``counts``
+        is the number of faces in each frame. A student matched by two
+        faces of one frame gets one vote, at the better score.
+        """
+        frames = len(counts)
+        face_students = np.asarray(face_students, dtype=np.intp)
+        face_scores = np.asarray(face_scores, dtype=np.float32)
+        face_frames = np.repeat(np.arange(frames), counts)
+        accepted = face_students >= 0
+        owners, frame_ids = face_students[accepted], face_frames[accepted]
+
+        seen = np.zeros((frames, len(self.students)), dtype=bool)
+        seen[frame_ids, owners] = True
+        frame_best = np.zeros((frames, len(self.students)), dtype=np.float32)
+        np.maximum.at(frame_best, (frame_ids, owners), face_scores[accepted])
+
+        self.frames += frames
+        self.hits += seen.sum(axis=0, dtype=np.int32)
+        np.maximum(self.best, frame_best.max(axis=0, initial=0), out=self.best)
+        self.total += frame_best.sum(axis=0)
+        return self
+
+    @classmethod
+    def from_match(cls, match, counts):
+        """Votes from one ``face_matcher`` match over all frames' faces"""
+        return cls(match.gallery.students).add_frames(match.face_students, match.face_scores, counts)
+
+    @classmethod
+    def from_labels(cls, frames):
+        """Votes from ``"rollNo_name"`` label lists, one list per frame.
+
+        Labels from the model server carry no similarity, so only hit
+        counts are kept.
+        """
+        index = {}
+        students = []
+        face_students, counts = [], []
+        for labels in frames:
+            counts.append(len(labels))
+            for label in labels:
+                roll_no, name = parse_recognized_student(label)
+                if roll_no not in index:
+                    index[roll_no] = len(students)
+                    students.append({"rollNo": roll_no, "name": name})
+                face_students.append(index[roll_no])
+        votes = cls(students).add_frames(face_students, np.zeros(len(face_students)), counts)
+        votes.scored = False
+        return votes
+
+    def required(self, rule=DEFAULT_RULE):
+        return rule.required(self.frames)
+
+    def recognized(self, rule=DEFAULT_RULE):
+        """Indices of students recognised by face alone, most hits first"""
+        indices = np.flatnonzero(self.hits >= rule.required(self.frames))
+        return indices[np.lexsort((-self.best[indices], -self.hits[indices]))]
+
+    def labels(self, rule=DEFAULT_RULE):
+        """``"rollNo_name"`` labels of the students recognised by vote"""
+        return [f"{self.students[i]['rollNo']}_{self.students[i]['name']}" for i in self.recognized(rule)]
+
+    def by_roll(self, rule=DEFAULT_RULE):
+        """rollNo -> vote summary for every student seen in any frame.
+
+        ``recognized``: enough hits on their own; ``confirmsRfid``: enough
+        to confirm an RFID check-in.
+        """
+        required = rule.required(self.frames)
+        required_with_rfid = rule.required_with_rfid(self.frames)
+        summary = {}
+        for i in np.flatnonzero(self.hits):
+            hits = int(self.hits[i])
+            entry = {
+                "hits": hits,
+                "frames": self.frames,
+                "recognized": hits >= required,
+                "confirmsRfid": hits >= required_with_rfid
+            }
+            if self.scored:
+                entry["maxConfidence"] = round(float(self.best[i]), 4)
+                entry["meanConfidence"] = round(float(self.total[i] / hits), 4)
+            summary[self.students[i]["rollNo"]] = entry
+        return summary
+
+    def confidences_by_roll(self):
+        """rollNo -> best similarity, for students seen in any frame"""
+        if not self.scored:
+            return None
+        return {
+            self.students[i]["rollNo"]: round(float(self.best[i]), 4)
+            for i in np.flatnonzero(self.hits)
+        }
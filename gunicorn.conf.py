@@ -0,0 +1,51 @@
+"""Production server settings for the A.U.R.A API.
+
+    gunicorn -c gunicorn.conf.py api:app
+
+Every setting can be overridden from the environment. Send SIGHUP to the
+master for a graceful reload: new workers are started with fresh code
+before the old ones finish their in-flight requests and exit.
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Threaded workers: requests mostly wait on MongoDB, so a few threads per
+# process keep the CPU busy without needing an async stack.
+worker_class = "gthread"
+workers = _env_int("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)
+threads = _env_int("GUNICORN_THREADS", 4)
+
+# Keep gateway and app connections open between requests
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+# Recycle workers after N requests (with jitter so they do not all restart
+# together) to bound the effect of slow leaks
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 200)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+
+# Each worker imports the app itself, so SIGHUP picks up new code.
+# GUNICORN_PRELOAD=1 imports it once in the master and shares it
+# copy-on-write instead, but then code changes need a full restart (or
+# USR2 + QUIT). Either way the MongoDB client and background threads are
+# created per worker after fork
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    from api import init_worker
+
+    init_worker()
@@ -0,0 +1,299 @@
+"""Content-addressed storage for captured classroom frames.
+
+Uploads are streamed to a temporary file in the store while their SHA-256
+is computed, so no frame is ever held in memory whole. The finished file
+is then moved to ``objects/<first two hex digits>/<digest>``; a frame
+that is already stored (the same photo uploaded twice, or by two phones)
+is dropped and the existing copy is used.
+
+Thumbnails are made on a small background thread pool after the upload
+has been answered, using Pillow when it is installed (without it frames
+are stored and served, just without thumbnails).
+
+Sessions reference frames by digest (``attendanceSessions.capturedImages``),
+so verification can be re-run from stored frames without the phone
+uploading them again.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.formparser import FormDataParser
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+STORE_DIR = os.getenv("IMAGE_STORE_DIR", "captured_images")
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+
+# Multipart field the app sends frames in (as it does to the model server)
+UPLOAD_FIELD = "images"
+
+# Per-request multipart limits: file parts (each a temporary file), all
+# parts, and bytes of non-file fields held in memory (Flask's defaults
+# apply when the app sets its own)
+MAX_IMAGES_PER_UPLOAD = int(os.getenv("IMAGE_MAX_PER_UPLOAD", "50"))
+MAX_FORM_PARTS = 1000
+MAX_FORM_MEMORY_BYTES = 500_000
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (320, 320)
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the formats phones send
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+]
+
+
+class ImageTooLarge(ValueError):
+    """An upload went over the per-image size limit"""
+
+
+class TooManyImages(ValueError):
+    """An upload had more file parts than allowed"""
+
+
+def is_digest(value):
+    return bool(_DIGEST.match(value or ""))
+
+
+def sniff_content_type(head, default="application/octet-stream"):
+    """Image type from the first bytes of a file"""
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    return default
+
+
+class HashingWriter:
+    """File-like sink that hashes an upload and spools it to disk as it arrives.
+
+    Usable as a werkzeug ``stream_factory`` result: the multipart parser
+    writes each part's data here chunk by chunk.
+    """
+
+    def __init__(self, directory, max_bytes, content_type=None, filename=None):
+        self.content_type = content_type
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b""
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+
+    @property
+    def path(self):
+        return self._file.name
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise ImageTooLarge(f"Images are limited to {self.max_bytes} bytes")
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class ImageStore:
+    """Frames on disk under ``directory``, keyed by SHA-256"""
+
+    def __init__(self, directory=STORE_DIR, max_bytes=MAX_IMAGE_BYTES, thumbnail_workers=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnail_workers = thumbnail_workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._thumbnails_pending = 0
+
+        self.stored = 0
+        self.duplicates = 0
+        self.bytes_stored = 0
+        self.thumbnails = 0
+
+    def _ensure_dirs(self):
+        os.makedirs(os.path.join(self.directory, "tmp"), exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def content_type(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return sniff_content_type(f.read(16))
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.directory, "thumbnails", digest[:2], f"{digest}.jpg")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def writer(self, content_type=None, filename=None):
+        self._ensure_dirs()
+        return HashingWriter(os.path.join(self.directory, "tmp"), self.max_bytes, content_type, filename)
+
+    def stream_factory(self, total_content_length=None, content_type=None, filename=None, content_length=None):
+        """werkzeug ``stream_factory``: multipart file parts go straight to disk"""
+        return self.writer(content_type, filename)
+
+    def save_stream(self, stream, content_type=None, filename=None):
+        """Store a raw (non-multipart) upload body"""
+        writer = self.writer(content_type, filename)
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+        return self.commit(writer)
+
+    def receive_multipart(self, stream, mimetype, content_length, options, field=UPLOAD_FIELD,
+                          max_images=MAX_IMAGES_PER_UPLOAD, max_form_parts=None, max_form_memory_size=None):
+        """Store every file part named ``field`` as it is parsed.
+
+        Returns the references of the stored frames, in upload order.
+        Nothing is kept if the upload fails part way. Raises TooManyImages
+        past ``max_images`` file parts; werkzeug raises
+        RequestEntityTooLarge past ``max_form_parts`` parts or
+        ``max_form_memory_size`` bytes of other fields.
+        """
+        writers = []
+
+        def factory(total_content_length=None, content_type=None, filename=None, content_length=None):
+            if len(writers) >= max_images:
+                raise TooManyImages(f"Uploads are limited to {max_images} images")
+            writer = self.writer(content_type, filename)
+            writers.append(writer)
+            return writer
+
+        parser = FormDataParser(
+            stream_factory=factory,
+            max_form_memory_size=max_form_memory_size or MAX_FORM_MEMORY_BYTES,
+            max_form_parts=max_form_parts or MAX_FORM_PARTS,
+            silent=False
+        )
+        try:
+            _, _, files = parser.parse(stream, mimetype, content_length, options)
+        except Exception:
+            for writer in writers:
+                writer.discard()
+            raise
+
+        references = []
+        for name, upload in files.items(multi=True):
+            if name == field:
+                references.append(self.commit(upload.stream))
+            else:
+                upload.stream.discard()
+        return references
+
+    def commit(self, writer):
+        """Move a finished upload into place; returns its reference.
+
+        ``duplicate`` is True when an identical frame was already stored.
+        """
+        writer.close()
+        digest = writer.hexdigest()
+        target = self.path(digest)
+        duplicate = os.path.exists(target)
+        if duplicate:
+            writer.discard()
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(writer.path, target)
+        with self._lock:
+            if duplicate:
+                self.duplicates += 1
+            else:
+                self.stored += 1
+                self.bytes_stored += writer.size
+        if not os.path.exists(self.thumbnail_path(digest)):
+            self._schedule_thumbnail(digest)
+        return {
+            "sha256": digest,
+            "size": writer.size,
+            "contentType": sniff_content_type(writer.head, writer.content_type),
+            "duplicate": duplicate
+        }
+
+    # ------------------------------------------------------------------
+    # Thumbnails
+    # ------------------------------------------------------------------
+    def _get_executor(self):
+        # Thread pools do not survive fork; create one per process
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.thumbnail_workers, thread_name_prefix="thumbnails")
+            self._executor_pid = os.getpid()
+            self._thumbnails_pending = 0
+        return self._executor
+
+    def _schedule_thumbnail(self, digest):
+        if Image is None:
+            return
+        with self._lock:
+            executor = self._get_executor()
+            self._thumbnails_pending += 1
+        executor.submit(self._make_thumbnail, digest)
+
+    def _make_thumbnail(self, digest):
+        target = self.thumbnail_path(digest)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with Image.open(self.path(digest)) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                temporary = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+                image.convert("RGB").save(temporary, "JPEG", quality=80)
+            os.replace(temporary, target)
+            with self._lock:
+                self.thumbnails += 1
+        except Exception as e:
+            print(f"⚠️ Could not make thumbnail for {digest}: {e}")
+        finally:
+            with self._lock:
+                self._thumbnails_pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stored": self.stored,
+                "duplicates": self.duplicates,
+                "bytesStored": self.bytes_stored,
+                "thumbnails": self.thumbnails,
+                "thumbnailsPending": self._thumbnails_pending,
+                "thumbnailsEnabled": Image is not None
+            }
@@ -0,0 +1,111 @@
+"""Background jobs with status kept in MongoDB.
+
+Work runs on a bounded in-process thread pool, so long tasks such as
+bulk exports no longer tie up request workers. Job state lives in a
+collection rather than in memory, so with several server processes any
+worker can answer a status or download request for a job started by
+another one.
+"""
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class QueueFull(Exception):
+    """Raised when a queue already has its maximum number of pending jobs"""
+
+
+class JobQueue:
+    """Bounded thread pool whose jobs are tracked in ``db[collection_name]``"""
+
+    def __init__(self, db, collection_name, max_workers=2, max_pending=20, name="jobs"):
+        self.db = db
+        self.collection_name = collection_name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.name = name
+        self._executor = None
+        self._executor_pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def _get_executor(self):
+        # Thread pools do not survive fork; create one per process
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            self._executor_pid = os.getpid()
+            self._pending = 0
+        return self._executor
+
+    def submit(self, kind, params, fn, job_id=None):
+        """Queue ``fn(job_id, params, progress)``; returns the job id.
+
+        ``fn`` returns a dict of result fields stored on the job document.
+        ``progress(done, total)`` can be called to report progress. Pass
+        ``job_id`` to record it elsewhere before the job can start.
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self.name} queue is full ({self.max_pending} pending)")
+            self._pending += 1
+
+        job_id = job_id or uuid.uuid4().hex
+        try:
+            self.collection.insert_one({
+                "_id": job_id,
+                "kind": kind,
+                "status": "queued",
+                "params": params,
+                "progress": {"done": 0, "total": None},
+                "createdAt": datetime.now()
+            })
+            executor.submit(self._run, job_id, params, fn)
+        except Exception:
+            # The job never started, so it must not hold a pending slot
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job_id
+
+    def _run(self, job_id, params, fn):
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running", "startedAt": datetime.now()}}
+        )
+
+        def progress(done, total=None):
+            self.collection.update_one(
+                {"_id": job_id},
+                {"$set": {"progress": {"done": done, "total": total}}}
+            )
+
+        try:
+            result = fn(job_id, params, progress) or {}
+            self.collection.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "completed", "result": result, "finishedAt": datetime.now()}}
+            )
+        except Exception as e:
+            print(f"Error in {self.name} job {job_id}: {e}")
+            print(traceback.format_exc())
+            self.collection.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "failed", "error": str(e), "finishedAt": datetime.now()}}
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+    def pending(self):
+        return self._pending
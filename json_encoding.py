@@ -0,0 +1,69 @@
+"""JSON encoding of BSON values for every API response.
+
+``BSONJSONProvider`` is installed as ``app.json``, so ``jsonify`` accepts
+documents straight from MongoDB: ObjectId becomes its hex string,
+datetime and date become ISO-8601, and Binary becomes base64. Routes no
+longer convert records field by field before returning them.
+
+When ``orjson`` is installed it does the encoding (several times faster on
+large payloads, and it handles datetime natively); otherwise the stdlib
+``json`` module is used with the same output.
+"""
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from bson import Binary, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+
+def default(value):
+    """Encode the non-JSON types that come back from MongoDB"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Binary):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj, sort_keys=False):
+    """Encode ``obj`` to a JSON string with the fastest available backend"""
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        # orjson has no bytes support, so Binary also reaches ``default``
+        return orjson.dumps(obj, default=default, option=options).decode("utf-8")
+    return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(",", ":"))
+
+
+class BSONJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that understands BSON types"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("cls") is not None or kwargs.get("indent") is not None:
+            kwargs.setdefault("default", default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys))
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            f"{dumps(obj, sort_keys=self.sort_keys)}\n",
+            mimetype=self.mimetype
+        )
@@ -0,0 +1,95 @@
+"""Distinct attendance days for the calendar view.
+
+One aggregation extracts the day of every matching ``attendance`` record,
+unions in the ``rfid_attendance`` days (only when no course is selected,
+since RFID records are not tied to a course), and groups them, so only
+the distinct ``YYYY-MM-DD`` strings come back over the wire.
+
+Results are memoised per (batch, course, faculty, month) in each worker
+and dropped when an attendance write for that key lands on the same
+worker; other workers pick the change up within the memo TTL.
+"""
+from attendance_dates import parse_month
+from database import for_route
+from read_cache import ReadThroughCache
+
+
+def _day_stages(match):
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}}}
+    ]
+
+
+def marked_dates_pipeline(batch, course_id=None, faculty_id=None, window=None):
+    """Aggregation on ``attendance`` returning ``{"_id": "YYYY-MM-DD"}`` per marked day"""
+    # Legacy records without a usable date are skipped, as before
+    date_filter = {"$gte": window[0], "$lt": window[1]} if window else {"$type": "date"}
+
+    query = {"batchId": batch, "date": date_filter}
+    if course_id:
+        query["courseId"] = course_id
+    if faculty_id:
+        query["facultyId"] = faculty_id
+
+    pipeline = _day_stages(query)
+
+    # For RFID records, we might not have courseId
+    if not course_id:
+        rfid_query = {"batch": batch, "date": date_filter}
+        if faculty_id:
+            rfid_query["facultyId"] = faculty_id
+        pipeline.append({"$unionWith": {"coll": "rfid_attendance", "pipeline": _day_stages(rfid_query)}})
+
+    pipeline += [
+        {"$group": {"_id": "$day"}},
+        {"$sort": {"_id": 1}}
+    ]
+    return pipeline
+
+
+class MarkedDates:
+    """Memoised marked-day lookups with write-driven invalidation"""
+
+    def __init__(self, db, ttl=60, max_entries=2000):
+        self.db = db
+        self.cache = ReadThroughCache(ttl=ttl, max_entries=max_entries)
+
+    def get(self, batch, course_id=None, faculty_id=None, month=None):
+        """Return ``(sorted day strings, etag)``.
+
+        ``month`` (``YYYY-MM``) limits the result to one calendar month;
+        raises ValueError when it is malformed.
+        """
+        window = parse_month(month) if month else None
+
+        def load():
+            reader = for_route(self.db, "marked_dates")
+            pipeline = marked_dates_pipeline(batch, course_id, faculty_id, window)
+            return [doc["_id"] for doc in reader.attendance.aggregate(pipeline)]
+
+        return self.cache.get((batch, course_id, faculty_id, month), load)
+
+    def invalidate(self, batch, day=None, course_id=None, faculty_id=None):
+        """Forget memoised results a write on ``batch`` may have changed.
+
+        Pass the record's ``course_id``/``faculty_id`` for a session write;
+        leave ``course_id`` unset for an RFID write, which only shows up in
+        course-less views. ``day`` narrows it to that day's month.
+        """
+        month = day.strftime("%Y-%m") if day else None
+
+        def affected(key):
+            key_batch, key_course, key_faculty, key_month = key
+            if key_batch != batch:
+                return False
+            if month and key_month not in (None, month):
+                return False
+            if course_id is None:
+                return key_course is None
+            return key_course in (None, course_id) and key_faculty in (None, faculty_id)
+
+        self.cache.invalidate_where(affected)
+
+    def stats(self):
+        return self.cache.stats()
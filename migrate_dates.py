@@ -0,0 +1,145 @@
+"""Normalise stored attendance dates to midnight.
+
+Older ``rfid_attendance`` and ``attendance`` documents may carry a time of
+day (or a string) in ``date``, which is why ``/attendance/verify`` used to
+fall back to scanning a batch's whole history. This job rewrites every
+``date`` to midnight and merges documents that collapse onto the same day:
+
+* ``rfid_attendance``: one document per (date, batch); ``students`` arrays
+  are merged by ``studentId``, keeping the latest tap.
+* ``attendance`` daily records: one per (date, batch); ``students`` maps
+  are merged, keeping the latest check-in per student.
+* ``attendance`` course records: one per (date, batchId, courseId); the
+  most recently updated document wins.
+
+It finishes by (re)creating the declared indexes; the unique ones can only
+be built once duplicates are gone. Safe to run repeatedly.
+
+    python migrate_dates.py [--dry-run]
+"""
+import argparse
+
+from attendance_dates import coerce_day
+from database import connect_to_db
+from db_indexes import ensure_indexes
+
+
+def _group_documents(collection, key_fields, query=None):
+    """Group documents by (normalised date, *key_fields)"""
+    groups = {}
+    projection = {"date": 1, **{field: 1 for field in key_fields}}
+    for doc in collection.find(query or {}, projection):
+        day = coerce_day(doc.get("date"))
+        if day is None:
+            print(f"⚠️ {collection.name} {doc['_id']}: unparseable date {doc.get('date')!r}, skipped")
+            continue
+        key = (day,) + tuple(doc.get(field) for field in key_fields)
+        groups.setdefault(key, []).append(doc)
+    return groups
+
+
+def _latest(value, other):
+    if value is None:
+        return other
+    if other is None:
+        return value
+    return max(value, other)
+
+
+def _merge_rfid_students(docs):
+    merged = {}
+    order = []
+    for doc in docs:
+        for student in doc.get("students", []):
+            student_id = student.get("studentId")
+            if student_id not in merged:
+                merged[student_id] = dict(student)
+                order.append(student_id)
+            else:
+                merged[student_id]["timestamp"] = _latest(
+                    merged[student_id].get("timestamp"), student.get("timestamp")
+                )
+    return [merged[student_id] for student_id in order]
+
+
+def _merge_daily_students(docs):
+    merged = {}
+    for doc in docs:
+        for student_id, entry in (doc.get("students") or {}).items():
+            current = merged.get(student_id)
+            if current is None:
+                merged[student_id] = entry
+                continue
+            current_time = (current.get("rfidCheckIn") or {}).get("timestamp")
+            entry_time = (entry.get("rfidCheckIn") or {}).get("timestamp")
+            if entry_time is not None and (current_time is None or entry_time > current_time):
+                merged[student_id] = entry
+    return merged
+
+
+def _apply_group(collection, day, docs, merge, dry_run):
+    """Rewrite one group: keep the oldest document, fold the rest into it"""
+    if len(docs) == 1 and docs[0].get("date") == day:
+        return 0
+
+    full_docs = list(collection.find({"_id": {"$in": [doc["_id"] for doc in docs]}}))
+    full_docs.sort(key=lambda doc: (
+        doc.get("createdAt") is None, doc.get("createdAt") or doc["_id"].generation_time
+    ))
+    keeper, extras = full_docs[0], full_docs[1:]
+
+    update = {"date": day}
+    if extras and merge is not None:
+        update.update(merge(full_docs))
+    elif extras:
+        # No merge rule: the most recently updated document wins
+        newest = max(full_docs, key=lambda doc: (
+            doc.get("updatedAt") is not None, doc.get("updatedAt") or doc["_id"].generation_time
+        ))
+        update.update({k: v for k, v in newest.items() if k != "_id"})
+        update["date"] = day
+
+    if dry_run:
+        print(f"[dry-run] {collection.name} {keeper['_id']}: date -> {day:%Y-%m-%d}, merging {len(extras)} duplicate(s)")
+        return len(docs)
+
+    collection.update_one({"_id": keeper["_id"]}, {"$set": update})
+    if extras:
+        collection.delete_many({"_id": {"$in": [doc["_id"] for doc in extras]}})
+    return len(docs)
+
+
+def migrate(db, dry_run=False):
+    changed = 0
+
+    for (day, _batch), docs in _group_documents(db.rfid_attendance, ["batch"]).items():
+        changed += _apply_group(
+            db.rfid_attendance, day, docs,
+            lambda full: {"students": _merge_rfid_students(full)},
+            dry_run
+        )
+
+    daily = _group_documents(db.attendance, ["batch"], {"type": "daily"})
+    for (day, _batch), docs in daily.items():
+        changed += _apply_group(
+            db.attendance, day, docs,
+            lambda full: {"students": _merge_daily_students(full)},
+            dry_run
+        )
+
+    courses = _group_documents(db.attendance, ["batchId", "courseId"], {"type": {"$ne": "daily"}})
+    for (day, _batch, _course), docs in courses.items():
+        changed += _apply_group(db.attendance, day, docs, None, dry_run)
+
+    print(f"{'Would touch' if dry_run else 'Normalised'} {changed} document(s)")
+
+    if not dry_run:
+        ensure_indexes(db)
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    args = parser.parse_args()
+    migrate(connect_to_db(), dry_run=args.dry_run)
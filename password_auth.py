@@ -0,0 +1,141 @@
+"""Password verification off the request thread.
+
+bcrypt is deliberately slow (~100-300 ms per check), so checks run on a
+bounded pool with a cap on how many may be queued. When the cap is hit
+the caller gets ``AuthOverloaded`` straight away (HTTP 429) instead of
+every request worker stalling behind a burst of logins. Hashes with a
+cost different from ``BCRYPT_ROUNDS`` are transparently re-hashed after
+a successful login.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+class AuthOverloaded(Exception):
+    """Too many password checks are already queued"""
+
+
+class AuthTimeout(Exception):
+    """A password check did not finish within the configured timeout"""
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def hash_cost(hashed):
+    """Cost factor of a ``$2b$NN$...`` hash, or None if unparseable"""
+    try:
+        return int(hashed[4:6])
+    except (ValueError, TypeError):
+        return None
+
+
+class PasswordVerifier:
+    """Bounded pool for bcrypt checks with queue-depth backpressure.
+
+    The bcrypt C extension releases the GIL, so threads give real
+    parallelism; a process pool can be selected instead with
+    ``kind="process"``.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, timeout=10.0, rounds=12, kind="thread"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rounds = rounds
+        self.kind = kind
+        self._executor = None
+        self._executor_pid = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+
+    def _get_executor(self):
+        # Pools do not survive fork; create one per process
+        if self._executor is None or self._executor_pid != os.getpid():
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            self._executor_pid = os.getpid()
+            self._in_flight = 0
+        return self._executor
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            executor = self._get_executor()
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise AuthOverloaded("Too many concurrent login attempts")
+            self._in_flight += 1
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def verify(self, password, hashed):
+        """Check ``password`` against ``hashed`` on the pool; returns a bool"""
+        future = self._submit(_checkpw, password.encode('utf-8'), hashed)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise AuthTimeout("Password verification timed out")
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def rehash_later(self, password, on_done):
+        """Hash ``password`` at the configured cost and pass it to ``on_done``.
+
+        Best effort: skipped when the pool is busy, retried on a later login.
+        """
+        try:
+            future = self._submit(_hashpw, password.encode('utf-8'), self.rounds)
+        except AuthOverloaded:
+            return
+
+        def done(f):
+            if f.exception() is None:
+                try:
+                    on_done(f.result())
+                    self.rehashed += 1
+                except Exception as e:
+                    print(f"⚠️ Could not store rehashed password: {e}")
+
+        future.add_done_callback(done)
+
+    def stats(self):
+        return {
+            "inFlight": self._in_flight,
+            "maxWorkers": self.max_workers,
+            "maxQueue": self.max_queue,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "rehashed": self.rehashed,
+            "rounds": self.rounds
+        }
+
+
+def verifier_from_env():
+    return PasswordVerifier(
+        max_workers=int(os.getenv("AUTH_WORKERS", str(os.cpu_count() or 2))),
+        max_queue=int(os.getenv("AUTH_MAX_QUEUE", "32")),
+        timeout=float(os.getenv("AUTH_TIMEOUT_SECONDS", "10")),
+        rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+        kind=os.getenv("AUTH_POOL_KIND", "thread")
+    )
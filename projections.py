@@ -0,0 +1,44 @@
+"""Fields each route reads from MongoDB.
+
+Every read in the API names the fields it uses, so documents are trimmed
+on the server instead of being shipped whole and picked apart in Python.
+Existence and membership checks project only ``_id`` and put the
+condition into the filter, so the server does the test.
+
+Projections shared with other modules live next to their code
+(``student_cache.STUDENT_PROJECTION``, ``export_engine.HEADER_PROJECTION``).
+"""
+
+# POST /auth: enough to verify the password and build the token
+AUTH_USER = {"username": 1, "password": 1, "name": 1, "role": 1, "assignedBatches": 1}
+
+# GET /schedule, GET /assignedCourses: the profile, never the password hash
+USER_PROFILE = {
+    "_id": 0, "username": 1, "name": 1, "role": 1,
+    "schedule": 1, "assignedCourses": 1, "assignedBatches": 1
+}
+
+COURSE_SUMMARY = {"courseName": 1, "courseCode": 1}
+
+# POST /attendance/sessions
+SESSION_FACULTY = {"assignedBatches": 1, "assignedCourses": 1}
+
+# /attendance/sessions/<id>/images
+SESSION_BATCH = {"batchId": 1}
+SESSION_IMAGES = {"batchId": 1, "capturedImages": 1}
+
+# POST /attendance/verify with a sessionId: the combined recognition result
+SESSION_RECOGNITION = {
+    "batchId": 1, "recognition.status": 1, "recognition.recognizedStudents": 1, "recognition.confidences": 1,
+    "recognition.votes": 1
+}
+
+# POST /faces/enroll: what an enrolment stores alongside the embeddings
+ENROLL_STUDENT = {"rollNo": 1, "name": 1, "batch": 1}
+
+# Existence checks
+ID_ONLY = {"_id": 1}
+
+# POST /attendance/verify
+RFID_ROSTER = {"date": 1, "students.rollNo": 1, "students.name": 1}
+BATCH_ROSTER = {"rollNo": 1, "name": 1}
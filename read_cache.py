@@ -0,0 +1,223 @@
+"""Read-through cache for slow-changing lookups (profiles, schedules, courses).
+
+Values are cached in an in-process LRU with a TTL, optionally backed by a
+shared store so that workers warm each other and an explicit invalidation
+reaches every worker within the local TTL. Any object with ``get``,
+``set``, ``delete`` and ``clear`` can be the shared store: ``RedisBackend`` when
+``redis`` is installed, or ``LocalBackend`` as a drop-in stand-in for
+development.
+
+Each cached value carries an ETag, so a client that sends
+``If-None-Match`` can be answered with ``304 Not Modified`` without a
+database read.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+
+def compute_etag(payload):
+    """Strong ETag (unquoted) of a JSON-serialisable payload"""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+class LocalBackend:
+    """Dict-backed stand-in for a shared cache (single process only)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Shared cache in Redis; values are stored as extended JSON"""
+
+    def __init__(self, url, prefix="aura:cache:"):
+        if redis is None:
+            raise RuntimeError("redis is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json_util.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json_util.dumps(value), ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self, batch_size=1000):
+        """Delete every key under this cache's prefix"""
+        batch = []
+        for key in self.client.scan_iter(match=self.prefix + "*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+
+class ReadThroughCache:
+    """LRU + TTL cache in front of a loader, with optional shared backend"""
+
+    def __init__(self, ttl=300, max_entries=5000, shared=None, shared_ttl=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.shared_ttl = shared_ttl or ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item
+
+    def _set_local(self, key, value, etag):
+        with self._lock:
+            self._entries[key] = (value, etag, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, loader):
+        """Return ``(value, etag)``, calling ``loader()`` on a miss.
+
+        A loader returning None (e.g. "not found") is not cached.
+        """
+        item = self._get_local(key)
+        if item is not None:
+            self.hits += 1
+            return item[0], item[1]
+
+        if self.shared is not None:
+            try:
+                shared_item = self.shared.get(key)
+            except Exception as e:
+                print(f"⚠️ Shared cache read failed: {e}")
+                shared_item = None
+            if shared_item is not None:
+                self.shared_hits += 1
+                self._set_local(key, shared_item["value"], shared_item["etag"])
+                return shared_item["value"], shared_item["etag"]
+
+        self.misses += 1
+        value = loader()
+        if value is None:
+            return None, None
+        etag = compute_etag(value)
+        self._set_local(key, value, etag)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, {"value": value, "etag": etag}, self.shared_ttl)
+            except Exception as e:
+                print(f"⚠️ Shared cache write failed: {e}")
+        return value, etag
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None:
+            for key in keys:
+                try:
+                    self.shared.delete(key)
+                except Exception as e:
+                    print(f"⚠️ Shared cache delete failed: {e}")
+
+    def invalidate_where(self, predicate):
+        """Drop every local entry whose key satisfies ``predicate``"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry, locally and in the shared store.
+
+        Other workers keep their local copies until the local TTL, but can
+        no longer repopulate from the shared store.
+        """
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            try:
+                self.shared.clear()
+            except Exception as e:
+                print(f"⚠️ Shared cache clear failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "sharedHits": self.shared_hits,
+            "misses": self.misses,
+            "hitRatio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "sharedBackend": type(self.shared).__name__ if self.shared is not None else None
+        }
+
+
+def read_cache_from_env():
+    """Cache configured from READ_CACHE_* environment variables.
+
+    READ_CACHE_BACKEND: "none" (default), "local" or a redis:// URL.
+    """
+    backend_setting = os.getenv("READ_CACHE_BACKEND", "none")
+    if backend_setting == "local":
+        shared = LocalBackend()
+    elif backend_setting.startswith(("redis://", "rediss://")):
+        shared = RedisBackend(backend_setting)
+    else:
+        shared = None
+    return ReadThroughCache(
+        ttl=float(os.getenv("READ_CACHE_TTL_SECONDS", "300")),
+        max_entries=int(os.getenv("READ_CACHE_MAX_ENTRIES", "5000")),
+        shared=shared,
+        shared_ttl=float(os.getenv("READ_CACHE_SHARED_TTL_SECONDS", "3600"))
+    )
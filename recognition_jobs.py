@@ -0,0 +1,327 @@
+"""Face recognition for attendance sessions, off the request path.
+
+Submitting a session's stored frames (``image_store``) returns a job id
+at once. The job then runs in the background:
+
+1. **inference**: the frames are read and passed, a batch at a time, to
+   the model in a process pool (CPU-bound detection and embedding never
+   competes with request threads for the GIL);
+2. **match**: every face from every frame is matched against the batch's
+   gallery in one ``face_matcher`` call;
+3. **write**: per-frame results and the students recognised by vote
+   across frames (``frame_votes``) are stored on the session as
+   ``recognition``, where ``/attendance/verify`` can use them.
+
+Job status lives in ``recognitionJobs`` (see ``jobs.JobQueue``), so the
+app can poll it or follow it as server-sent events from any worker.
+
+The model is chosen with ``RECOGNITION_MODEL``: ``stub`` (default) is a
+local stand-in that returns deterministic pseudo-embeddings, otherwise
+``package.module:factory`` names a callable returning an object with
+``embed_frames(frames) -> [faces x dim float32 array per frame]``.
+"""
+import hashlib
+import importlib
+import math
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+
+from frame_votes import FrameVotes
+from jobs import JobQueue
+
+JOBS_COLLECTION = "recognitionJobs"
+
+MODEL_SPEC = os.getenv("RECOGNITION_MODEL", "stub")
+
+# Frames per model call
+BATCH_FRAMES = int(os.getenv("RECOGNITION_BATCH_FRAMES", "16"))
+
+# Stage timings kept for the latency percentiles
+LATENCY_WINDOW = 500
+
+STAGES = ("queued", "inference", "match", "write", "total")
+
+
+class StubModel:
+    """Stand-in for face detection + FaceNet, for development and load tests.
+
+    Each frame yields ``faces_per_frame`` embeddings seeded by the frame's
+    bytes (so the same frame always gives the same faces), after an
+    optional ``delay`` per frame to mimic inference cost.
+    """
+
+    def __init__(self, dimension=512, faces_per_frame=0, delay=0.0):
+        self.dimension = dimension
+        self.faces_per_frame = faces_per_frame
+        self.delay = delay
+
+    def embed_frames(self, frames):
+        if self.delay:
+            time.sleep(self.delay * len(frames))
+        embeddings = []
+        for frame in frames:
+            seed = int.from_bytes(hashlib.sha256(frame).digest()[:8], "little")
+            rng = np.random.default_rng(seed)
+            embeddings.append(rng.standard_normal((self.faces_per_frame, self.dimension)).astype(np.float32))
+        return embeddings
+
+
+def load_model(spec):
+    if spec == "stub":
+        return StubModel(
+            dimension=int(os.getenv("RECOGNITION_STUB_DIMENSION", "512")),
+            faces_per_frame=int(os.getenv("RECOGNITION_STUB_FACES", "0")),
+            delay=float(os.getenv("RECOGNITION_STUB_DELAY_MS", "0")) / 1000
+        )
+    module, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module), factory)()
+
+
+# ----------------------------------------------------------------------
+# Pool processes
+# ----------------------------------------------------------------------
+_model = None
+
+
+def _init_process(spec):
+    """Load the model once per pool process"""
+    global _model
+    _model = load_model(spec)
+
+
+def _embed_batch(paths):
+    """Embeddings for a batch of frame files, plus busy time in the process"""
+    start = time.perf_counter()
+    frames = []
+    for path in paths:
+        with open(path, "rb") as f:
+            frames.append(f.read())
+    embeddings = [np.asarray(faces, dtype=np.float32) for faces in _model.embed_frames(frames)]
+    return embeddings, time.perf_counter() - start
+
+
+# ----------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------
+class StageLatency:
+    """Recent per-stage durations, reported as percentiles"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._samples[stage].append(seconds)
+
+    def report(self):
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "p50Ms": round(float(np.percentile(values, 50)) * 1000, 1),
+                "p95Ms": round(float(np.percentile(values, 95)) * 1000, 1),
+                "maxMs": round(float(values.max()) * 1000, 1)
+            }
+            for stage, values in samples.items() if len(values)
+        }
+
+
+# ----------------------------------------------------------------------
+# Jobs
+# ----------------------------------------------------------------------
+def _frame_results(match, frames, counts):
+    """Split one match over all faces back into per-frame results"""
+    results = []
+    start = 0
+    for frame, count in zip(frames, counts):
+        recognized = []
+        for face in range(start, start + count):
+            owner = match.face_students[face]
+            if owner >= 0:
+                student = match.gallery.students[owner]
+                recognized.append(dict(student, confidence=round(float(match.face_scores[face]), 4)))
+        results.append({
+            "sha256": frame,
+            "faces": count,
+            "recognized": recognized,
+            "unknownFaces": count - len(recognized)
+        })
+        start += count
+    return results
+
+
+class RecognitionQueue:
+    """Recognition jobs: a JobQueue thread per job, inference in a process pool"""
+
+    def __init__(self, db, image_store, face_matcher, workers=2, max_pending=20,
+                 batch_frames=BATCH_FRAMES, model_spec=MODEL_SPEC):
+        self.db = db
+        self.image_store = image_store
+        self.face_matcher = face_matcher
+        self.workers = workers
+        self.batch_frames = batch_frames
+        self.model_spec = model_spec
+        self.jobs = JobQueue(db, JOBS_COLLECTION, max_workers=workers, max_pending=max_pending, name="recognition")
+        self.latency = StageLatency()
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._busy_seconds = 0.0
+        self._started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.frames = 0
+        self.faces = 0
+
+    def _get_pool(self):
+        # Pools do not survive fork; spawn one per server process (fresh
+        # interpreters, so the threaded server is never forked)
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process,
+                    initargs=(self.model_spec,)
+                )
+                self._pool_pid = os.getpid()
+                self._busy_seconds = 0.0
+                self._started = time.monotonic()
+            return self._pool
+
+    def submit(self, session, frames):
+        """Queue recognition of ``frames`` (digests) for a session; returns the job id.
+
+        Raises jobs.QueueFull when too many jobs are pending.
+        """
+        params = {
+            "sessionId": str(session["_id"]),
+            "batch": session.get("batchId"),
+            "frames": list(frames),
+            "submittedAt": time.time()
+        }
+        # The job only writes to a session that names it, so name it first
+        job_id = uuid.uuid4().hex
+        previous = self.db.attendanceSessions.find_one_and_update(
+            {"_id": session["_id"]},
+            {"$set": {
+                "recognition": {"jobId": job_id, "status": "queued", "frames": len(frames)},
+                "updatedAt": datetime.now()
+            }},
+            projection={"recognition": 1}
+        )
+        try:
+            self.jobs.submit("recognition", params, self._run, job_id=job_id)
+        except Exception:
+            # Not queued: put back the earlier results, unless a newer job replaced them
+            restore = {"$set": {"recognition": previous["recognition"]}} if previous and previous.get("recognition") \
+                else {"$unset": {"recognition": ""}}
+            self.db.attendanceSessions.update_one({"_id": session["_id"], "recognition.jobId": job_id}, restore)
+            raise
+        return job_id
+
+    def _run(self, job_id, params, progress):
+        timings = {"queued": time.time() - params["submittedAt"]}
+        session_filter = {"_id": ObjectId(params["sessionId"]), "recognition.jobId": job_id}
+        self.db.attendanceSessions.update_one(session_filter, {"$set": {"recognition.status": "running"}})
+        try:
+            result = self._recognize(params, timings, progress)
+        except Exception as e:
+            self.failed += 1
+            self.db.attendanceSessions.update_one(
+                session_filter,
+                {"$set": {"recognition.status": "failed", "recognition.error": str(e)}}
+            )
+            raise
+
+        start = time.perf_counter()
+        # Only the latest job for the session may write its results
+        self.db.attendanceSessions.update_one(session_filter, {"$set": {
+            "recognition": dict(result, jobId=job_id, status="completed", completedAt=datetime.now()),
+            "updatedAt": datetime.now()
+        }})
+        timings["write"] = time.perf_counter() - start
+        timings["total"] = time.time() - params["submittedAt"]
+        self.latency.record(timings)
+        self.completed += 1
+        return {
+            "frames": len(params["frames"]),
+            "faces": result["faces"],
+            "recognized": len(result["recognizedStudents"]),
+            "timingsMs": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+        }
+
+    def _recognize(self, params, timings, progress):
+        frames = params["frames"]
+        start = time.perf_counter()
+        pool = self._get_pool()
+        batches = [frames[i:i + self.batch_frames] for i in range(0, len(frames), self.batch_frames)]
+        futures = [pool.submit(_embed_batch, [self.image_store.path(frame) for frame in batch]) for batch in batches]
+        embeddings = []
+        for done, future in enumerate(futures, 1):
+            batch_embeddings, busy = future.result()
+            embeddings.extend(batch_embeddings)
+            with self._lock:
+                self._busy_seconds += busy
+            progress(min(done * self.batch_frames, len(frames)), len(frames))
+        timings["inference"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts = [len(faces) for faces in embeddings]
+        faces = [face for frame_faces in embeddings for face in frame_faces]
+        match = self.face_matcher.match(params["batch"], faces)
+        votes = FrameVotes.from_match(match, counts)
+        timings["match"] = time.perf_counter() - start
+
+        self.frames += len(frames)
+        self.faces += len(faces)
+        return {
+            "faces": len(faces),
+            "frameResults": _frame_results(match, frames, counts),
+            "recognizedStudents": votes.labels(),
+            "confidences": match.confidences_by_roll(),
+            "votes": votes.by_roll(),
+            "requiredHits": votes.required(),
+            "unknownFaces": len(match.unknown_faces())
+        }
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            busy = self._busy_seconds
+        return {
+            "queueDepth": self.jobs.pending(),
+            "workers": self.workers,
+            "batchFrames": self.batch_frames,
+            "model": self.model_spec,
+            # Share of pool process time spent in inference since the pool started
+            "utilisation": round(busy / (self.workers * elapsed), 3) if self._pool is not None and elapsed else 0.0,
+            "completed": self.completed,
+            "failed": self.failed,
+            "frames": self.frames,
+            "faces": self.faces,
+            "latency": self.latency.report()
+        }
+
+
+def recognition_queue_from_env(db, image_store, face_matcher):
+    return RecognitionQueue(
+        db, image_store, face_matcher,
+        workers=int(os.getenv("RECOGNITION_WORKERS", str(max(1, math.ceil((os.cpu_count() or 2) / 2))))),
+        max_pending=int(os.getenv("RECOGNITION_MAX_PENDING", "20"))
+    )
@@ -0,0 +1,212 @@
+"""Atomic RFID check-in writes.
+
+Each tap is applied as two upserts: one on the per-day ``rfid_attendance``
+document and one on the daily ``attendance`` document (plus the student's
+row in the ``student_ledger``). Neither write reads
+the document first, so the cost of a tap does not grow with the number of
+students who have already tapped, and two readers tapping at the same time
+can no longer overwrite each other's changes.
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from attendance_dates import start_of_day
+from attendance_rollups import apply_rfid_checkins
+from student_ledger import record_daily_checkins
+
+# Upserts on a missing document can race; the unique (date, batch) indexes
+# declared in db_indexes make the loser fail with DuplicateKeyError, after
+# which the write is simply retried against the document the winner created.
+UPSERT_RETRIES = 2
+
+
+def build_rfid_student_record(student_id, rfid_tag, name, roll_no, timestamp):
+    """Entry stored in the ``students`` array of an rfid_attendance document"""
+    return {
+        "studentId": student_id,
+        "rfidTag": rfid_tag,
+        "name": name,
+        "rollNo": roll_no,
+        "timestamp": timestamp,
+        "attendance_status": "present"
+    }
+
+
+def build_daily_student_entry(student_id, name, roll_no, timestamp):
+    """Entry stored under ``students.<id>`` of a daily attendance document"""
+    return {
+        "id": student_id,
+        "name": name,
+        "rollNo": roll_no,
+        "rfidCheckIn": {
+            "timestamp": timestamp,
+            "status": True
+        },
+        "isPresent": True
+    }
+
+
+def rfid_day_update(student_record, current_time):
+    """Pipeline update that adds the student or refreshes their timestamp.
+
+    The membership test, the timestamp refresh and the append all run on
+    the server inside a single document update, so concurrent taps for
+    the same day and batch cannot lose each other's entries. The stored
+    timestamp only ever moves forward, which makes replaying an older tap
+    a no-op.
+    """
+    student_id = student_record["studentId"]
+    tap_time = student_record["timestamp"]
+    existing = {"$ifNull": ["$students", []]}
+
+    return [
+        {"$set": {
+            "createdAt": {"$ifNull": ["$createdAt", current_time]},
+            "updatedAt": current_time,
+            "students": {
+                "$cond": [
+                    {"$in": [student_id, {"$ifNull": ["$students.studentId", []]}]},
+                    {"$map": {
+                        "input": existing,
+                        "as": "s",
+                        "in": {
+                            "$cond": [
+                                {"$eq": ["$$s.studentId", student_id]},
+                                {"$mergeObjects": [
+                                    "$$s",
+                                    {"timestamp": {"$max": ["$$s.timestamp", tap_time]}}
+                                ]},
+                                "$$s"
+                            ]
+                        }
+                    }},
+                    {"$concatArrays": [existing, [{"$literal": student_record}]]}
+                ]
+            }
+        }}
+    ]
+
+
+def daily_attendance_update(student_entries, current_time):
+    """Dotted-path update that only touches the given students' entries.
+
+    Each field is set individually so anything else stored on a student's
+    entry survives, and the check-in time is only moved forward.
+    """
+    set_fields = {"updatedAt": current_time}
+    max_fields = {}
+    for entry in student_entries:
+        prefix = f"students.{entry['id']}"
+        set_fields[f"{prefix}.id"] = entry["id"]
+        set_fields[f"{prefix}.name"] = entry["name"]
+        set_fields[f"{prefix}.rollNo"] = entry["rollNo"]
+        set_fields[f"{prefix}.rfidCheckIn.status"] = True
+        set_fields[f"{prefix}.isPresent"] = True
+        max_fields[f"{prefix}.rfidCheckIn.timestamp"] = entry["rfidCheckIn"]["timestamp"]
+
+    return {
+        "$set": set_fields,
+        "$max": max_fields,
+        "$setOnInsert": {"createdAt": current_time}
+    }
+
+
+def _upsert(collection, query, update):
+    for attempt in range(UPSERT_RETRIES + 1):
+        try:
+            return collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            if attempt == UPSERT_RETRIES:
+                raise
+
+
+def record_rfid_checkin(db, student, rfid_tag, batch, day, current_time):
+    """Record a tap for ``student`` on ``day`` using two atomic upserts.
+
+    Returns the student id as a string.
+    """
+    day = start_of_day(day)
+    student_id = str(student["_id"])
+    name = student.get("name", "")
+    roll_no = student.get("rollNo", "")
+
+    student_record = build_rfid_student_record(student_id, rfid_tag, name, roll_no, current_time)
+    _upsert(
+        db.rfid_attendance,
+        {"date": day, "batch": batch},
+        rfid_day_update(student_record, current_time)
+    )
+
+    # Also update the regular attendance record for compatibility
+    student_entry = build_daily_student_entry(student_id, name, roll_no, current_time)
+    _upsert(
+        db.attendance,
+        {"date": day, "type": "daily", "batch": batch},
+        daily_attendance_update([student_entry], current_time)
+    )
+
+    # Per-student history row (see student_ledger) and report counts
+    new_checkins = record_daily_checkins(db, batch, day, [(student, current_time)], current_time)
+    apply_rfid_checkins(db, batch, day, new_checkins, current_time)
+
+    return student_id
+
+
+def _bulk_upsert(collection, operations):
+    for attempt in range(UPSERT_RETRIES + 1):
+        try:
+            return collection.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            # Every operation is idempotent, so after losing an insert race
+            # the whole group can simply be replayed
+            duplicate = all(err.get("code") == 11000 for err in e.details.get("writeErrors", []))
+            if not duplicate or attempt == UPSERT_RETRIES:
+                raise
+
+
+def record_rfid_checkins(db, batch, day, checkins, current_time):
+    """Apply a group of taps for one (day, batch) with one bulk write per collection.
+
+    ``checkins`` is a list of ``(student, rfid_tag, timestamp)`` tuples.
+    Repeated taps by the same student collapse to the latest one, and since
+    timestamps only move forward, resending the same group changes nothing.
+    Returns the ids of the students recorded.
+    """
+    latest = {}
+    for student, rfid_tag, timestamp in checkins:
+        student_id = str(student["_id"])
+        if student_id not in latest or timestamp > latest[student_id][2]:
+            latest[student_id] = (student, rfid_tag, timestamp)
+
+    day = start_of_day(day)
+    query = {"date": day, "batch": batch}
+    rfid_operations = []
+    student_entries = []
+    for student_id, (student, rfid_tag, timestamp) in latest.items():
+        name = student.get("name", "")
+        roll_no = student.get("rollNo", "")
+        student_record = build_rfid_student_record(student_id, rfid_tag, name, roll_no, timestamp)
+        rfid_operations.append(
+            UpdateOne(query, rfid_day_update(student_record, current_time), upsert=True)
+        )
+        student_entries.append(build_daily_student_entry(student_id, name, roll_no, timestamp))
+
+    if not rfid_operations:
+        return []
+
+    _bulk_upsert(db.rfid_attendance, rfid_operations)
+    _bulk_upsert(db.attendance, [
+        UpdateOne(
+            {"date": day, "type": "daily", "batch": batch},
+            daily_attendance_update(student_entries, current_time),
+            upsert=True
+        )
+    ])
+    new_checkins = record_daily_checkins(
+        db, batch, day,
+        [(student, timestamp) for student, _, timestamp in latest.values()],
+        current_time
+    )
+    apply_rfid_checkins(db, batch, day, new_checkins, current_time)
+
+    return list(latest.keys())
@@ -0,0 +1,148 @@
+"""Paged and streamed reads of ``rfid_attendance``.
+
+Records are read newest first in (date, _id) order and paged with a
+keyset cursor instead of ``skip``, so every page costs the same however
+deep into the history it is. Two views are offered:
+
+* ``daily``: one document per (day, batch), as stored.
+* ``flat``: one row per student tap, produced server-side with
+  ``$unwind``; its cursor also records the position inside the day's
+  ``students`` array, so a page may end part-way through a day.
+
+``iter_rows`` yields rows straight from the cursor, so both
+the paged JSON response and the NDJSON stream hold at most one batch of
+documents in memory.
+"""
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+
+from attendance_dates import DATE_FORMAT
+from json_encoding import dumps
+
+VIEWS = ("daily", "flat")
+
+RECORD_SORT = [("date", -1), ("_id", -1)]
+
+# Documents fetched per round trip while streaming
+CURSOR_BATCH_SIZE = 200
+
+
+def encode_cursor(date, record_id, position=None):
+    """Opaque page token for the row after (date, _id[, position])"""
+    parts = [date.isoformat(), str(record_id)]
+    if position is not None:
+        parts.append(str(position))
+    return base64.urlsafe_b64encode("|".join(parts).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):
+    """``(date, ObjectId, position or None)``; raises ValueError if malformed"""
+    try:
+        parts = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8").split("|")
+        date = datetime.fromisoformat(parts[0])
+        record_id = ObjectId(parts[1])
+        position = int(parts[2]) if len(parts) > 2 else None
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return date, record_id, position
+
+
+def _keyset(after, inclusive=False):
+    """Filter for records at or after the cursor in (date desc, _id desc) order"""
+    date, record_id, _ = after
+    return {"$or": [
+        {"date": {"$lt": date}},
+        {"date": date, "_id": {"$lte" if inclusive else "$lt": record_id}}
+    ]}
+
+
+def daily_pipeline(query, after=None, limit=None):
+    match = dict(query)
+    if after:
+        match = {"$and": [match, _keyset(after)]}
+    pipeline = [{"$match": match}, {"$sort": dict(RECORD_SORT)}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+def flat_pipeline(query, after=None, limit=None):
+    """One row per student tap, ``$unwind`` on the server"""
+    match = dict(query)
+    if after:
+        # The cursor's own day may still have students left to send
+        match = {"$and": [match, _keyset(after, inclusive=after[2] is not None)]}
+    pipeline = [
+        {"$match": match},
+        {"$sort": dict(RECORD_SORT)},
+        {"$unwind": {"path": "$students", "includeArrayIndex": "position"}},
+    ]
+    if after and after[2] is not None:
+        _, record_id, position = after
+        pipeline.append({"$match": {"$or": [
+            {"_id": {"$ne": record_id}},
+            {"position": {"$gt": position}}
+        ]}})
+    pipeline.append({"$project": {"date": 1, "batch": 1, "position": 1, "students": 1}})
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+def _day(value):
+    return value.strftime(DATE_FORMAT) if isinstance(value, datetime) else value
+
+
+# ObjectId and timestamps are left to json_encoding; only the day is
+# reshaped, to the YYYY-MM-DD string clients already expect
+def serialize_daily(record):
+    record["date"] = _day(record.get("date"))
+    return record
+
+
+def serialize_flat(row):
+    student = row["students"]
+    student["date"] = _day(row.get("date"))
+    student["batch"] = row.get("batch")
+    return student
+
+
+def iter_rows(collection, query, view="daily", after=None, limit=None):
+    """Yield ``(row, cursor token)`` pairs, encoding rows as they are read"""
+    if view == "flat":
+        pipeline, serialize = flat_pipeline(query, after, limit), serialize_flat
+    else:
+        pipeline, serialize = daily_pipeline(query, after, limit), serialize_daily
+
+    for doc in collection.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE):
+        token = encode_cursor(doc["date"], doc["_id"], doc.get("position"))
+        yield serialize(doc), token
+
+
+def read_page(collection, query, view="daily", after=None, limit=100):
+    """``(rows, next cursor or None)`` for one page of at most ``limit`` rows"""
+    rows = []
+    last_token = None
+    # One extra row tells whether another page exists
+    for row, token in iter_rows(collection, query, view, after, limit + 1):
+        if len(rows) == limit:
+            return rows, last_token
+        rows.append(row)
+        last_token = token
+    return rows, None
+
+
+def ndjson_lines(collection, query, view="daily", after=None, limit=None):
+    """NDJSON body; when ``limit`` cuts the stream short, the last line is
+    ``{"nextCursor": ...}``"""
+    sent = 0
+    last_token = None
+    for row, token in iter_rows(collection, query, view, after, limit + 1 if limit else None):
+        if limit and sent == limit:
+            yield dumps({"nextCursor": last_token}) + "\n"
+            return
+        yield dumps(row) + "\n"
+        sent += 1
+        last_token = token
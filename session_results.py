@@ -0,0 +1,377 @@
+"""Saving attendance session results as one unit of work.
+
+Saving a session touches ``attendanceSessions``, the course record in
+``attendance`` (one upsert, backed by the unique (date, batchId,
+courseId) index), the per-student ledger and the report rollups.
+
+Every save is first recorded in ``sessionResultWrites``, keyed by the
+client's idempotency key (or a fresh id), together with its payload:
+
+* With transactions (replica set or sharded cluster), that entry and all
+  the writes commit or abort together.
+* Without them (standalone server) the entry acts as an outbox: it stays
+  ``pending`` until every write has been applied. The request applying it
+  holds a lease (``leaseUntil``); a save that fails releases it as
+  ``failed``, and one whose worker crashed is freed when the lease runs
+  out. Saves of the same course record (date, batchId, courseId) are
+  serialised by a second lease in ``sessionResultLocks``: the rollups
+  apply the change against the ledger rows a save reads first, so two
+  saves applied at once would both count the students as new and
+  overcount the rollups. Every step is an upsert or ``$set``, so applying
+  a save twice leaves the same data; a crash between the ledger and the
+  rollups at worst undercounts the rollups until the next
+  ``attendance_rollups.py --rebuild``.
+
+A retried request with the same idempotency key gets the stored response
+back without any write, a 409 while the first request still holds its
+lease, and takes the save over once that lease is released or expired.
+``replay_loop`` (a thread in every worker) re-applies entries nobody
+retried; each entry is claimed atomically first, so only one worker
+replays it, and a payload older than the stored course record (the
+session was saved again since) is dropped rather than written over it.
+
+    python session_results.py --replay    # re-apply unleased pending saves
+"""
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from attendance_dates import parse_day
+from attendance_rollups import apply_session_changes
+from student_ledger import record_session_results
+
+WRITES_COLLECTION = "sessionResultWrites"
+LOCKS_COLLECTION = "sessionResultLocks"
+
+# Applied entries (and their stored responses) are kept this long
+IDEMPOTENCY_TTL = timedelta(days=1)
+
+# Same retry budget as the RFID upserts (see rfid_checkin)
+UPSERT_RETRIES = 2
+
+# How long a request or replay may hold a pending save before others take over
+LEASE_TIMEOUT = timedelta(minutes=2)
+
+# Replays of a save that keeps failing before it is left to its client
+MAX_REPLAY_ATTEMPTS = 5
+
+# How long a save waits for another save of the same course record
+RECORD_LOCK_WAIT_SECONDS = 2.0
+
+# Unleased statuses a save can be claimed from
+_CLAIMABLE = ["pending", "failed", "replaying"]
+
+# Finished saves; retries get the stored response
+_DONE = ("applied", "superseded")
+
+# IllegalOperation: the deployment cannot run transactions
+_NO_TRANSACTIONS = {20}
+
+_transactions_supported = None
+
+
+class WriteInProgress(Exception):
+    """A save with the same idempotency key has not finished yet"""
+
+
+class RecordBusy(WriteInProgress):
+    """Another save of the same course record is being applied"""
+
+
+def build_payload(session_id, data, current_time):
+    """Session update and attendance record for a results submission"""
+    present_students = data.get("presentStudents", [])
+    absent_students = data.get("absentStudents", [])
+    verification_data = data.get("verificationData", {})
+    results = {
+        "presentStudents": present_students,
+        "absentStudents": absent_students,
+        "totalPresent": len(present_students),
+        "totalAbsent": len(absent_students),
+        "verificationData": verification_data  # Save verification data
+    }
+    return {
+        "sessionId": session_id,
+        "session": dict(results, status="completed", completedAt=current_time),
+        "record": dict(
+            results,
+            date=parse_day(data.get("date")),
+            batchId=data.get("batchId"),
+            courseId=data.get("courseId"),
+            courseName=data.get("courseName"),
+            facultyId=data.get("facultyId"),
+            facultyName=data.get("facultyName"),
+            updatedAt=current_time
+        )
+    }
+
+
+def _upsert_record(db, record, session=None):
+    query = {"date": record["date"], "batchId": record["batchId"], "courseId": record["courseId"]}
+    update = {"$set": record, "$setOnInsert": {"createdAt": record["updatedAt"]}}
+    for attempt in range(UPSERT_RETRIES + 1):
+        try:
+            return db.attendance.update_one(query, update, upsert=True, session=session)
+        except DuplicateKeyError:
+            # Lost an insert race; the retry updates the winner's document
+            if attempt == UPSERT_RETRIES or session is not None:
+                raise
+
+
+def _apply(db, write_id, payload, response, session=None):
+    record = payload["record"]
+    db.attendanceSessions.update_one(
+        {"_id": ObjectId(payload["sessionId"])},
+        {"$set": payload["session"]},
+        session=session
+    )
+    _upsert_record(db, record, session)
+    changes = record_session_results(db, record, record["updatedAt"], session)
+    apply_session_changes(db, record, changes, record["updatedAt"], session)
+    db[WRITES_COLLECTION].update_one(
+        {"_id": write_id},
+        {"$set": {
+            "status": "applied",
+            "response": response,
+            "appliedAt": datetime.now(),
+            "expireAt": datetime.now() + IDEMPOTENCY_TTL
+        }},
+        session=session
+    )
+
+
+def _insert(db, write_id, payload, session=None):
+    now = datetime.now()
+    db[WRITES_COLLECTION].insert_one({
+        "_id": write_id,
+        "status": "pending",
+        "payload": payload,
+        "attempts": 1,
+        "createdAt": now,
+        "leaseUntil": now + LEASE_TIMEOUT
+    }, session=session)
+
+
+def _run(db, write_id, payload, response, session=None):
+    _insert(db, write_id, payload, session)
+    _apply(db, write_id, payload, response, session)
+
+
+def _release(db, write_id, error):
+    """Mark a save that failed part way so a retry or replay can take it over"""
+    now = datetime.now()
+    try:
+        db[WRITES_COLLECTION].update_one(
+            {"_id": write_id, "status": {"$ne": "applied"}},
+            {"$set": {"status": "failed", "error": str(error), "leaseUntil": now, "expireAt": now + IDEMPOTENCY_TTL}}
+        )
+    except Exception as e:
+        # The lease still runs out on its own
+        print(f"⚠️ Could not release session results {write_id}: {e}")
+
+
+def _record_key(record):
+    return f"{record['date']}:{record['batchId']}:{record['courseId']}"
+
+
+def _lock_record(db, key, write_id, wait=RECORD_LOCK_WAIT_SECONDS):
+    """Take the lease on a course record; False if it stays held for ``wait`` seconds"""
+    deadline = time.monotonic() + wait
+    while True:
+        now = datetime.now()
+        try:
+            # Matches only a free (expired) lock; a held one makes the upsert collide
+            db[LOCKS_COLLECTION].update_one(
+                {"_id": key, "leaseUntil": {"$lt": now}},
+                {"$set": {"owner": write_id, "leaseUntil": now + LEASE_TIMEOUT}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def _unlock_record(db, key, write_id):
+    try:
+        db[LOCKS_COLLECTION].delete_one({"_id": key, "owner": write_id})
+    except Exception as e:
+        # The lease still runs out on its own
+        print(f"⚠️ Could not unlock session results record {key}: {e}")
+
+
+def _apply_or_release(db, write_id, payload, response, skip_superseded=False):
+    """Apply a save under its course record's lock (outbox mode).
+
+    On failure the save is released for a retry or replay. Returns False,
+    without writing, when ``skip_superseded`` and the record was saved
+    again after this payload.
+    """
+    key = _record_key(payload["record"])
+    try:
+        if not _lock_record(db, key, write_id):
+            raise RecordBusy("Another save of this session's attendance is in progress")
+        try:
+            if skip_superseded and _superseded(db, payload["record"]):
+                return False
+            _apply(db, write_id, payload, response)
+            return True
+        finally:
+            _unlock_record(db, key, write_id)
+    except Exception as e:
+        _release(db, write_id, e)
+        raise
+
+
+def _claim(db, query, status, payload=None):
+    """Take the lease on an unleased, unapplied save; None if there is none"""
+    now = datetime.now()
+    update = {"$set": {"status": status, "leaseUntil": now + LEASE_TIMEOUT}, "$inc": {"attempts": 1}}
+    if payload is not None:
+        update["$set"]["payload"] = payload
+    return db[WRITES_COLLECTION].find_one_and_update(
+        dict(query, status={"$in": _CLAIMABLE}, leaseUntil={"$lt": now}),
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _superseded(db, record):
+    """Whether the course record was saved again after ``record``"""
+    stored = db.attendance.find_one(
+        {"date": record["date"], "batchId": record["batchId"], "courseId": record["courseId"]},
+        {"updatedAt": 1}
+    )
+    return bool(stored and stored.get("updatedAt") and stored["updatedAt"] > record["updatedAt"])
+
+
+def _is_key_conflict(error):
+    """Whether a DuplicateKeyError is on the idempotency key itself"""
+    return "_id" in ((error.details or {}).get("keyPattern") or {})
+
+
+def _transactional(db, write_id, payload, response):
+    """Run the save in a transaction; False if the server has none"""
+    global _transactions_supported
+    if _transactions_supported is False:
+        return False
+    for attempt in range(UPSERT_RETRIES + 1):
+        try:
+            with db.client.start_session() as session:
+                session.with_transaction(lambda s: _run(db, write_id, payload, response, s))
+            break
+        except DuplicateKeyError as e:
+            # A concurrent first save of the same course record committed
+            # first; running again turns the insert into an update
+            if _is_key_conflict(e) or attempt == UPSERT_RETRIES:
+                raise
+        except OperationFailure as e:
+            if e.code not in _NO_TRANSACTIONS:
+                raise
+            _transactions_supported = False
+            return False
+    _transactions_supported = True
+    return True
+
+
+def _stored_response(db, write_id, existing=None):
+    if existing is None:
+        existing = db[WRITES_COLLECTION].find_one({"_id": write_id}, {"status": 1, "response": 1})
+    if existing and existing.get("status") in _DONE:
+        return existing["response"]
+    raise WriteInProgress("A request with this idempotency key is still being processed")
+
+
+def save_session_results(db, session_id, data, idempotency_key=None):
+    """Save a session's results once; returns ``(response, replayed)``.
+
+    ``replayed`` is True when the response was stored by an earlier
+    request with the same ``idempotency_key``. Raises WriteInProgress
+    while that earlier request is still running and InvalidId on a bad
+    session id.
+    """
+    write_id = f"{session_id}:{idempotency_key}" if idempotency_key else uuid.uuid4().hex
+    existing = None
+    if idempotency_key:
+        existing = db[WRITES_COLLECTION].find_one({"_id": write_id}, {"status": 1, "response": 1})
+        if existing and existing.get("status") in _DONE:
+            return existing["response"], True
+
+    ObjectId(session_id)  # raises InvalidId before anything is written
+    payload = build_payload(session_id, data, datetime.now())
+    response = {"message": "Attendance updated successfully", "sessionId": session_id}
+
+    if existing:
+        # An earlier attempt failed or its worker died: take the save over
+        if _claim(db, {"_id": write_id}, "pending", payload) is None:
+            return _stored_response(db, write_id), True
+        _apply_or_release(db, write_id, payload, response)
+        return response, False
+
+    try:
+        if not _transactional(db, write_id, payload, response):
+            _insert(db, write_id, payload)
+            _apply_or_release(db, write_id, payload, response)
+    except DuplicateKeyError as e:
+        # A concurrent request with the same key got there first
+        if not idempotency_key or not _is_key_conflict(e):
+            raise
+        return _stored_response(db, write_id), True
+    return response, False
+
+
+def replay_pending(db, max_attempts=MAX_REPLAY_ATTEMPTS):
+    """Re-apply unleased saves left behind in outbox mode.
+
+    Each entry is claimed (``replaying``) before it is applied, so
+    workers replaying at the same time never apply one twice. Returns the
+    number of entries applied.
+    """
+    applied = 0
+    while True:
+        entry = _claim(db, {"attempts": {"$lt": max_attempts}}, "replaying")
+        if entry is None:
+            return applied
+        payload = entry["payload"]
+        response = {"message": "Attendance updated successfully", "sessionId": payload["sessionId"]}
+        try:
+            if _apply_or_release(db, entry["_id"], payload, response, skip_superseded=True):
+                applied += 1
+            else:
+                db[WRITES_COLLECTION].update_one({"_id": entry["_id"]}, {"$set": {
+                    "status": "superseded",
+                    "response": response,
+                    "expireAt": datetime.now() + IDEMPOTENCY_TTL
+                }})
+        except Exception as e:
+            print(f"⚠️ Could not replay session results {entry['_id']}: {e}")
+
+
+def replay_loop(db, interval=60, stop=None):
+    """Run ``replay_pending`` now and then every ``interval`` seconds"""
+    stop = stop or threading.Event()
+    while True:
+        try:
+            replay_pending(db)
+        except Exception as e:
+            print(f"⚠️ Session results replay failed: {e}")
+        if stop.wait(interval):
+            return
+
+
+if __name__ == "__main__":
+    from database import connect_to_db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replay", action="store_true", help="re-apply saves left pending by a crash")
+    args = parser.parse_args()
+
+    if args.replay:
+        print(f"✅ Replayed {replay_pending(connect_to_db())} pending saves")
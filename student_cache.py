@@ -0,0 +1,294 @@
+"""In-process RFID tag -> student lookup table.
+
+The tag-to-student mapping barely changes during a term, so it is loaded
+once at startup and then kept fresh incrementally, either from a MongoDB
+change stream (replica sets) or by polling ``students.updatedAt`` when
+change streams are unavailable, e.g. against a local standalone server.
+Unknown tags are remembered in a small bounded negative cache so a reader
+repeatedly presenting an unregistered card does not hit the database on
+every tap.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Only the fields the check-in path needs are kept, as a tuple per tag
+CachedStudent = namedtuple("CachedStudent", ["id", "name", "rollNo", "batch"])
+
+STUDENT_PROJECTION = {"rfidTag": 1, "name": 1, "rollNo": 1, "batch": 1, "updatedAt": 1}
+
+
+class StudentTagCache:
+    """Preloaded tag -> student table with incremental refresh"""
+
+    def __init__(self, db, negative_size=1024, negative_ttl=300, poll_interval=30,
+                 full_reload_interval=3600, refresh_mode="auto"):
+        self.db = db
+        self.negative_size = negative_size
+        self.negative_ttl = negative_ttl
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.refresh_mode = refresh_mode
+
+        self._by_tag = {}
+        self._tag_by_id = {}  # needed to drop a tag when its student is deleted or re-tagged
+        self._negative = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_updated_at = None
+        self._last_full_load = 0.0
+        self._refresher = None
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.db_lookups = 0
+        self.refreshes = 0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def load(self):
+        """(Re)build the whole table from the students collection"""
+        by_tag = {}
+        tag_by_id = {}
+        last_updated_at = None
+
+        cursor = self.db.students.find({"rfidTag": {"$exists": True, "$ne": None}}, STUDENT_PROJECTION)
+        for doc in cursor:
+            entry = self._entry_from_doc(doc)
+            by_tag[doc["rfidTag"]] = entry
+            tag_by_id[entry.id] = doc["rfidTag"]
+            updated_at = doc.get("updatedAt")
+            if updated_at and (last_updated_at is None or updated_at > last_updated_at):
+                last_updated_at = updated_at
+
+        with self._lock:
+            self._by_tag = by_tag
+            self._tag_by_id = tag_by_id
+            self._negative.clear()
+            self._last_updated_at = last_updated_at
+            self._last_full_load = time.monotonic()
+
+        print(f"✅ Loaded {len(by_tag)} RFID tags into cache")
+        return len(by_tag)
+
+    @staticmethod
+    def _entry_from_doc(doc):
+        return CachedStudent(
+            str(doc["_id"]),
+            doc.get("name", ""),
+            doc.get("rollNo", ""),
+            doc.get("batch")
+        )
+
+    def _apply(self, doc):
+        """Insert or replace a single student, dropping any stale tag"""
+        entry = self._entry_from_doc(doc)
+        tag = doc.get("rfidTag")
+        with self._lock:
+            old_tag = self._tag_by_id.pop(entry.id, None)
+            if old_tag is not None:
+                self._by_tag.pop(old_tag, None)
+            if tag:
+                self._by_tag[tag] = entry
+                self._tag_by_id[entry.id] = tag
+                self._negative.pop(tag, None)
+
+    def _remove(self, student_id):
+        with self._lock:
+            tag = self._tag_by_id.pop(str(student_id), None)
+            if tag is not None:
+                self._by_tag.pop(tag, None)
+
+    def invalidate(self, rfid_tag=None, student_id=None):
+        """Explicitly drop a tag or student, e.g. after an admin edit"""
+        if student_id is not None:
+            self._remove(student_id)
+        if rfid_tag is not None:
+            with self._lock:
+                entry = self._by_tag.pop(rfid_tag, None)
+                if entry is not None:
+                    self._tag_by_id.pop(entry.id, None)
+                self._negative.pop(rfid_tag, None)
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def lookup(self, rfid_tag):
+        """Return the student for ``rfid_tag`` as a dict, or None"""
+        with self._lock:
+            entry = self._by_tag.get(rfid_tag)
+            if entry is not None:
+                self.hits += 1
+                return self._as_student(entry)
+
+            expires = self._negative.get(rfid_tag)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self._negative.move_to_end(rfid_tag)
+                    self.negative_hits += 1
+                    return None
+                del self._negative[rfid_tag]
+
+            self.misses += 1
+
+        # Tag registered after the last refresh, or genuinely unknown
+        self.db_lookups += 1
+        doc = self.db.students.find_one({"rfidTag": rfid_tag}, STUDENT_PROJECTION)
+        if doc:
+            self._apply(doc)
+            return self._as_student(self._entry_from_doc(doc))
+
+        with self._lock:
+            self._negative[rfid_tag] = time.monotonic() + self.negative_ttl
+            self._negative.move_to_end(rfid_tag)
+            while len(self._negative) > self.negative_size:
+                self._negative.popitem(last=False)
+        return None
+
+    @staticmethod
+    def _as_student(entry):
+        return {
+            "_id": entry.id,
+            "name": entry.name,
+            "rollNo": entry.rollNo,
+            "batch": entry.batch
+        }
+
+    def lookup_many(self, rfid_tags):
+        """Resolve several tags, fetching all cache misses with one ``$in`` query.
+
+        Returns a dict of tag -> student dict for every tag that resolved.
+        """
+        resolved = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for tag in set(rfid_tags):
+                entry = self._by_tag.get(tag)
+                if entry is not None:
+                    self.hits += 1
+                    resolved[tag] = self._as_student(entry)
+                    continue
+                expires = self._negative.get(tag)
+                if expires is not None and expires > now:
+                    self.negative_hits += 1
+                    continue
+                self.misses += 1
+                missing.append(tag)
+
+        if not missing:
+            return resolved
+
+        self.db_lookups += 1
+        for doc in self.db.students.find({"rfidTag": {"$in": missing}}, STUDENT_PROJECTION):
+            self._apply(doc)
+            resolved[doc["rfidTag"]] = self._as_student(self._entry_from_doc(doc))
+
+        with self._lock:
+            for tag in missing:
+                if tag not in resolved:
+                    self._negative[tag] = now + self.negative_ttl
+                    self._negative.move_to_end(tag)
+            while len(self._negative) > self.negative_size:
+                self._negative.popitem(last=False)
+        return resolved
+
+    # ------------------------------------------------------------------
+    # Incremental refresh
+    # ------------------------------------------------------------------
+    def poll_once(self):
+        """Apply students modified since the last seen ``updatedAt``"""
+        if time.monotonic() - self._last_full_load > self.full_reload_interval:
+            # Polling cannot see deletions; a periodic full reload catches them
+            return self.load()
+
+        query = {"rfidTag": {"$exists": True}}
+        if self._last_updated_at is not None:
+            query["updatedAt"] = {"$gt": self._last_updated_at}
+        else:
+            query["updatedAt"] = {"$exists": True}
+
+        applied = 0
+        for doc in self.db.students.find(query, STUDENT_PROJECTION).sort("updatedAt", 1):
+            self._apply(doc)
+            applied += 1
+            if doc.get("updatedAt"):
+                self._last_updated_at = doc["updatedAt"]
+        self.refreshes += 1
+        return applied
+
+    def _watch(self):
+        """Follow the students change stream until stopped"""
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        with self.db.students.watch(pipeline, full_document="updateLookup") as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    self._stop.wait(1)
+                    continue
+                self.refreshes += 1
+                if change["operationType"] == "delete" or not change.get("fullDocument"):
+                    self._remove(change["documentKey"]["_id"])
+                else:
+                    self._apply(change["fullDocument"])
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"⚠️ RFID cache poll failed: {e}")
+
+    def _run(self):
+        if self.refresh_mode in ("auto", "changestream"):
+            try:
+                self._watch()
+                return
+            except Exception as e:
+                if self.refresh_mode == "changestream":
+                    print(f"❌ RFID cache change stream failed: {e}")
+                    return
+                print(f"⚠️ Change streams unavailable ({e}), polling updatedAt instead")
+        self._poll_loop()
+
+    def start(self):
+        """Load the table and start the background refresher"""
+        self.load()
+        if self.refresh_mode == "off" or self._refresher is not None:
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._run, name="rfid-cache-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._refresher = None
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.negative_hits
+        return {
+            "size": len(self._by_tag),
+            "negativeSize": len(self._negative),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negativeHits": self.negative_hits,
+            "dbLookups": self.db_lookups,
+            "refreshes": self.refreshes,
+            "hitRatio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            "refreshMode": self.refresh_mode
+        }
+
+
+def cache_from_env(db):
+    """Build a cache configured from RFID_CACHE_* environment variables"""
+    return StudentTagCache(
+        db,
+        negative_size=int(os.getenv("RFID_CACHE_NEGATIVE_SIZE", "1024")),
+        negative_ttl=float(os.getenv("RFID_CACHE_NEGATIVE_TTL", "300")),
+        poll_interval=float(os.getenv("RFID_CACHE_POLL_SECONDS", "30")),
+        full_reload_interval=float(os.getenv("RFID_CACHE_FULL_RELOAD_SECONDS", "3600")),
+        refresh_mode=os.getenv("RFID_CACHE_REFRESH", "auto")
+    )
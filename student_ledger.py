@@ -0,0 +1,350 @@
+"""Per-student attendance ledger.
+
+``attendance`` stores one document per day (daily RFID records, keyed by
+student id) or per session (course records, with roll-number lists), so a
+single student's history can only be found by scanning them all. The
+``studentAttendance`` collection keeps one compact row per student per
+day and course instead, written alongside every attendance write:
+
+    {_id: "<studentId>:<YYYY-MM-DD>:<courseId or 'daily'>",
+     studentId, date, batch, courseId, kind: "daily" | "session",
+     present, proxy, checkInTime, rollNo, name, updatedAt}
+
+The ``_id`` is derived from the row's key, so every write is an
+idempotent upsert. History reads use the (studentId, date) index.
+
+Existing history is copied in by the backfill:
+
+    python student_ledger.py --backfill [--dry-run]
+"""
+import argparse
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from attendance_dates import DATE_FORMAT, start_of_day
+
+LEDGER_COLLECTION = "studentAttendance"
+
+DAILY = "daily"
+SESSION = "session"
+
+# Rows written per bulk_write during the backfill
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def ledger_id(student_id, day, course_id=None):
+    return f"{student_id}:{day.strftime(DATE_FORMAT)}:{course_id or DAILY}"
+
+
+def daily_row_update(student_id, name, roll_no, batch, day, timestamp, current_time):
+    """Upsert for a student's RFID check-in on ``day``"""
+    day = start_of_day(day)
+    return UpdateOne(
+        {"_id": ledger_id(student_id, day)},
+        {
+            "$set": {
+                "studentId": student_id,
+                "date": day,
+                "batch": batch,
+                "courseId": None,
+                "kind": DAILY,
+                "present": True,
+                "rollNo": roll_no,
+                "name": name,
+                "updatedAt": current_time
+            },
+            # Check-in times only move forward, as on the attendance documents
+            "$max": {"checkInTime": timestamp},
+            "$setOnInsert": {"createdAt": current_time}
+        },
+        upsert=True
+    )
+
+
+def possible_proxy(entry):
+    """Whether verification flagged a student entry as a possible proxy"""
+    return bool((entry.get("verificationData") or {}).get("possibleProxy"))
+
+
+def session_row_update(student_id, entry, present, record, current_time):
+    """Upsert for a student's result in a course session ``record``"""
+    day = start_of_day(record["date"])
+    return UpdateOne(
+        {"_id": ledger_id(student_id, day, record.get("courseId"))},
+        {
+            "$set": {
+                "studentId": student_id,
+                "date": day,
+                "batch": record.get("batchId"),
+                "courseId": record.get("courseId"),
+                "courseName": record.get("courseName"),
+                "kind": SESSION,
+                "present": present,
+                "proxy": possible_proxy(entry),
+                "rollNo": entry.get("rollNo"),
+                "name": entry.get("name"),
+                "updatedAt": current_time
+            },
+            "$setOnInsert": {"createdAt": current_time}
+        },
+        upsert=True
+    )
+
+
+def record_daily_checkins(db, batch, day, checkins, current_time):
+    """Ledger rows for RFID taps; ``checkins`` is ``(student, timestamp)`` pairs.
+
+    Returns how many students checked in for the first time that day.
+    """
+    operations = [
+        daily_row_update(
+            str(student["_id"]), student.get("name", ""), student.get("rollNo", ""),
+            batch, day, timestamp, current_time
+        )
+        for student, timestamp in checkins
+    ]
+    if not operations:
+        return 0
+    return db[LEDGER_COLLECTION].bulk_write(operations, ordered=False).upserted_count
+
+
+def roll_number_index(db, batch, session=None):
+    """rollNo -> student id string for one batch"""
+    return {
+        doc["rollNo"]: str(doc["_id"])
+        for doc in db.students.find({"batch": batch}, {"rollNo": 1}, session=session)
+        if doc.get("rollNo")
+    }
+
+
+def session_results(record, roll_numbers):
+    """Yield ``(student_id, entry, present)`` for a course attendance record.
+
+    Students are listed by roll number; entries that do not match a
+    student of the batch are skipped.
+    """
+    for field, present in (("presentStudents", True), ("absentStudents", False)):
+        for entry in record.get(field) or []:
+            student_id = roll_numbers.get(entry.get("rollNo"))
+            if student_id:
+                yield student_id, entry, present
+
+
+def record_session_results(db, record, current_time, session=None):
+    """Ledger rows for a saved course attendance ``record``.
+
+    Returns ``(student_id, previous, current)`` per student, where each
+    state holds ``present`` and ``proxy`` (``current`` also the roll
+    number and name) and ``previous`` is None for a student new to the
+    session, so rollups can apply just the change. Pass ``session`` to
+    run inside a transaction.
+    """
+    if record.get("date") is None:
+        return []
+    day = start_of_day(record["date"])
+    results = list(session_results(record, roll_number_index(db, record.get("batchId"), session)))
+    if not results:
+        return []
+
+    collection = db[LEDGER_COLLECTION]
+    row_ids = [ledger_id(student_id, day, record.get("courseId")) for student_id, _, _ in results]
+    previous = {
+        doc["_id"]: {"present": doc.get("present", False), "proxy": doc.get("proxy", False)}
+        for doc in collection.find({"_id": {"$in": row_ids}}, {"present": 1, "proxy": 1}, session=session)
+    }
+    collection.bulk_write([
+        session_row_update(student_id, entry, present, record, current_time)
+        for student_id, entry, present in results
+    ], ordered=False, session=session)
+
+    return [
+        (student_id, previous.get(row_id), {
+            "present": present,
+            "proxy": possible_proxy(entry),
+            "rollNo": entry.get("rollNo"),
+            "name": entry.get("name")
+        })
+        for row_id, (student_id, entry, present) in zip(row_ids, results)
+    ]
+
+
+# ----------------------------------------------------------------------
+# History reads
+# ----------------------------------------------------------------------
+def history_query(student_id, course_id=None, start=None, end=None):
+    query = {"studentId": student_id}
+    if course_id:
+        query["courseId"] = course_id
+    else:
+        query["kind"] = DAILY
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    return query
+
+
+def history_page(db, query, before=None, limit=100):
+    """``(rows, next cursor or None)``, newest first.
+
+    Rows are unique per date within a query (one per day, or one per day
+    for a course), so the date of the last row is the cursor.
+    """
+    if before is not None:
+        query = dict(query, date=dict(query.get("date", {}), **{"$lt": before}))
+    projection = {
+        "_id": 0, "date": 1, "batch": 1, "present": 1, "checkInTime": 1,
+        "kind": 1, "courseId": 1, "courseName": 1
+    }
+    rows = list(db[LEDGER_COLLECTION].find(query, projection).sort("date", -1).limit(limit + 1))
+    next_cursor = rows[limit - 1]["date"].strftime(DATE_FORMAT) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _streaks(days, present_days):
+    """``(current, longest)`` runs of present days; ``days`` newest first"""
+    current = longest = run = 0
+    counting_current = True
+    for day in days:
+        if day in present_days:
+            run += 1
+            longest = max(longest, run)
+        else:
+            if counting_current:
+                current, counting_current = run, False
+            run = 0
+    if counting_current:
+        current = run
+    return current, longest
+
+
+def student_batch(db, student_id):
+    """Batch of a student, from their profile or their latest ledger row"""
+    try:
+        student = db.students.find_one({"_id": ObjectId(student_id)}, {"batch": 1})
+    except InvalidId:
+        student = None
+    if student:
+        return student.get("batch")
+    latest = db[LEDGER_COLLECTION].find_one({"studentId": student_id}, {"batch": 1}, sort=[("date", -1)])
+    return latest.get("batch") if latest else None
+
+
+def history_summary(db, student_id, course_id=None, start=None, end=None):
+    """Attendance percentage and streaks over the requested range.
+
+    For a course, the days counted are the sessions the student appears
+    in. For daily RFID attendance the ledger only holds days the student
+    tapped in, so the days counted are the days their batch has an RFID
+    record (read from the (batch, date) index).
+    """
+    query = history_query(student_id, course_id, start, end)
+    rows = db[LEDGER_COLLECTION].find(query, {"_id": 0, "date": 1, "present": 1}).sort("date", -1)
+    present_days = set()
+    days = []
+    for row in rows:
+        if course_id:
+            days.append(row["date"])
+        if row.get("present"):
+            present_days.add(row["date"])
+
+    if not course_id:
+        batch = student_batch(db, student_id)
+        if batch is not None:
+            batch_query = {"batch": batch}
+            if "date" in query:
+                batch_query["date"] = query["date"]
+            days = [doc["date"] for doc in db.rfid_attendance.find(batch_query, {"_id": 0, "date": 1}).sort("date", -1)]
+        # Taps recorded against another batch still count as attended days
+        days = sorted(set(days) | present_days, reverse=True)
+
+    current_streak, longest_streak = _streaks(days, present_days)
+    return {
+        "totalDays": len(days),
+        "presentDays": len(present_days),
+        "absentDays": len(days) - len(present_days),
+        "percentage": round(100.0 * len(present_days) / len(days), 1) if days else None,
+        "currentStreak": current_streak,
+        "longestStreak": longest_streak
+    }
+
+
+# ----------------------------------------------------------------------
+# Backfill from history
+# ----------------------------------------------------------------------
+def _flush(collection, operations, dry_run):
+    if operations and not dry_run:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def backfill(db, dry_run=False, progress=None):
+    """Populate the ledger from every existing attendance record.
+
+    Safe to re-run: rows are upserted by their key. Returns the number of
+    rows written. ``progress(done)`` is called after each chunk.
+    """
+    collection = db[LEDGER_COLLECTION]
+    current_time = datetime.now()
+    operations = []
+    written = 0
+
+    def add(operation):
+        nonlocal operations, written
+        operations.append(operation)
+        if len(operations) >= BACKFILL_CHUNK_SIZE:
+            written += _flush(collection, operations, dry_run)
+            operations = []
+            if progress:
+                progress(written)
+
+    # Daily RFID records: students.<id> maps
+    for record in db.attendance.find({"type": "daily", "date": {"$type": "date"}}, {"date": 1, "batch": 1, "students": 1}):
+        for student_id, entry in (record.get("students") or {}).items():
+            timestamp = (entry.get("rfidCheckIn") or {}).get("timestamp")
+            add(daily_row_update(
+                student_id, entry.get("name", ""), entry.get("rollNo", ""),
+                record.get("batch"), record["date"], timestamp, current_time
+            ))
+
+    # Course records: roll-number lists, resolved once per batch
+    roll_numbers = {}
+    session_fields = {
+        "date": 1, "batchId": 1, "courseId": 1, "courseName": 1,
+        "presentStudents.rollNo": 1, "presentStudents.name": 1,
+        "presentStudents.verificationData.possibleProxy": 1,
+        "absentStudents.rollNo": 1, "absentStudents.name": 1,
+        "absentStudents.verificationData.possibleProxy": 1
+    }
+    for record in db.attendance.find({"batchId": {"$exists": True}, "date": {"$type": "date"}}, session_fields):
+        batch = record.get("batchId")
+        if batch not in roll_numbers:
+            roll_numbers[batch] = roll_number_index(db, batch)
+        for student_id, entry, present in session_results(record, roll_numbers[batch]):
+            add(session_row_update(student_id, entry, present, record, current_time))
+
+    written += _flush(collection, operations, dry_run)
+    if progress:
+        progress(written)
+    return written
+
+
+if __name__ == "__main__":
+    from database import connect_to_db
+    from db_indexes import ensure_indexes
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backfill", action="store_true", help="copy existing attendance history into the ledger")
+    parser.add_argument("--dry-run", action="store_true", help="count rows without writing")
+    args = parser.parse_args()
+
+    db = connect_to_db()
+    ensure_indexes(db)
+    if args.backfill:
+        rows = backfill(db, dry_run=args.dry_run, progress=lambda done: print(f"... {done} rows"))
+        print(f"✅ {'Would write' if args.dry_run else 'Wrote'} {rows} ledger rows")
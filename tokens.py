@@ -0,0 +1,165 @@
+"""Stateless signed session tokens.
+
+Tokens are standard HS256 JWTs (``header.payload.signature``) signed with
+the stdlib ``hmac`` module. They carry everything a route needs to
+authorise a request (username, role, assigned batches, expiry), so
+validating one is a signature check and a set lookup, with no read of
+``db.users``.
+
+Key rotation: ``TOKEN_SIGNING_KEYS="kid2:secret2,kid1:secret1"`` lists
+every accepted key, newest first; new tokens are signed with the first
+one and carry its ``kid``. When unset, ``SECRET_KEY`` is the only key.
+
+Revocation: revoked token ids (``jti``) are stored in ``revokedTokens``
+until their expiry; every worker keeps a local copy refreshed every few
+seconds, so a logout takes effect across all workers.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+
+class InvalidToken(Exception):
+    """Malformed, badly signed, expired or revoked token"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _json(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+class TokenSigner:
+    """Issues and verifies HS256 tokens with a set of rotating keys"""
+
+    def __init__(self, keys, ttl_seconds=7 * 24 * 3600, issuer="aura"):
+        if not keys:
+            raise ValueError("At least one signing key is required")
+        # kid -> secret, newest (active) first
+        self.keys = {kid: secret.encode("utf-8") for kid, secret in keys}
+        self.active_kid = keys[0][0]
+        self.ttl_seconds = ttl_seconds
+        self.issuer = issuer
+
+    def _sign(self, kid, signing_input):
+        return hmac.new(self.keys[kid], signing_input, hashlib.sha256).digest()
+
+    def issue(self, user):
+        """Signed token for ``user``; returns ``(token, claims)``"""
+        now = int(time.time())
+        claims = {
+            "sub": user["username"],
+            "name": user.get("name", user["username"]),
+            "role": user.get("role", "user"),
+            "batches": list(user.get("assignedBatches") or []),
+            "iss": self.issuer,
+            "iat": now,
+            "exp": now + self.ttl_seconds,
+            "jti": secrets.token_hex(8)
+        }
+        header = {"alg": "HS256", "typ": "JWT", "kid": self.active_kid}
+        signing_input = f"{_b64encode(_json(header))}.{_b64encode(_json(claims))}".encode("ascii")
+        signature = self._sign(self.active_kid, signing_input)
+        return f"{signing_input.decode('ascii')}.{_b64encode(signature)}", claims
+
+    def decode(self, token):
+        """Verify ``token`` and return its claims; raises InvalidToken"""
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            claims = json.loads(_b64decode(payload_b64))
+            signature = _b64decode(signature_b64)
+            signing_input = f"{header_b64}.{payload_b64}".encode("ascii")
+        except (ValueError, AttributeError, TypeError, UnicodeError):
+            raise InvalidToken("Malformed token")
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise InvalidToken("Malformed token")
+
+        kid = header.get("kid")
+        if header.get("alg") != "HS256" or not isinstance(kid, str) or kid not in self.keys:
+            raise InvalidToken("Unknown signing key")
+
+        if not hmac.compare_digest(self._sign(kid, signing_input), signature):
+            raise InvalidToken("Bad signature")
+
+        exp = claims.get("exp", 0)
+        if not isinstance(exp, (int, float)) or exp <= time.time():
+            raise InvalidToken("Token expired")
+        if claims.get("iss") != self.issuer:
+            raise InvalidToken("Wrong issuer")
+        return claims
+
+
+class RevocationList:
+    """Revoked token ids shared across workers through MongoDB"""
+
+    def __init__(self, db, refresh_interval=10, collection_name="revokedTokens"):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.collection_name = collection_name
+        self._revoked = set()
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def revoke(self, claims):
+        """Revoke a token until its own expiry (the TTL index then drops it)"""
+        self.collection.update_one(
+            {"_id": claims["jti"]},
+            {"$set": {
+                "sub": claims.get("sub"),
+                "expiresAt": datetime.fromtimestamp(claims["exp"]),
+                "revokedAt": datetime.now()
+            }},
+            upsert=True
+        )
+        with self._lock:
+            self._revoked.add(claims["jti"])
+
+    def _refresh(self):
+        revoked = {doc["_id"] for doc in self.collection.find({"expiresAt": {"$gt": datetime.now()}}, {"_id": 1})}
+        with self._lock:
+            self._revoked = revoked
+            self._last_refresh = time.monotonic()
+
+    def is_revoked(self, jti):
+        if time.monotonic() - self._last_refresh > self.refresh_interval:
+            try:
+                self._refresh()
+            except Exception as e:
+                # Keep serving from the last known list if the database blips
+                print(f"⚠️ Could not refresh token revocation list: {e}")
+        return jti in self._revoked
+
+
+def signing_keys_from_env(default_secret):
+    """``[(kid, secret), ...]`` from TOKEN_SIGNING_KEYS, newest first"""
+    keys = []
+    for item in os.getenv("TOKEN_SIGNING_KEYS", "").split(","):
+        if ":" in item:
+            kid, secret = item.split(":", 1)
+            keys.append((kid.strip(), secret.strip()))
+    return keys or [("default", default_secret)]
+
+
+def bearer_token(headers):
+    """Token from an ``Authorization: Bearer <token>`` header, or None"""
+    auth_header = headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header[len("Bearer "):].strip() or None
+    return None